@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark of the EM22xx client against the local simulator
+
+Reports requests per snapshot, latency percentiles per getter,
+snapshots per second for sequential, threaded and asyncio polling,
+decode cost per register block and MariaDBMysql insert throughput
+against a local stand-in connection. The results are written as JSON.
+
+Usage (from the repository root):
+    python -m benchmarks.benchmark_em22xx --output benchmark.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import time
+import timeit
+from energymid_em22xx import EnergyMIDEM22xx, FleetPoller, connect_fleet, gather_snapshots
+from energymid_em22xx.register_map import INPUT_REGISTERS, plan_reads
+from energymid_em22xx.measurements import SNAPSHOT_GROUPS, points_of
+from energymid_em22xx.decoding import np, decode_block_values, decode_block_array, decode_registers_array
+from energymid_em22xx.simulator import EM22xxSimulator
+from energymid_em22xx.snapshot import Snapshot
+from maria_db_mysql import MariaDBMysql, BufferedWriter
+
+GETTERS = ('get_voltages_primary', 'get_currents_primary', 'get_power_primary', \
+           'get_energy_import_total', 'get_energy_export_total', 'read_snapshot')
+
+
+def percentiles(samples) -> dict:
+    """p50/p95/p99 and mean of latency samples in milliseconds"""
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50_ms': cuts[49] * 1000, 'p95_ms': cuts[94] * 1000, 'p99_ms': cuts[98] * 1000, \
+            'mean_ms': statistics.fmean(samples) * 1000}
+
+
+def bench_requests_per_snapshot(meter, unit) -> dict:
+    """Count the Modbus requests of a snapshot with a cold and a warm scaling cache"""
+    # the one-time identity read is not part of what the scaling cache saves
+    meter.device_info()
+    meter.invalidate_scaling()
+    before = unit.requests
+    meter.read_snapshot()
+    cold = unit.requests - before
+    before = unit.requests
+    meter.read_snapshot()
+    warm = unit.requests - before
+    return {'cold_cache': cold, 'warm_cache': warm}
+
+
+def bench_getters(meter, iterations) -> dict:
+    """Latency percentiles per getter"""
+    results = {}
+    for name in GETTERS:
+        getter = getattr(meter, name)
+        getter()
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            getter()
+            samples.append(time.perf_counter() - start)
+        results[name] = percentiles(samples)
+    return results
+
+
+def bench_sequential(meter, iterations) -> float:
+    """Snapshots per second of one meter polled in a loop"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        meter.read_snapshot()
+    return iterations / (time.perf_counter() - start)
+
+
+def bench_threaded(devices, rounds, workers) -> float:
+    """Snapshots per second of a fleet polled by the thread pool"""
+    with FleetPoller(devices, max_workers=workers) as poller:
+        list(poller.poll())
+        start = time.perf_counter()
+        for _ in range(rounds):
+            list(poller.poll())
+        return rounds * len(devices) / (time.perf_counter() - start)
+
+
+def bench_async(devices, rounds, concurrency) -> float:
+    """Snapshots per second of a fleet polled by asyncio"""
+    async def _run():
+        meters = await connect_fleet(devices, concurrency=concurrency)
+        await gather_snapshots(meters, concurrency=concurrency)
+        start = time.perf_counter()
+        for _ in range(rounds):
+            await gather_snapshots(meters, concurrency=concurrency)
+        elapsed = time.perf_counter() - start
+        for meter in meters:
+            meter.close()
+        return rounds * len(meters) / elapsed
+    return asyncio.run(_run())
+
+
+def bench_decode(unit, number) -> list:
+    """Decode cost per planned register block in microseconds"""
+    results = []
+    for block in plan_reads(INPUT_REGISTERS[name] for name in points_of(*SNAPSHOT_GROUPS)):
+        registers = unit.getValues(4, block.address, block.length)
+        result = {'address': block.address, 'length': block.length, \
+                  'points': [point.name for point in block.points], \
+                  'decode_block_values_us': timeit.timeit(lambda: decode_block_values(block, registers), \
+                                                          number=number) / number * 1e6}
+        if np is not None:
+            result['decode_block_array_us'] = timeit.timeit(lambda: decode_block_array(block, registers), \
+                                                            number=number) / number * 1e6
+            datatype = block.points[0].datatype if len({p.datatype for p in block.points}) == 1 else 'U16'
+            result['decode_registers_array_us'] = timeit.timeit( \
+                lambda: decode_registers_array(registers, datatype), number=number) / number * 1e6
+        results.append(result)
+    return results
+
+
+class StandInCursor:
+    """Cursor of StandInConnection, every call costs one round trip"""
+    def __init__(self, connection):
+        self._connection = connection
+
+    def execute(self, query, params = None):
+        self._connection.round_trip()
+
+    def executemany(self, query, rows):
+        # mysql.connector sends an INSERT with executemany as one multi-row statement
+        self._connection.round_trip(len(rows))
+
+    def callproc(self, name, arguments):
+        self._connection.round_trip()
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+    """Local stand-in of a MySQLConnection with a fixed cost per round trip and row"""
+    def __init__(self, round_trip = 0.0002, per_row = 0.000002):
+        self._round_trip = round_trip
+        self._per_row = per_row
+        self.round_trips = 0
+        self.rows = 0
+
+    def round_trip(self, rows = 1):
+        self.round_trips += 1
+        self.rows += rows
+        time.sleep(self._round_trip + self._per_row * rows)
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def commit(self):
+        self.round_trip(0)
+
+    def rollback(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class StandInMariaDB(MariaDBMysql):
+    """MariaDBMysql connected to a StandInConnection instead of a server"""
+    def connect(self):
+        return StandInConnection()
+
+
+def bench_mariadb(database, rows, batch) -> dict:
+    """Insert throughput in rows per second"""
+    row = Snapshot(time.time(), *range(17), 1000.0, 10.0).as_row()
+    columns = ', '.join(Snapshot.COLUMNS)
+    results = {}
+    start = time.perf_counter()
+    for _ in range(rows // 10):
+        database.insert_by_sql_insert_stmt('leistung', columns, row)
+    results['insert_by_sql_insert_stmt'] = rows // 10 / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for offset in range(0, rows, batch):
+        database.insert_many('leistung', Snapshot.COLUMNS, [row] * min(batch, rows - offset))
+    results['insert_many'] = rows / (time.perf_counter() - start)
+    start = time.perf_counter()
+    with BufferedWriter(database, 'leistung', Snapshot.COLUMNS, max_rows=batch) as writer:
+        for _ in range(rows):
+            writer.write(row)
+    results['buffered_writer'] = rows / (time.perf_counter() - start)
+    return results
+
+
+def main():
+    """Run all benchmarks and write the results"""
+    parser = argparse.ArgumentParser(description='Benchmark of the EM22xx client against the simulator')
+    parser.add_argument('--iterations', type=int, default=200, help='samples per getter')
+    parser.add_argument('--meters', type=int, default=20, help='simulated meters of the fleet benchmarks')
+    parser.add_argument('--rounds', type=int, default=20, help='polling rounds of the fleet benchmarks')
+    parser.add_argument('--workers', type=int, default=8, help='threads of the threaded fleet benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='latency of the simulated meters in s')
+    parser.add_argument('--rows', type=int, default=10000, help='rows of the MariaDB benchmarks')
+    parser.add_argument('--batch', type=int, default=500, help='rows per batch of the MariaDB benchmarks')
+    parser.add_argument('--mariadb-config', help='JSON file with the config of a real MariaDB '
+                                                 '(default: local stand-in connection)')
+    parser.add_argument('--output', default='benchmark.json', help='file the JSON results are written to')
+    args = parser.parse_args()
+
+    results = {'timestamp': time.time(), 'python': platform.python_version(), \
+               'numpy': np.__version__ if np is not None else None, 'parameters': vars(args)}
+    with EM22xxSimulator(count=args.meters, port=0, latency=args.latency) as simulator:
+        meter = EnergyMIDEM22xx(simulator.devices[0][0], port=simulator.devices[0][1])
+        results['requests_per_snapshot'] = bench_requests_per_snapshot(meter, simulator.units[0])
+        results['getter_latency'] = bench_getters(meter, args.iterations)
+        results['snapshots_per_second'] = {
+            'sequential': bench_sequential(meter, args.iterations),
+            'threaded': bench_threaded(simulator.devices, args.rounds, args.workers),
+            'async': bench_async(simulator.devices, args.rounds, args.meters),
+        }
+        results['decode'] = bench_decode(simulator.units[0], 2000)
+        meter.close()
+    if args.mariadb_config:
+        with open(args.mariadb_config, encoding='utf-8') as file:
+            database = MariaDBMysql(json.load(file))
+    else:
+        database = StandInMariaDB({'database': 'benchmark'})
+    results['mariadb_rows_per_second'] = bench_mariadb(database, args.rows, args.batch)
+
+    print(json.dumps(results, indent=2))
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
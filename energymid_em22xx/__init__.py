@@ -2,3 +2,22 @@
 # -*- coding: utf-8 -*-
 
 from .energymid_em22xx import EnergyMIDEM22xx
+from .register_map import RegisterPoint, INPUT_REGISTERS, plan_reads
+from .async_energymid_em22xx import AsyncEnergyMIDEM22xx, connect_fleet, gather_snapshots
+from .fleet import FleetPoller, PollResult
+from .collector import Collector, mariadb_writer
+from .connection import Backoff, CircuitBreaker
+from .transport import Transport, TcpTransport, RtuTransport, RtuOverTcpTransport
+from .snapshot import Snapshot, RawSnapshot
+from .device_info import DeviceInfo, DeviceInfoCache
+from .configuration import ConfigReport
+from .pipelining import TransactionPipeline
+from .pipeline import poll, Pipeline, BoundedBuffer
+from .scheduler import FixedRateScheduler, Ticker
+from .spool import SnapshotSpool, SpoolDrainer
+from .tsfile import TimeSeriesWriter, TimeSeriesReader
+from .rollup import Rollup, RollupAggregator
+from .deadband import Deadband, DeadbandFilter, Changes
+from .instrumentation import Instrumentation, HistogramExporter, RequestEvent, start_http_server
+from .errors import EM22xxError, EM22xxConnectionError, EM22xxCircuitOpenError, EM22xxTimeoutError, \
+    EM22xxModbusError, EM22xxDecodeError, EM22xxUnsupportedError, ErrorStats
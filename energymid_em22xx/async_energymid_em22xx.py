@@ -0,0 +1,453 @@
+"""Class definition for the asyncio variant of the EM2289"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import struct
+import time
+from pymodbus import (ExceptionResponse, ModbusException)
+from .constants import ModbusConstants as CONSTS
+from .register_map import INPUT_REGISTERS, SCALING_POINTS, plan_reads
+from .scaling import ScalingCache
+from .decoding import decode_block
+from .snapshot import Snapshot, RawSnapshot
+from .device_info import DeviceInfo
+from .transport import Transport, TcpTransport
+from .connection import Backoff
+from .instrumentation import OK, EXCEPTION, ERROR, record_request
+from .errors import EM22xxError, EM22xxModbusError, EM22xxDecodeError, EM22xxTimeoutError, \
+    EM22xxUnsupportedError, ErrorStats, classify
+from .measurements import GROUPS, SNAPSHOT_GROUPS, SCALERS, scale_energy_import, scale_energy_export, \
+    points_of, scale_measurements
+
+
+class AsyncEnergyMIDEM22xx:
+    """Class for communicating with the EM2289 energy meter using asyncio
+    -----
+    Offers the getters of EnergyMIDEM22xx as coroutines. Like there, a
+    Transport object can be passed instead of the ip address.
+
+    Usage:
+        async with AsyncEnergyMIDEM22xx("192.168.178.253") as em2289_obj:
+            voltages = await em2289_obj.get_voltages_primary()
+    """
+    def __init__(self, ip, port = 502, device_unit_id = 0, max_gap = CONSTS.DEFAULT_MAX_GAP, \
+                 scaling_ttl = 600, timeout = 3, instrumentation = None, device_info_cache = None, \
+                 capability_aware = True):
+        """Constructor of AsyncEnergyMIDEM22xx object
+        -----
+         Args:
+            ip: ip address of device or a Transport object
+            port: port which is used (default 502, not used with a Transport)
+            device_unit_id: UnitID (default 0)
+            max_gap: max. number of unused registers bridged by the read planner
+            scaling_ttl: seconds exponents and energy factors are cached (None: forever)
+            timeout: timeout of one request in seconds (not used with a Transport)
+            instrumentation: Instrumentation object receiving request, connect and decode events
+            device_info_cache: DeviceInfoCache object shared by many meters (None: per object only)
+            capability_aware: skip the groups the device does not measure, see supports()
+        """
+        self.transport = ip if isinstance(ip, Transport) else TcpTransport(ip, port, timeout)
+        # a shared transport is closed by its owner, see Transport.close
+        self._owns_transport = not isinstance(ip, Transport)
+        self._client = self.transport.async_client()
+        self._device_unit_id = device_unit_id
+        self._max_gap = max_gap
+        self._scaling_cache = ScalingCache(scaling_ttl)
+        self._instrumentation = instrumentation
+        self._device_info_cache = device_info_cache
+        self._device_info = None
+        # a failed identity read is not repeated before the backoff delay
+        self._device_info_backoff = Backoff(5.0, 300.0)
+        self._device_info_retry_at = 0.0
+        self._capability_aware = capability_aware
+        self.device = f'{self.transport.bus}/{device_unit_id}'
+        self.errors = ErrorStats()
+        self.last_error = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def connect(self) -> bool:
+        """Establish connection of client
+        -----
+        Returns:
+            True when connected or False when failed
+        """
+        start = time.perf_counter()
+        async with self.transport.async_lock:
+            connected = self._client.connected or await self._client.connect()
+        if self._instrumentation is not None:
+            self._instrumentation.on_connect(self.device, connected, time.perf_counter() - start)
+        if not connected:
+            print(f"ERROR: client cannot connect to ModBus-Server {self.transport.bus}!")
+            return False
+        return True
+
+    def close(self):
+        """Close connection of client, unless the transport is shared
+        -----
+        """
+        if self._owns_transport:
+            self._client.close()
+
+    def _failed(self, error, request = True):
+        """Keep the error of a failed request and count it, request=False if none was sent"""
+        self.last_error = error
+        self.errors.record_error(error, request)
+
+    def record_error(self, error, request = True):
+        """Keep and count an error detected outside of the object
+        -----
+        E.g. a timeout of the whole read by the caller, it is kept as
+        last_error and counted in errors like a failed request.
+
+        Args:
+            error: EM22xxError of the failure
+            request: False if no request was sent for it
+        """
+        self._failed(error, request)
+
+    def raise_for_error(self):
+        """Raise the error of the last failed request, if any, see EnergyMIDEM22xx.raise_for_error"""
+        if self.last_error is not None:
+            raise self.last_error
+
+    async def read_input_points(self, points) -> dict:
+        """Read several register points with the fewest possible requests
+
+        Read register with function code 0x04
+        -----
+        Args:
+            points: iterable of RegisterPoint objects
+
+        Returns:
+            values: dict of decoded values by point name or False
+        """
+        values = {}
+        instrumentation = self._instrumentation
+        for block in plan_reads(points, max_gap=self._max_gap):
+            start = time.perf_counter()
+            try:
+                async with self.transport.async_lock:
+                    result = await self._client.read_input_registers(block.address, count=block.length, \
+                                                                     slave=self._device_unit_id)
+            except ModbusException as exc:
+                record_request(instrumentation, self.device, 0x04, block.address, block.length, start, ERROR)
+                print(f">>> read_input_points: Received ModbusException({exc}) from library")
+                self._failed(classify(exc, self.device, block.address))
+                return False
+            if result.isError():
+                if isinstance(result, ExceptionResponse):
+                    outcome = EXCEPTION
+                    error = EM22xxModbusError(self.device, block.address, result.exception_code)
+                else:
+                    outcome = ERROR
+                    error = EM22xxError(self.device, block.address, str(result))
+                record_request(instrumentation, self.device, 0x04, block.address, block.length, start, outcome)
+                print(f">>> read_input_points: Received Modbus library error({result})")
+                self._failed(error)
+                return False
+            record_request(instrumentation, self.device, 0x04, block.address, block.length, start, OK)
+            if len(result.registers) != block.length:
+                self._failed(EM22xxDecodeError(self.device, block.address, \
+                                               f'{len(result.registers)} instead of {block.length} registers'))
+                return False
+            self.errors.record_success()
+            self.last_error = None
+            start = time.perf_counter()
+            try:
+                values.update(decode_block(block, result.registers))
+            except (ValueError, IndexError, struct.error, ModbusException) as exc:
+                print(f">>> decode: Cannot decode registers at {block.address} ({exc})")
+                self._failed(EM22xxDecodeError(self.device, block.address, str(exc)), request=False)
+                return False
+            if instrumentation is not None:
+                instrumentation.on_decode(self.device, block.length, time.perf_counter() - start)
+        return values
+
+    async def read_points(self, *names) -> dict:
+        """Read register points of the register map by name
+
+        Exponents and energy factors are served from the scaling cache
+        -----
+        Args:
+            names: names of the points, see register_map.INPUT_REGISTERS
+
+        Returns:
+            values: dict of decoded values by point name or False
+        """
+        values = {}
+        points = []
+        for name in names:
+            if name in SCALING_POINTS:
+                cached = self._scaling_cache.get(name)
+                if cached is not None:
+                    values[name] = cached
+                    continue
+            points.append(INPUT_REGISTERS[name])
+        if points:
+            readings = await self.read_input_points(points)
+            if readings is False:
+                return False
+            for name in SCALING_POINTS.intersection(readings):
+                self._scaling_cache.set(name, readings[name])
+            values.update(readings)
+        return values
+
+    async def device_info(self, refresh = False) -> DeviceInfo:
+        """Return the identity of the device, see EnergyMIDEM22xx.device_info
+        -----
+        Args:
+            refresh: read the identity from the device again
+
+        Returns:
+            info: DeviceInfo object or None
+        """
+        if not refresh:
+            if self._device_info is not None:
+                return self._device_info
+            if self._device_info_cache is not None:
+                self._device_info = self._device_info_cache.get(self.device)
+                if self._device_info is not None:
+                    return self._device_info
+            if time.monotonic() < self._device_info_retry_at:
+                return None
+        values = await self.read_points('device_identity', 'firmware_version')
+        if values is False:
+            self._device_info_retry_at = time.monotonic() + self._device_info_backoff.next_delay()
+            return None
+        self._device_info_backoff.reset()
+        self._device_info_retry_at = 0.0
+        self._device_info = DeviceInfo.from_registers(values['device_identity'], values['firmware_version'])
+        if self._device_info_cache is not None:
+            self._device_info_cache.put(self.device, self._device_info)
+        return self._device_info
+
+    def invalidate_scaling(self):
+        """Drop the cached exponents and energy factors"""
+        self._scaling_cache.invalidate()
+
+    async def supports(self, group) -> bool:
+        """Check if the device measures a measurement group, see EnergyMIDEM22xx.supports"""
+        if not self._capability_aware:
+            return True
+        info = await self.device_info()
+        return info is None or info.supports(group)
+
+    async def _supported(self, groups) -> tuple:
+        """The groups the device measures, the identity is looked up once for all"""
+        if not self._capability_aware:
+            return tuple(groups)
+        info = await self.device_info()
+        return tuple(group for group in groups if info is None or info.supports(group))
+
+    async def read_group(self, group):
+        """Read and scale one measurement group
+        -----
+        Args:
+            group: name of the group, see measurements.GROUPS
+
+        Returns:
+            scaled values of the group or False
+        """
+        if not await self.supports(group):
+            self._failed(EM22xxUnsupportedError(self.device, None, f'{group} not measured'), request=False)
+            return False
+        values = await self.read_points(*GROUPS[group])
+        return SCALERS[group](values) if values is not False else False
+
+    async def read_measurements(self, *groups) -> dict:
+        """Read several measurement groups in one planned batch
+        -----
+        Args:
+            groups: names of the groups, see measurements.GROUPS (default: SNAPSHOT_GROUPS)
+
+        Returns:
+            measurements: dict of scaled values by group name or False,
+                          groups the device does not measure are left out
+        """
+        groups = await self._supported(groups or SNAPSHOT_GROUPS)
+        if not groups:
+            return {}
+        values = await self.read_points(*points_of(*groups))
+        if values is False:
+            return False
+        return scale_measurements(values, groups)
+
+    async def read_snapshot(self) -> Snapshot:
+        """Read all measurement groups in one planned batch
+        -----
+        Returns:
+            snapshot: Snapshot object or False
+        """
+        timestamp = time.time()
+        measurements = await self.read_measurements()
+        if measurements is False:
+            return False
+        return Snapshot.from_measurements(timestamp, measurements)
+
+    async def read_raw_snapshot(self) -> RawSnapshot:
+        """Read all measurement groups in one planned batch without scaling
+        -----
+        Returns:
+            snapshot: RawSnapshot object or False
+        """
+        timestamp = time.time()
+        values = await self.read_points(*points_of(*await self._supported(SNAPSHOT_GROUPS)))
+        if values is False:
+            return False
+        return RawSnapshot.from_values(timestamp, values)
+
+    async def get_voltages_primary(self) -> tuple:
+        """Get voltages, see EnergyMIDEM22xx.get_voltages_primary
+        -----
+        Returns:
+            (u_12, u_23, u_31, u_mean_12_23_31, u_1n, u_2n, u_3n, u_mean_123)
+        """
+        return await self.read_group('voltages')
+
+    async def get_currents_primary(self) -> tuple:
+        """Get currents, see EnergyMIDEM22xx.get_currents_primary
+        -----
+        Returns:
+            (i_1, i_2, i_3, i_mean_123, i_n)
+        """
+        return await self.read_group('currents')
+
+    async def get_power_primary(self) -> tuple:
+        """Get primary power, see EnergyMIDEM22xx.get_power_primary
+        -----
+        Returns:
+            (p_1, p_2, p_3, p_tot)
+        """
+        return await self.read_group('power')
+
+    async def get_energy_import_total(self) -> float:
+        """Get energy import in kWh, see EnergyMIDEM22xx.get_energy_import_total"""
+        values = await self.read_points(*GROUPS['energy_import'])
+        return scale_energy_import(values) if values is not False else False
+
+    async def get_energy_export_total(self) -> float:
+        """Get energy export in kWh, see EnergyMIDEM22xx.get_energy_export_total"""
+        values = await self.read_points(*GROUPS['energy_export'])
+        return scale_energy_export(values) if values is not False else False
+
+    async def get_reactive_power_primary(self) -> tuple:
+        """Get primary reactive power, see EnergyMIDEM22xx.get_reactive_power_primary
+        -----
+        Returns:
+            (q_1, q_2, q_3, q_tot)
+        """
+        return await self.read_group('reactive_power')
+
+    async def get_apparent_power_primary(self) -> tuple:
+        """Get primary apparent power, see EnergyMIDEM22xx.get_apparent_power_primary
+        -----
+        Returns:
+            (s_1, s_2, s_3, s_tot)
+        """
+        return await self.read_group('apparent_power')
+
+    async def get_power_factors(self) -> tuple:
+        """Get power factors, see EnergyMIDEM22xx.get_power_factors
+        -----
+        Returns:
+            (pf_1, pf_2, pf_3, pf_tot)
+        """
+        return await self.read_group('power_factor')
+
+    async def get_frequency(self) -> float:
+        """Get frequency in Hz, see EnergyMIDEM22xx.get_frequency"""
+        return await self.read_group('frequency')
+
+    async def get_thd_voltages(self) -> tuple:
+        """Get THD of the phase voltages, see EnergyMIDEM22xx.get_thd_voltages
+        -----
+        Returns:
+            (thd_u_1n, thd_u_2n, thd_u_3n)
+        """
+        return await self.read_group('thd_voltages')
+
+    async def get_thd_currents(self) -> tuple:
+        """Get THD of the phase currents, see EnergyMIDEM22xx.get_thd_currents
+        -----
+        Returns:
+            (thd_i_1, thd_i_2, thd_i_3)
+        """
+        return await self.read_group('thd_currents')
+
+
+async def connect_fleet(devices, concurrency = 50, **kwargs) -> list:
+    """Create and connect one AsyncEnergyMIDEM22xx per device
+    -----
+    Args:
+        devices: iterable of (ip, port, device_unit_id) or (transport, device_unit_id)
+        concurrency: max. number of connections established at once
+        kwargs: further arguments of AsyncEnergyMIDEM22xx
+
+    Returns:
+        meters: list of AsyncEnergyMIDEM22xx objects in order of devices
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _connect(device):
+        if isinstance(device[0], Transport):
+            meter = AsyncEnergyMIDEM22xx(device[0], device_unit_id=device[1], **kwargs)
+        else:
+            ip, port, device_unit_id = device
+            meter = AsyncEnergyMIDEM22xx(ip, port=port, device_unit_id=device_unit_id, **kwargs)
+        async with semaphore:
+            await meter.connect()
+        return meter
+
+    return list(await asyncio.gather(*(_connect(device) for device in devices)))
+
+
+async def gather_snapshots(meters, concurrency = 50, timeout = 3.0) -> list:
+    """Read all measurement groups from many meters concurrently
+    -----
+    Meters on the same bus are read one after another, different
+    buses concurrently.
+
+    Args:
+        meters: iterable of connected AsyncEnergyMIDEM22xx objects
+        concurrency: max. number of buses polled at once
+        timeout: max. seconds for reading one meter
+
+    Returns:
+        results: list in order of meters, each entry is the Snapshot
+                 or the EM22xxError of that meter
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    meters = list(meters)
+    results = [None] * len(meters)
+    buses = {}
+    for index, meter in enumerate(meters):
+        buses.setdefault(meter.transport.bus, []).append(index)
+
+    async def _read(meter):
+        try:
+            snapshot = await asyncio.wait_for(meter.read_snapshot(), timeout)
+        except asyncio.TimeoutError:
+            error = EM22xxTimeoutError(meter.device, None, f'no snapshot within {timeout} s')
+            meter.record_error(error)
+            return error
+        except ModbusException as exc:
+            error = classify(exc, meter.device)
+            meter.record_error(error)
+            return error
+        return snapshot if snapshot is not False else meter.last_error
+
+    async def _read_bus(indices):
+        async with semaphore:
+            for index in indices:
+                results[index] = await _read(meters[index])
+
+    await asyncio.gather(*(_read_bus(indices) for indices in buses.values()))
+    return results
@@ -0,0 +1,426 @@
+"""module providing a multi-process collector for very large fleets of EM22xx meters"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import signal
+import time
+from multiprocessing.connection import wait
+from .connection import Backoff
+from .fleet import FleetPoller
+from .measurements import SNAPSHOT_GROUPS
+from .scheduler import Ticker
+from .snapshot import Snapshot
+from .spool import RECORD, record_values, record_snapshot
+from .transport import Transport, bus_of
+
+# columns written by the sink: numeric device id, timestamp and the snapshot values
+COLLECTOR_COLUMNS = ('device', 'timestamp') + Snapshot.COLUMNS
+
+# a worker running this long before it died was stable, its restart is not delayed further
+STABLE_RUNTIME = 60.0
+
+
+def pack_batch(records) -> bytes:
+    """Pack snapshots into the fixed binary records of the spool
+    -----
+    Missing measurements (None, e.g. of energy-only meters) become NaN.
+
+    Args:
+        records: list of (device_id, Snapshot)
+
+    Returns:
+        data: bytes of len(records) * RECORD.size
+    """
+    data = bytearray(len(records) * RECORD.size)
+    for index, (device_id, snapshot) in enumerate(records):
+        RECORD.pack_into(data, index * RECORD.size, device_id, *record_values(snapshot))
+    return bytes(data)
+
+
+def unpack_batch(data) -> list:
+    """Unpack the records of pack_batch(), NaN becomes None again
+    -----
+    Returns:
+        records: list of (device_id, Snapshot)
+    """
+    return [(values[0], record_snapshot(values[1:])) for values in RECORD.iter_unpack(data)]
+
+
+def mariadb_writer(config, table = 'leistung', max_rows = 500, max_age = 5.0):
+    """Create the BufferedWriter of the sink process, see Collector
+    -----
+    Args:
+        config: configuration for mariaDB access
+        table: table with the columns of COLLECTOR_COLUMNS
+        max_rows: number of buffered rows triggering a flush
+        max_age: age of the oldest buffered row in seconds triggering a flush
+
+    Returns:
+        writer: BufferedWriter object
+    """
+    # imported here, only the sink process needs mysql.connector
+    from maria_db_mysql import MariaDBMysql, BufferedWriter
+    return BufferedWriter(MariaDBMysql(config), table, COLLECTOR_COLUMNS, max_rows, max_age)
+
+
+def _worker_main(control, data, interval, groups, kwargs):
+    """Poll the assigned devices at a fixed rate, runs in a worker process
+    -----
+    The assignment arrives on control as list of (device_id, device),
+    None or the end of the pipe stops the worker. The snapshots of a
+    round are sent as one packed batch on data.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    poller = FleetPoller((), **kwargs)
+    ids = {}
+    ticker = Ticker(interval)
+    try:
+        while True:
+            if control.poll(max(0.0, ticker.deadline - time.monotonic())):
+                try:
+                    assignment = control.recv()
+                except EOFError:
+                    return
+                if assignment is None:
+                    return
+                ids = {tuple(device): device_id for device_id, device in assignment}
+                poller.set_devices(ids)
+                continue
+            ticker.tick(time.monotonic())
+            timestamp = time.time()
+            records = [(ids[result.device], Snapshot.from_measurements(timestamp, result.measurements)) \
+                       for result in poller.poll(*groups) if result.measurements is not None]
+            if records:
+                data.send_bytes(pack_batch(records))
+    finally:
+        poller.close()
+        data.close()
+
+
+def _sink_main(control, writer_factory):
+    """Write the batches of all workers, runs in the sink process
+    -----
+    The receiving ends of the worker pipes arrive on control, None or
+    the end of the pipe stops the sink once all workers closed their pipes.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    writer = writer_factory()
+    connections = []
+    running = True
+    try:
+        while running or connections:
+            for connection in wait(connections + [control] if running else connections):
+                if connection is control:
+                    try:
+                        message = control.recv()
+                    except EOFError:
+                        message = None
+                    if message is None:
+                        running = False
+                    else:
+                        connections.append(message)
+                    continue
+                try:
+                    batch = connection.recv_bytes()
+                except EOFError:
+                    # the worker exited or died
+                    connections.remove(connection)
+                    connection.close()
+                    continue
+                writer.write_many((device_id,) + snapshot.as_row(True) for device_id, snapshot in unpack_batch(batch))
+    finally:
+        writer.close()
+
+
+class Collector:
+    """Poll a very large fleet with several worker processes and one sink process
+
+    The buses of the devices are sharded across the workers, the devices
+    of one bus stay in one worker. Each worker polls its shard with a
+    FleetPoller at a fixed rate and sends each round as one compact batch
+    of binary records (see spool.RECORD) through a pipe to the sink
+    process, which writes them with a BufferedWriter into MariaDB.
+    Decoding and aggregation so run on all cores instead of one.
+
+    The devices are identified by their position in devices (column
+    "device"). When a worker dies its shard is spread over the other
+    workers at once, a replacement is started with backoff and the
+    shards are balanced again.
+
+    Usage:
+        sink = functools.partial(mariadb_writer, MARIA_DB_CONFIG, "leistung")
+        with Collector(devices, sink, workers=8, interval=1.0) as collector:
+            collector.run()
+    """
+    def __init__(self, devices, sink, workers = None, interval = 1.0, groups = SNAPSHOT_GROUPS, \
+                 respawn = True, backoff = None, **kwargs):
+        """Constructor of Collector object
+        -----
+        Args:
+            devices: iterable of (ip, port, device_unit_id)
+            sink: function returning the writer of the sink process, called there,
+                  the writer needs write_many(rows) and close(), see mariadb_writer()
+            workers: number of worker processes (default: number of CPUs)
+            interval: seconds between two polling rounds
+            groups: names of the measurement groups of the snapshots
+            respawn: start a replacement when a worker died
+            backoff: Backoff object delaying the replacements (default: Backoff(1.0, 60.0))
+            kwargs: further arguments of FleetPoller and EnergyMIDEM22xx, e.g. max_workers
+        """
+        self._devices = list(dict.fromkeys(tuple(device) for device in devices))
+        if any(isinstance(device[0], Transport) for device in self._devices):
+            raise ValueError('a Collector takes (ip, port, device_unit_id) tuples, no Transport objects')
+        self._buses = {}
+        for device_id, device in enumerate(self._devices):
+            self._buses.setdefault(bus_of(device), []).append(device_id)
+        count = workers if workers is not None else os.cpu_count() or 1
+        self._count = max(1, min(count, len(self._buses)))
+        self._sink_factory = sink
+        self._interval = interval
+        self._groups = tuple(groups)
+        self._respawn = respawn
+        self._backoff = backoff if backoff is not None else Backoff(1.0, 60.0)
+        self._kwargs = kwargs
+        self._processes = [None] * self._count
+        self._controls = [None] * self._count
+        self._started = [0.0] * self._count
+        # bus labels per worker
+        self._shards = [set() for _ in range(self._count)]
+        self._respawn_at = {}
+        self._sink = None
+        self._sink_control = None
+        self._stop = False
+        self.restarts = 0
+        self.rebalances = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def shards(self) -> list:
+        """Devices of each worker, e.g. to inspect the balance"""
+        return [[self._devices[device_id] for bus in sorted(shard) for device_id in self._buses[bus]] \
+                for shard in self._shards]
+
+    @property
+    def alive(self) -> int:
+        """Number of running worker processes"""
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    def _load(self, slot) -> int:
+        """Number of devices of a worker"""
+        return sum(len(self._buses[bus]) for bus in self._shards[slot])
+
+    def _place(self, buses, slots) -> set:
+        """Add buses to the least loaded of slots, largest buses first
+        -----
+        Returns:
+            changed: slots which got buses
+        """
+        changed = set()
+        loads = {slot: self._load(slot) for slot in slots}
+        for bus in sorted(buses, key=lambda bus: len(self._buses[bus]), reverse=True):
+            slot = min(slots, key=loads.get)
+            self._shards[slot].add(bus)
+            loads[slot] += len(self._buses[bus])
+            changed.add(slot)
+        return changed
+
+    def _balance(self, slots) -> set:
+        """Move buses from the most to the least loaded worker while this evens the load
+        -----
+        Returns:
+            changed: slots which got or lost buses
+        """
+        changed = set()
+        loads = {slot: self._load(slot) for slot in slots}
+        while True:
+            high = max(slots, key=loads.get)
+            low = min(slots, key=loads.get)
+            movable = [bus for bus in self._shards[high] if loads[low] + len(self._buses[bus]) < loads[high]]
+            if not movable:
+                return changed
+            bus = max(movable, key=lambda bus: len(self._buses[bus]))
+            self._shards[high].remove(bus)
+            self._shards[low].add(bus)
+            loads[high] -= len(self._buses[bus])
+            loads[low] += len(self._buses[bus])
+            changed.update((high, low))
+
+    def _assign(self, slots):
+        """Send the current shards to the workers of slots"""
+        for slot in slots:
+            control = self._controls[slot]
+            if control is None:
+                continue
+            try:
+                control.send([(device_id, self._devices[device_id]) \
+                              for bus in sorted(self._shards[slot]) for device_id in self._buses[bus]])
+            except OSError:
+                # died meanwhile, handled by check()
+                pass
+
+    def _spawn(self, slot):
+        """Start the worker process of a slot with its own pipe to the sink"""
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        control, worker_control = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_main, name=f'em22xx-worker-{slot}', daemon=True, \
+                                          args=(worker_control, sender, self._interval, self._groups, self._kwargs))
+        process.start()
+        # only the processes at the ends keep the pipes open, so their ends see EOF
+        sender.close()
+        worker_control.close()
+        self._sink_control.send(receiver)
+        receiver.close()
+        self._processes[slot] = process
+        self._controls[slot] = control
+        self._started[slot] = time.monotonic()
+
+    def start(self):
+        """Start the sink and the worker processes and assign the shards
+        -----
+        """
+        self._stop = False
+        control, sink_control = multiprocessing.Pipe()
+        self._sink = multiprocessing.Process(target=_sink_main, name='em22xx-sink', \
+                                             args=(sink_control, self._sink_factory))
+        self._sink.start()
+        sink_control.close()
+        self._sink_control = control
+        for slot in range(self._count):
+            self._spawn(slot)
+        self._place(self._buses, range(self._count))
+        self._assign(range(self._count))
+
+    def _worker_died(self, slot):
+        """Spread the shard of a dead worker over the others and schedule its replacement"""
+        process = self._processes[slot]
+        process.join()
+        print(f"WARNING: worker {slot} died (exit code {process.exitcode}), rebalancing!")
+        self._processes[slot] = None
+        self._controls[slot].close()
+        self._controls[slot] = None
+        alive = [other for other in range(self._count) if self._processes[other] is not None]
+        if alive:
+            orphans = self._shards[slot]
+            self._shards[slot] = set()
+            self._assign(self._place(orphans, alive))
+            self.rebalances += 1
+        if self._respawn:
+            if time.monotonic() - self._started[slot] >= STABLE_RUNTIME:
+                self._backoff.reset()
+            self._respawn_at[slot] = time.monotonic() + self._backoff.next_delay()
+
+    def check(self, timeout = 0.0):
+        """Handle dead workers and due replacements
+        -----
+        Args:
+            timeout: max. seconds to wait for a worker to die
+        """
+        now = time.monotonic()
+        for slot, due in list(self._respawn_at.items()):
+            if now >= due:
+                del self._respawn_at[slot]
+                self._spawn(slot)
+                self.restarts += 1
+                alive = [other for other in range(self._count) if self._processes[other] is not None]
+                self._assign(self._balance(alive) | {slot})
+        if self._respawn_at:
+            timeout = min(timeout, max(0.0, min(self._respawn_at.values()) - now))
+        sentinels = {process.sentinel: slot for slot, process in enumerate(self._processes) if process is not None}
+        ready = wait(list(sentinels) + [self._sink.sentinel], timeout)
+        if self._sink.sentinel in ready:
+            print(f"ERROR: sink process died (exit code {self._sink.exitcode}), restarting the collector!")
+            self.stop()
+            self.start()
+            return
+        for sentinel in ready:
+            self._worker_died(sentinels[sentinel])
+
+    def run(self, duration = None):
+        """Supervise the processes until stop() is called or duration passed
+        -----
+        Args:
+            duration: seconds to run (None: endless)
+        """
+        end = None if duration is None else time.monotonic() + duration
+        while not self._stop:
+            timeout = 1.0 if end is None else end - time.monotonic()
+            if timeout <= 0:
+                return
+            self.check(min(timeout, 1.0))
+
+    def stop(self):
+        """Stop the workers, then the sink after it wrote all batches
+        -----
+        """
+        self._stop = True
+        if self._sink is None:
+            return
+        for control in self._controls:
+            if control is not None:
+                try:
+                    control.send(None)
+                except OSError:
+                    pass
+        for slot, process in enumerate(self._processes):
+            if process is not None:
+                process.join(self._interval + 10.0)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            if self._controls[slot] is not None:
+                self._controls[slot].close()
+            self._processes[slot] = None
+            self._controls[slot] = None
+        self._respawn_at.clear()
+        try:
+            self._sink_control.send(None)
+        except OSError:
+            pass
+        self._sink.join()
+        self._sink_control.close()
+        self._sink = None
+        self._sink_control = None
+        self._shards = [set() for _ in range(self._count)]
+
+
+def main():
+    """Run the collector from the command line"""
+    parser = argparse.ArgumentParser(description='Multi-process collector of EM22xx meters into MariaDB')
+    parser.add_argument('devices', help='JSON file with a list of [ip, port, device_unit_id]')
+    parser.add_argument('mariadb_config', help='JSON file with the config of the MariaDB')
+    parser.add_argument('--table', default='leistung', help='table with the columns device, timestamp, '
+                                                           'u_12 ... energy_export')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPUs)')
+    parser.add_argument('--threads', type=int, default=8, help='threads per worker process')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between two polling rounds')
+    parser.add_argument('--max-rows', type=int, default=500, help='rows per insert batch')
+    parser.add_argument('--max-age', type=float, default=5.0, help='max. seconds a row is buffered')
+    args = parser.parse_args()
+
+    with open(args.devices, encoding='utf-8') as file:
+        devices = [tuple(device) for device in json.load(file)]
+    with open(args.mariadb_config, encoding='utf-8') as file:
+        config = json.load(file)
+    sink = functools.partial(mariadb_writer, config, args.table, args.max_rows, args.max_age)
+    with Collector(devices, sink, workers=args.workers, interval=args.interval, \
+                   max_workers=args.threads) as collector:
+        print(f'{len(devices)} devices, {len(collector.shards)} workers')
+        try:
+            collector.run()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""module providing the diff and write planning of EM22xx holding register configurations"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from .constants import ModbusConstants as CONSTS
+from .decoding import encode_registers
+from .register_map import HOLDING_REGISTERS
+
+
+class ConfigReport(namedtuple('ConfigReport', ['device', 'before', 'changed', 'requests', 'verified', 'error'])):
+    """Result of applying a configuration to one device
+    -----
+    Args:
+        device: device label "ip:port/unit" or the device tuple of FleetPoller
+        before: dict of the values read before by point name (None: read failed)
+        changed: tuple of the names of the written points
+        requests: number of Modbus requests issued
+        verified: True when the read-back matched, False when not, None when not verified
+        error: None or the EM22xxError which stopped the apply
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self) -> bool:
+        """Check if the device has the desired configuration"""
+        return self.error is None and self.verified is not False
+
+
+def desired_registers(desired) -> dict:
+    """Encode a configuration into raw registers
+    -----
+    Args:
+        desired: dict of values by holding point name, see register_map.HOLDING_REGISTERS
+
+    Returns:
+        registers: dict of raw 16-bit register values by register address
+    """
+    registers = {}
+    for name, value in desired.items():
+        point = HOLDING_REGISTERS.get(name)
+        if point is None:
+            raise ValueError(f'unknown holding register point {name}')
+        for offset, register in enumerate(encode_registers(value, point.datatype)):
+            registers[point.address + offset] = register
+    return registers
+
+
+def plan_writes(current, desired, max_length = CONSTS.MAX_WRITE_REGISTERS) -> list:
+    """Plan the write requests of the changed registers
+    -----
+    Changed registers at consecutive addresses are written with one
+    request (function code 0x10), unchanged registers are not written.
+
+    Args:
+        current: dict of raw register values by address as read from the device
+        desired: dict of raw register values by address, see desired_registers()
+        max_length: maximum number of registers of one request
+
+    Returns:
+        writes: list of (register_address, values) sorted by address
+    """
+    writes = []
+    for address in sorted(address for address, value in desired.items() if current.get(address) != value):
+        if writes and writes[-1][0] + len(writes[-1][1]) == address and len(writes[-1][1]) < max_length:
+            writes[-1][1].append(desired[address])
+        else:
+            writes.append((address, [desired[address]]))
+    return writes
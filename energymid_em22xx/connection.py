@@ -0,0 +1,102 @@
+"""module providing reconnect backoff and circuit breaker for EM22xx connections"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import random
+import socket
+import time
+
+
+class Backoff:
+    """Exponential backoff with jitter for reconnect attempts"""
+    def __init__(self, initial = 0.5, maximum = 30.0, factor = 2.0, jitter = 0.5):
+        """Constructor of Backoff object
+        -----
+        Args:
+            initial: delay after the first failure in seconds
+            maximum: upper limit of the delay in seconds
+            factor: growth of the delay per failure
+            jitter: random part of the delay (0.5: delay varies by +/- 50 %)
+        """
+        self._initial = initial
+        self._maximum = maximum
+        self._factor = factor
+        self._jitter = jitter
+        self._failures = 0
+
+    def next_delay(self) -> float:
+        """Account one failure and return the delay until the next attempt"""
+        delay = min(self._maximum, self._initial * self._factor**self._failures)
+        self._failures += 1
+        return delay * (1 + random.uniform(-self._jitter, self._jitter))
+
+    def reset(self):
+        """Reset after a successful attempt"""
+        self._failures = 0
+
+
+class CircuitBreaker:
+    """Circuit breaker guarding the requests to one device
+
+    After failure_threshold consecutive failures the circuit opens and
+    requests are rejected without I/O for recovery_timeout seconds.
+    Then one trial request is let through (half open), its outcome
+    closes or reopens the circuit.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold = 3, recovery_timeout = 30.0):
+        """Constructor of CircuitBreaker object
+        -----
+        Args:
+            failure_threshold: consecutive failures opening the circuit
+            recovery_timeout: seconds the circuit stays open
+        """
+        self._failure_threshold = failure_threshold
+        self._recovery_timeout = recovery_timeout
+        self._failures = 0
+        self._opened_at = None
+        self.state = self.CLOSED
+
+    def allow(self) -> bool:
+        """Check if a request may be issued"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self._recovery_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        return True
+
+    @property
+    def rejecting(self) -> bool:
+        """Check without changing the state if requests are rejected"""
+        return self.state == self.OPEN and time.monotonic() - self._opened_at < self._recovery_timeout
+
+    def record_success(self):
+        """Account a successful request"""
+        self._failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self):
+        """Account a failed request"""
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self._failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+def enable_keepalive(sock, idle = 10, interval = 5, probes = 3):
+    """Enable TCP keep-alive on a socket
+    -----
+    Args:
+        sock: connected socket object
+        idle: seconds without traffic before the first probe
+        interval: seconds between probes
+        probes: failed probes until the connection is dropped
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # the fine tuning options are not available on all platforms
+    for option, value in (('TCP_KEEPIDLE', idle), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', probes)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
@@ -7,6 +7,12 @@ class ModbusConstants:
     """
     TYPE_TO_LENGTH = {'U8': 1, 'U16': 1, 'U32': 2, 'U64': 4, \
                       'S8': 1, 'S16': 1, 'S32': 2, 'S64': 4}
+    # maximum number of registers in one read request (PDU limit)
+    MAX_READ_REGISTERS = 125
+    # maximum number of registers in one write request (PDU limit)
+    MAX_WRITE_REGISTERS = 123
+    # default number of unused registers bridged between two points
+    DEFAULT_MAX_GAP = 8
 
 class EM22xxFeatures:
     """Class for EM22xx related constants"""
@@ -0,0 +1,133 @@
+"""module providing a deadband filter for report-by-exception of EM22xx snapshots"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+from collections import namedtuple
+from .snapshot import Snapshot
+
+# channels of the snapshot groups, deadbands can be given per group or per channel
+CHANNEL_GROUPS = {
+    'voltages':      Snapshot.COLUMNS[0:8],
+    'currents':      Snapshot.COLUMNS[8:13],
+    'power':         Snapshot.COLUMNS[13:17],
+    'energy_import': ('energy_import',),
+    'energy_export': ('energy_export',),
+}
+
+
+class Deadband(namedtuple('Deadband', ['absolute', 'relative'])):
+    """Deadband of one channel
+    -----
+    A value is reported when it differs from the last reported value
+    by more than absolute or by more than relative * |last value|.
+
+    Args:
+        absolute: absolute deadband in the unit of the channel (None: not used)
+        relative: relative deadband, e.g. 0.01 for 1 % (None: not used)
+    """
+    __slots__ = ()
+
+    def __new__(cls, absolute = None, relative = None):
+        return super().__new__(cls, absolute, relative)
+
+    def exceeded(self, last, value) -> bool:
+        """Check if value left the deadband around last"""
+        band = self.absolute or 0.0
+        if self.relative:
+            band = max(band, self.relative * abs(last))
+        return abs(value - last) > band
+
+
+class Changes(namedtuple('Changes', ['timestamp', 'values'])):
+    """Channels of one snapshot which left their deadband
+    -----
+    Args:
+        timestamp: seconds since the epoch of the snapshot
+        values: dict of values by channel name
+    """
+    __slots__ = ()
+
+    # columns of as_rows(), e.g. for MariaDBMysql.insert_many
+    COLUMNS = ('timestamp', 'channel', 'value')
+
+    def as_rows(self) -> list:
+        """Convert to one (timestamp, channel, value) row per channel"""
+        timestamp = datetime.datetime.fromtimestamp(self.timestamp)
+        return [(timestamp, channel, value) for channel, value in self.values.items()]
+
+
+class DeadbandFilter:
+    """Report-by-exception filter over a snapshot stream
+
+    Only channels which left their deadband since their last report,
+    or were silent for heartbeat seconds, are forwarded. Channels the
+    meter does not measure (None) are never forwarded.
+
+    Usage:
+        deadband_filter = DeadbandFilter({'voltages': Deadband(absolute=0.5),
+                                          'power': Deadband(relative=0.02)}, heartbeat=300)
+        Pipeline(poll(em2289_obj, 1.0), lambda changes: maria_obj.insert_many(
+            "messwerte", Changes.COLUMNS, changes.as_rows()), stages=(deadband_filter,)).run()
+    """
+    def __init__(self, deadbands = None, default = Deadband(), heartbeat = 60.0):
+        """Constructor of DeadbandFilter object
+        -----
+        Args:
+            deadbands: dict of Deadband objects by channel or group name, see CHANNEL_GROUPS
+            default: Deadband of the channels not given (default: report every change)
+            heartbeat: max. seconds a channel stays unreported (None: no heartbeat)
+        """
+        self._deadbands = dict.fromkeys(Snapshot.COLUMNS, default)
+        for name, deadband in (deadbands or {}).items():
+            if name in CHANNEL_GROUPS:
+                self._deadbands.update(dict.fromkeys(CHANNEL_GROUPS[name], deadband))
+            elif name in self._deadbands:
+                self._deadbands[name] = deadband
+            else:
+                raise ValueError(f'unknown channel {name}')
+        self._heartbeat = heartbeat
+        # last reported value and time by channel
+        self._reported = {}
+        self.received = 0
+        self.forwarded = 0
+        self.suppressed = 0
+
+    def __call__(self, snapshot):
+        """Filter one snapshot, usable as a Pipeline stage"""
+        return self.filter(snapshot)
+
+    def filter(self, snapshot) -> Changes:
+        """Filter one snapshot
+        -----
+        Args:
+            snapshot: Snapshot object
+
+        Returns:
+            changes: Changes object or None when no channel changed
+        """
+        timestamp = snapshot.timestamp
+        heartbeat = self._heartbeat
+        reported = self._reported
+        values = {}
+        received = 0
+        for channel, value in zip(Snapshot.COLUMNS, snapshot[1:]):
+            if value is None:
+                # not measured by the meter
+                continue
+            received += 1
+            last = reported.get(channel)
+            if last is None or self._deadbands[channel].exceeded(last[0], value) \
+               or (heartbeat is not None and timestamp - last[1] >= heartbeat):
+                values[channel] = value
+                reported[channel] = (value, timestamp)
+        self.received += received
+        self.forwarded += len(values)
+        self.suppressed += received - len(values)
+        return Changes(timestamp, values) if values else None
+
+    def reset(self):
+        """Forget the reported values, the next snapshot is forwarded completely
+        -----
+        """
+        self._reported.clear()
@@ -0,0 +1,169 @@
+"""module for decoding raw EM22xx register readings"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from pymodbus.client.mixin import ModbusClientMixin
+try:
+    import numpy as np
+except ImportError:
+    # numpy is optional, the per-value path is used without it
+    np = None
+
+DATATYPE = ModbusClientMixin.DATATYPE
+
+# big-endian numpy dtypes of the EM22xx datatypes
+NUMPY_DTYPES = {'U8': '>u1', 'U16': '>u2', 'U32': '>u4', 'U64': '>u8', \
+                'S8': '>i1', 'S16': '>i2', 'S32': '>i4', 'S64': '>i8'}
+
+# datatypes of pymodbus for encoding the register points
+ENCODE_DATATYPES = {'U16': DATATYPE.UINT16, 'S16': DATATYPE.INT16, 'U32': DATATYPE.UINT32, \
+                    'S32': DATATYPE.INT32, 'U64': DATATYPE.UINT64, 'S64': DATATYPE.INT64}
+
+# mantissa value marking an undefined variable (format type 1)
+UNDEFINED_S16 = -0x8000
+
+
+def convert_uint16_to_uint8_array(uint16_array, count):
+    """
+    Convert an 16-bit array into an 8-bit array,
+    and return only specific number of elements by count
+    """
+    uint8_array = []
+    for value in (uint16_array):
+        high_byte = (value >> 8) & 0xFF
+        low_byte = value & 0xFF
+        uint8_array.extend([high_byte, low_byte])
+    return uint8_array[0:count]
+
+
+def decode_registers(registers, datatype, count) -> list:
+    """Decode a list of raw registers
+
+    Decode registers depending on datatype given
+    -----
+    Args:
+        registers: list of raw 16-bit registers
+        datatype: U16, U32 , etc...
+        count: number of datatypes to be converted
+
+    Returns:
+        data: list of decoded values
+    """
+    convert = ModbusClientMixin.convert_from_registers
+    data = []
+    if datatype == 'U8':
+        data = convert(registers, data_type=DATATYPE.UINT16)
+        data = convert_uint16_to_uint8_array(data, count)
+    elif datatype == 'U16':
+        data = convert(registers, data_type=DATATYPE.UINT16)
+    elif datatype == 'U32':
+        data = convert(registers, data_type=DATATYPE.UINT32)
+    elif datatype == 'U64':
+        data = convert(registers, data_type=DATATYPE.UINT64)
+    elif datatype == 'S16':
+        data = convert(registers, data_type=DATATYPE.INT16)
+    elif datatype == 'S32':
+        data = convert(registers, data_type=DATATYPE.INT32)
+    elif datatype == 'S64':
+        data = convert(registers, data_type=DATATYPE.INT64)
+    return data
+
+
+def encode_registers(values, datatype) -> list:
+    """Encode values into raw 16-bit registers, inverse of decode_registers"""
+    values = values if isinstance(values, (list, tuple)) else [values]
+    registers = []
+    for value in values:
+        registers.extend(ModbusClientMixin.convert_to_registers(value, ENCODE_DATATYPES[datatype]))
+    return registers
+
+
+def decode_block(block, registers) -> dict:
+    """Decode all points of a planned read block
+    -----
+    Uses decode_block_array when numpy is installed, decode_block_values otherwise.
+
+    Args:
+        block: ReadBlock object
+        registers: list of raw 16-bit registers read for the block
+
+    Returns:
+        values: dict of decoded values by point name
+    """
+    if np is not None:
+        return decode_block_array(block, registers)
+    return decode_block_values(block, registers)
+
+
+def decode_block_values(block, registers) -> dict:
+    """Decode all points of a planned read block value by value, see decode_block"""
+    values = {}
+    for point in block.points:
+        offset = block.offset(point)
+        values[point.name] = decode_registers(registers[offset:offset + point.length], \
+                                              point.datatype, point.count)
+    return values
+
+
+def decode_block_array(block, registers) -> dict:
+    """Decode all points of a planned read block with numpy, see decode_block
+    -----
+    The registers are converted to bytes once, each point is one frombuffer
+    step. The values are the same as of decode_block_values: a single value
+    as int, several values (and U8 always) as list of int, which the scalers
+    of measurements.py turn into physical values one by one.
+    """
+    raw = np.asarray(registers, dtype='>u2').tobytes()
+    values = {}
+    for point in block.points:
+        offset = 2 * block.offset(point)
+        data = np.frombuffer(raw[offset:offset + 2 * point.length], dtype=NUMPY_DTYPES[point.datatype]).tolist()
+        if point.datatype == 'U8':
+            data = data[:point.count]
+        elif len(data) == 1:
+            data = data[0]
+        values[point.name] = data
+    return values
+
+
+def decode_registers_array(registers, datatype, count = None):
+    """Decode raw registers into a typed NumPy array
+
+    Decode registers with one frombuffer step instead of value by value
+    -----
+    Args:
+        registers: list or array of raw 16-bit registers, or a 2D array
+                   with one block of registers per row
+        datatype: U16, U32 , etc...
+        count: number of datatypes per block to be returned (default: all)
+
+    Returns:
+        data: numpy array of decoded values (one row per block for 2D input)
+    """
+    if np is None:
+        raise ImportError('decode_registers_array requires numpy')
+    raw = np.ascontiguousarray(registers, dtype='>u2')
+    data = np.frombuffer(raw.tobytes(), dtype=NUMPY_DTYPES[datatype])
+    if raw.ndim == 2:
+        data = data.reshape(raw.shape[0], -1)
+    return data[..., :count] if count is not None else data
+
+
+def scale_array(mantissas, exponent, decimals = None, undefined = UNDEFINED_S16):
+    """Scale mantissas by 10 ^ exponent in one vectorized step
+    -----
+    Args:
+        mantissas: numpy array of mantissas
+        exponent: exponent as scalar, or array broadcastable to the mantissas
+        decimals: number of decimals to round to (None: no rounding)
+        undefined: mantissa marking an undefined value, set to NaN (None: disabled)
+
+    Returns:
+        values: numpy float array of scaled values
+    """
+    values = mantissas * np.power(10.0, exponent)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    if undefined is not None:
+        values = np.where(mantissas == undefined, np.nan, values)
+    return values
@@ -0,0 +1,171 @@
+"""module providing the parsed device identity of the EM22xx and its cache"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import json
+import os
+import threading
+from collections import namedtuple
+from .constants import EM22xxFeatures as FEATURE
+from .decoding import convert_uint16_to_uint8_array
+from .measurements import MULTIFUNCTION_GROUPS
+
+# option letters of the feature bytes 1..10 of Format 17, see constants.EM22xxFeatures
+OPTIONS = ('D', 'H', 'M', 'P', 'Q', 'U', 'V', 'W', 'Z', 'S')
+
+
+class DeviceInfo(namedtuple('DeviceInfo', ['device_type', 'features', 'serial_number', \
+                                           'calibration_date', 'firmware_version'])):
+    """Identity of one EM22xx, registers 3000 ff. (Format 17) and 3012
+    -----
+    Args:
+        device_type: type code, see EM22xxFeatures.TYPE
+        features: tuple of the codes of the options D, H, M, P, Q, U, V, W, Z, S
+        serial_number: serial number as string
+        calibration_date: datetime.date of the calibration or None
+        firmware_version: raw firmware version, e.g. 121 for v1.21
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_registers(cls, identity, firmware_version):
+        """Parse the raw registers
+        -----
+        Args:
+            identity: 12 raw registers starting at register 3000
+            firmware_version: value of register 3012
+
+        Returns:
+            info: DeviceInfo object
+        """
+        data = convert_uint16_to_uint8_array(identity, 23)
+        serial = bytes(data[11:19])
+        if all(0x20 <= byte < 0x7F for byte in serial.rstrip(b'\x00')):
+            serial_number = serial.rstrip(b'\x00').decode('ascii').strip()
+        else:
+            serial_number = serial.hex()
+        try:
+            calibration_date = datetime.date((data[22] << 8) | data[21], data[20], data[19])
+        except ValueError:
+            calibration_date = None
+        return cls(data[0], tuple(data[1:11]), serial_number, calibration_date, firmware_version)
+
+    @property
+    def type_name(self) -> str:
+        """Name of the device type, e.g. U2289"""
+        return FEATURE.TYPE.get(self.device_type, f'unknown ({self.device_type})')
+
+    @property
+    def options(self) -> dict:
+        """Codes of the options by letter"""
+        return dict(zip(OPTIONS, self.features))
+
+    def describe(self, option) -> str:
+        """Description of an option, e.g. describe('W') -> 'TCP/IP'"""
+        code = self.options[option]
+        return getattr(FEATURE, option).get(code, f'unknown ({code})')
+
+    @property
+    def multifunction(self) -> bool:
+        """Check if the device has multifunction measurements (feature M1 or M3)"""
+        return self.options['M'] in (1, 3)
+
+    def supports(self, group) -> bool:
+        """Check if the device measures a group, see measurements.GROUPS"""
+        return self.multifunction or group not in MULTIFUNCTION_GROUPS
+
+    @property
+    def firmware(self) -> str:
+        """Firmware version as text, e.g. v1.21"""
+        digits = str(self.firmware_version)
+        return f'v{digits[0]}.{digits[1:]}'
+
+    def as_dict(self) -> dict:
+        """Convert to a JSON serializable dict"""
+        info = self._asdict()
+        info['features'] = list(self.features)
+        info['calibration_date'] = self.calibration_date.isoformat() if self.calibration_date else None
+        return info
+
+    @classmethod
+    def from_dict(cls, info):
+        """Create from a dict of as_dict()"""
+        calibration_date = info['calibration_date']
+        return cls(info['device_type'], tuple(info['features']), info['serial_number'], \
+                   datetime.date.fromisoformat(calibration_date) if calibration_date else None, \
+                   info['firmware_version'])
+
+
+class DeviceInfoCache:
+    """Cache of DeviceInfo objects by serial number, looked up by device label
+
+    Shared by many meters, e.g. through the arguments of FleetPoller.
+    With a path the cache is persisted as JSON, so a restarted collector
+    needs no identity read at all. A replaced meter at the same address
+    is only noticed with device_info(refresh=True).
+
+    Usage:
+        cache = DeviceInfoCache("device_info.json")
+        em2289_obj = EnergyMIDEM22xx("192.168.178.253", device_info_cache=cache)
+        print(em2289_obj.device_info().serial_number)
+    """
+    def __init__(self, path = None):
+        """Constructor of DeviceInfoCache object
+        -----
+        Args:
+            path: JSON file the cache is loaded from and saved to (None: memory only)
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        # serial number by device label "ip:port/unit"
+        self._devices = {}
+        # DeviceInfo by serial number
+        self._infos = {}
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._infos)
+
+    def get(self, device):
+        """Return the DeviceInfo of a device label or None when unknown"""
+        with self._lock:
+            serial_number = self._devices.get(device)
+            return self._infos.get(serial_number) if serial_number is not None else None
+
+    def by_serial(self, serial_number):
+        """Return the DeviceInfo of a serial number or None when unknown"""
+        with self._lock:
+            return self._infos.get(serial_number)
+
+    def put(self, device, info):
+        """Store the DeviceInfo of a device label, saved at once when persistent"""
+        with self._lock:
+            self._devices[device] = info.serial_number
+            self._infos[info.serial_number] = info
+        if self._path is not None:
+            self.save()
+
+    def load(self):
+        """Load the cache from its JSON file
+        -----
+        """
+        with open(self._path, encoding='utf-8') as file:
+            data = json.load(file)
+        with self._lock:
+            self._devices = dict(data['devices'])
+            self._infos = {serial_number: DeviceInfo.from_dict(info) \
+                           for serial_number, info in data['infos'].items()}
+
+    def save(self):
+        """Save the cache to its JSON file, replaced atomically
+        -----
+        """
+        with self._lock:
+            data = {'devices': self._devices, \
+                    'infos': {serial_number: info.as_dict() for serial_number, info in self._infos.items()}}
+            temporary = f'{self._path}.tmp'
+            with open(temporary, 'w', encoding='utf-8') as file:
+                json.dump(data, file, indent=2)
+            os.replace(temporary, self._path)
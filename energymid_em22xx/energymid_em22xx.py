@@ -2,24 +2,82 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from pymodbus.client import ModbusTcpClient as ModBusClient
-from pymodbus import (FramerType, ExceptionResponse, ModbusException)
+import struct
+import time
+from pymodbus import (ExceptionResponse, ModbusException)
+from pymodbus.exceptions import ConnectionException
 from .constants import ModbusConstants as CONSTS
-from .constants import EM22xxFeatures as FEATURE
+from .register_map import INPUT_REGISTERS, HOLDING_REGISTERS, HOLDING_REGISTER_AREAS, SCALING_POINTS, \
+    SCALING_CONFIG_REGISTERS, plan_reads, touches
+from .scaling import ScalingCache
+from .connection import Backoff, CircuitBreaker, enable_keepalive
+from .transport import Transport, TcpTransport
+from .pipelining import TransactionPipeline
+from .decoding import convert_uint16_to_uint8_array, decode_registers, decode_block
+from .snapshot import Snapshot, RawSnapshot
+from .device_info import DeviceInfo
+from .configuration import ConfigReport, desired_registers, plan_writes
+from .instrumentation import FUNCTION_CODES, OK, EXCEPTION, ERROR, REJECTED, record_request
+from .errors import EM22xxError, EM22xxConnectionError, EM22xxCircuitOpenError, EM22xxModbusError, \
+    EM22xxDecodeError, EM22xxUnsupportedError, ErrorStats, classify
+from .measurements import GROUPS, SNAPSHOT_GROUPS, SCALERS, scale_voltages, scale_currents, scale_power, \
+    scale_energy_import, scale_energy_export, points_of, scale_measurements
 
 class EM22xxModbus:
     """Base class for the EM2289 energy meter
+    -----
+    The connection is managed: a lost connection is re-established on the
+    next request, failed connects are retried with exponential backoff and
+    jitter, and a circuit breaker rejects requests to an unreachable device
+    without I/O until its recovery timeout expired.
+
+    The transport is pluggable: pass a TcpTransport, RtuTransport or
+    RtuOverTcpTransport object instead of the ip address. Meters sharing
+    a transport share its client, their requests are serialized on the bus.
+
+    Failed requests do not raise: the methods return False, the typed
+    error is kept as last_error and counted in the error statistics.
+
+    With a pipeline_window the blocks of a planned read are sent without
+    waiting for each response (Modbus TCP only), so a snapshot costs about
+    one round trip instead of one per block.
     """
-    def __init__(self, ip, port = 502, device_unit_id = 0):
+    def __init__(self, ip, port = 502, device_unit_id = 0, max_gap = CONSTS.DEFAULT_MAX_GAP, \
+                 timeout = 3, retries = 3, keepalive = True, backoff = None, breaker = None, \
+                 instrumentation = None, pipeline_window = None):
         """Constructor of EM22xx_Modbus object
         -----
          Args:
-            ip: ip address of device
-            port: port which is used (default 502)
+            ip: ip address of device or a Transport object
+            port: port which is used (default 502, not used with a Transport)
             device_unit_id: UnitID (default 0) 
+            max_gap: max. number of unused registers bridged by the read planner
+            timeout: timeout of one request in seconds (not used with a Transport)
+            retries: retries of one request by pymodbus (not used with a Transport)
+            keepalive: enable TCP keep-alive on the connection (TCP transports only)
+            backoff: Backoff object for reconnects (default: Backoff())
+            breaker: CircuitBreaker object of the device (default: CircuitBreaker())
+            instrumentation: Instrumentation object receiving request, connect and decode events
+            pipeline_window: max. number of outstanding transactions of a planned read
+                             (None: one request after the other)
         """
-        self._client = ModBusClient(ip, port=port, framer=FramerType.SOCKET)
+        self.transport = ip if isinstance(ip, Transport) else TcpTransport(ip, port, timeout, retries)
+        # a shared transport is closed by its owner, see Transport.close
+        self._owns_transport = not isinstance(ip, Transport)
+        self._client = self.transport.client()
         self._device_unit_id = device_unit_id
+        self._max_gap = max_gap
+        self._keepalive = keepalive
+        self._backoff = backoff if backoff is not None else Backoff()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self._next_connect = 0.0
+        self._instrumentation = instrumentation
+        self.device = f'{self.transport.bus}/{device_unit_id}'
+        self._pipeline = None
+        if pipeline_window and pipeline_window > 1 and self.transport.pipelining:
+            self._pipeline = TransactionPipeline(pipeline_window, self.transport.timeout)
+        self.errors = ErrorStats()
+        self.last_error = None
         #print("Device Unit: ", self._device_unit_id)
         self.connect()
 
@@ -29,31 +87,189 @@ class EM22xxModbus:
         del self._client
 
 
-    def connect(self):
+    def connect(self) -> bool:
         """Establish conncetion of client
         -----
+        Returns:
+            True when connected or False when failed
         """
+        start = time.perf_counter()
         try:
-            if not self._client.connect():
-                print("ERROR: client cannot connect to ModBus-Server!")
-            else:
-                #print("INFO: client connected successfully to Modbus-Server!")
-                pass
-        except:
-            print("ERROR: Propably an Syntax Error!")
-
-        finally:
-            pass
+            with self.transport.lock:
+                connected = self._client.connect()
+        except ModbusException:
+            connected = False
+        if self._instrumentation is not None:
+            self._instrumentation.on_connect(self.device, connected, time.perf_counter() - start)
+        if not connected:
+            print("ERROR: client cannot connect to ModBus-Server!")
+            self._next_connect = time.monotonic() + self._backoff.next_delay()
+            self.breaker.record_failure()
+            return False
+        #print("INFO: client connected successfully to Modbus-Server!")
+        self._backoff.reset()
+        self._next_connect = 0.0
+        if self._keepalive and self.transport.keepalive and self._client.socket is not None:
+            enable_keepalive(self._client.socket)
+        return True
 
     def close(self):
-        """Close connection of client
+        """Close connection of client, unless the transport is shared
         -----
         """
-        if self._client.is_socket_open():
+        if self._owns_transport and self._client.is_socket_open():
             self._client.close()
             #print("INFO: Connection closed!")
         return None
 
+    def _ensure_connected(self, register_address):
+        """Reconnect if necessary, without blocking while backing off
+        -----
+        Args:
+            register_address: start register address of the pending request
+
+        Returns:
+            None when connected, otherwise EM22xxCircuitOpenError if rejected
+            without I/O or EM22xxConnectionError if the connect failed
+        """
+        if self._client.is_socket_open():
+            return None
+        if not self.breaker.allow():
+            return EM22xxCircuitOpenError(self.device, register_address, 'circuit open')
+        if time.monotonic() < self._next_connect:
+            return EM22xxCircuitOpenError(self.device, register_address, 'backing off')
+        if not self.connect():
+            return EM22xxConnectionError(self.device, register_address, 'cannot connect')
+        return None
+
+    def _execute(self, caller, request, register_address, **kwargs):
+        """Issue one Modbus request on the managed connection
+        -----
+        A request failing on a stale connection is repeated once
+        on a fresh connection. The bus lock of the transport is held,
+        so meters on a shared bus do not interleave their frames.
+
+        Args:
+            caller: name of the calling method for error messages
+            request: bound request method of the pymodbus client
+            register_address: start register address
+            kwargs: further arguments of the request
+
+        Returns:
+            response: pymodbus response object or False
+        """
+        function_code = FUNCTION_CODES.get(request.__name__, 0)
+        count = kwargs['count'] if 'count' in kwargs else len(kwargs.get('values', ()))
+        with self.transport.lock:
+            for attempt in (1, 2):
+                error = self._ensure_connected(register_address)
+                if error is not None:
+                    self._record(function_code, register_address, count, None, REJECTED)
+                    self._failed(error, request=False)
+                    return False
+                start = time.perf_counter()
+                try:
+                    response = request(register_address, slave=self._device_unit_id, **kwargs)
+                except (ConnectionException, OSError) as exc:
+                    self._record(function_code, register_address, count, start, ERROR)
+                    self._client.close()
+                    if attempt == 1:
+                        continue
+                    print(f">>> {caller}: Received ModbusException({exc}) from library")
+                    self._failed(classify(exc, self.device, register_address))
+                    self.breaker.record_failure()
+                    return False
+                except ModbusException as exc:
+                    self._record(function_code, register_address, count, start, ERROR)
+                    print(f">>> {caller}: Received ModbusException({exc}) from library")
+                    self._failed(classify(exc, self.device, register_address))
+                    self._client.close()
+                    self.breaker.record_failure()
+                    return False
+                break
+        if isinstance(response, ExceptionResponse):
+            # THIS IS NOT A PYTHON EXCEPTION, but a valid modbus message
+            self._record(function_code, register_address, count, start, EXCEPTION)
+            print(f">>> {caller}: Received Modbus library exception ({response})")
+            self._failed(EM22xxModbusError(self.device, register_address, response.exception_code))
+            self.breaker.record_success()
+            return False
+        if response.isError():
+            self._record(function_code, register_address, count, start, ERROR)
+            print(f">>> {caller}: Received Modbus library error({response})")
+            self._failed(EM22xxError(self.device, register_address, str(response)))
+            self._client.close()
+            self.breaker.record_failure()
+            return False
+        self._record(function_code, register_address, count, start, OK)
+        self.breaker.record_success()
+        if function_code in (0x03, 0x04) and len(response.registers) != count:
+            print(f">>> {caller}: Received {len(response.registers)} instead of {count} registers")
+            self._failed(EM22xxDecodeError(self.device, register_address, \
+                                           f'{len(response.registers)} instead of {count} registers'))
+            return False
+        self.errors.record_success()
+        self.last_error = None
+        return response
+
+    def _failed(self, error, request = True):
+        """Keep the error of a failed request and count it, request=False if none was sent"""
+        self.last_error = error
+        self.errors.record_error(error, request)
+
+    def record_error(self, error, request = True):
+        """Keep and count an error detected outside of the object
+        -----
+        E.g. a timeout of the whole read by the caller, it is kept as
+        last_error and counted in errors like a failed request.
+
+        Args:
+            error: EM22xxError of the failure
+            request: False if no request was sent for it
+        """
+        self._failed(error, request)
+
+    def raise_for_error(self):
+        """Raise the error of the last failed request, if any
+        -----
+        Raises:
+            EM22xxError: e.g. EM22xxTimeoutError or EM22xxModbusError
+        """
+        if self.last_error is not None:
+            raise self.last_error
+
+    def _decode(self, register_address, count, decode, *args):
+        """Decode registers of a response, a failure is kept as EM22xxDecodeError
+        -----
+        Args:
+            register_address: start register address of the response
+            count: number of registers
+            decode: decode function called with args
+
+        Returns:
+            decoded data or False
+        """
+        start = time.perf_counter()
+        try:
+            data = decode(*args)
+        except (ValueError, IndexError, struct.error, ModbusException) as exc:
+            print(f">>> decode: Cannot decode registers at {register_address} ({exc})")
+            self._failed(EM22xxDecodeError(self.device, register_address, str(exc)), request=False)
+            return False
+        self._decoded(count, start)
+        return data
+
+    def _record(self, function_code, register_address, count, start, outcome):
+        """Pass a request event to the instrumentation"""
+        if self._instrumentation is not None:
+            record_request(self._instrumentation, self.device, function_code, register_address, \
+                           count, start, outcome)
+
+    def _decoded(self, count, start):
+        """Pass the decode time of count registers to the instrumentation"""
+        if self._instrumentation is not None:
+            self._instrumentation.on_decode(self.device, count, time.perf_counter() - start)
+
     def read_input_register(self, register_address, datatype, count = 1) -> list:
         """Read the input register from EM2289 device
         
@@ -65,26 +281,122 @@ class EM22xxModbus:
             count: number of datatypes to be converted
         
         Returns:
-            data: list of decoded values
+            data: list of decoded values or False
         """
         length = CONSTS.TYPE_TO_LENGTH[datatype] * count
         #print(f'length : {length}')
-        try:
-            result = self._client.read_input_registers(register_address, count=length, \
-                                                     slave=self._device_unit_id)
-            #print(result, type(result))
-        except ModbusException as exc:
-            print(f">>> read_input_register: Received ModbusException({exc}) from library")
-        if result.isError():
-            print(f">>> read_input_register: Received Modbus library error({result})")
-        if isinstance(result, ExceptionResponse):
-            print(f">>> read_input_register: Received Modbus library exception ({result})")
-            # THIS IS NOT A PYTHON EXCEPTION, but a valid modbus message
+        result = self._execute('read_input_register', self._client.read_input_registers, \
+                               register_address, count=length)
+        if result is False:
             return False
         #print(type(result.registers), ": ", result.registers)
-        data = self.decode_register_readings(result, datatype, count)
+        data = self._decode(register_address, length, self.decode_register_readings, result, datatype, count)
         return data
 
+    def read_input_points(self, points) -> dict:
+        """Read several register points with the fewest possible requests
+
+        Read register with function code 0x04
+        -----
+        The points are coalesced into blocks by the read planner,
+        each block is read with one request.
+
+        Args:
+            points: iterable of RegisterPoint objects
+
+        Returns:
+            values: dict of decoded values by point name or False
+        """
+        values = {}
+        blocks = plan_reads(points, max_gap=self._max_gap)
+        batch = None
+        if self._pipeline is not None and len(blocks) > 1:
+            batch = self._read_blocks_pipelined(0x04, blocks)
+            if batch is False:
+                return False
+        for index, block in enumerate(blocks):
+            registers = batch[index] if batch is not None else self._read_input_block(block.address, block.length)
+            if registers is False:
+                return False
+            decoded = self._decode(block.address, block.length, decode_block, block, registers)
+            if decoded is False:
+                return False
+            values.update(decoded)
+        return values
+
+    def _read_input_block(self, register_address, length):
+        """Read a block of raw input registers
+
+        Read register with function code 0x04
+        -----
+        Args:
+            register_address: start register address
+            length: number of registers
+
+        Returns:
+            registers: list of raw 16-bit registers or False
+        """
+        result = self._execute('read_input_points', self._client.read_input_registers, \
+                               register_address, count=length)
+        if result is False:
+            return False
+        return result.registers
+
+    def _read_blocks_pipelined(self, function_code, blocks):
+        """Read planned blocks with several transactions in flight
+        -----
+        Args:
+            function_code: 0x03 or 0x04
+            blocks: list of ReadBlock objects
+
+        Returns:
+            registers: list of raw registers per block or False
+        """
+        with self.transport.lock:
+            error = self._ensure_connected(blocks[0].address)
+            if error is not None:
+                for block in blocks:
+                    self._record(function_code, block.address, block.length, None, REJECTED)
+                self._failed(error, request=False)
+                return False
+            start = time.perf_counter()
+            try:
+                responses = self._pipeline.read(self._client.socket, self._device_unit_id, function_code, \
+                                                [(block.address, block.length) for block in blocks])
+            except OSError as exc:
+                for block in blocks:
+                    self._record(function_code, block.address, block.length, start, ERROR)
+                print(f">>> read_blocks_pipelined: {type(exc).__name__}({exc})")
+                self._pipeline.reset()
+                self._client.close()
+                self._failed(classify(exc, self.device, blocks[0].address))
+                self.breaker.record_failure()
+                return False
+            except ValueError as exc:
+                for block in blocks:
+                    self._record(function_code, block.address, block.length, start, ERROR)
+                print(f">>> read_blocks_pipelined: Received unexpected response ({exc})")
+                # the transactions in flight cannot be trusted any more
+                self._pipeline.reset()
+                self._client.close()
+                self._failed(EM22xxDecodeError(self.device, blocks[0].address, str(exc)))
+                return False
+        self.breaker.record_success()
+        for block, response in zip(blocks, responses):
+            if isinstance(response, int):
+                self._record(function_code, block.address, block.length, start, EXCEPTION)
+                print(f">>> read_blocks_pipelined: Received Modbus exception {response} at {block.address}")
+                self._failed(EM22xxModbusError(self.device, block.address, response))
+                return False
+            self._record(function_code, block.address, block.length, start, OK)
+            if len(response) != block.length:
+                self._failed(EM22xxDecodeError(self.device, block.address, \
+                                               f'{len(response)} instead of {block.length} registers'))
+                return False
+            self.errors.record_success()
+        self.last_error = None
+        return responses
+
     def read_holding_register(self, register_address, datatype, count = 1) -> list:
         """Read the inoput register from EM2289 device
         
@@ -96,37 +408,80 @@ class EM22xxModbus:
             count: number of datatypes to be converted
         
         Returns:
-            data: list of decoded values
+            data: list of decoded values or False
         """
         length = CONSTS.TYPE_TO_LENGTH[datatype] * count
         #print(f'length : {length}')
-        try:
-            result = self._client.read_holding_registers(register_address, \
-                count=length, slave=self._device_unit_id)
-            #print(result, type(result))
-        except ModbusException as exc:
-            print(f">>> read_holding_register: Received ModbusException({exc}) from library")
-        if result.isError():
-            print(f">>> read_holding_register: Received Modbus library error({result})")
-        if isinstance(result, ExceptionResponse):
-            print(f">>> read_holding_register: Received Modbus library exception ({result})")
-            # THIS IS NOT A PYTHON EXCEPTION, but a valid modbus message
+        result = self._execute('read_holding_register', self._client.read_holding_registers, \
+                               register_address, count=length)
+        if result is False:
             return False
         #print(type(result.registers), ": ", result.registers)
-        data = self.decode_register_readings(result, datatype, count)
+        data = self._decode(register_address, length, self.decode_register_readings, result, datatype, count)
         return data
 
+    def read_holding_points(self, points) -> dict:
+        """Read several holding register points with the fewest possible requests
+
+        Read register with function code 0x03
+        -----
+        Args:
+            points: iterable of RegisterPoint objects, see register_map.HOLDING_REGISTERS
+
+        Returns:
+            values: dict of decoded values by point name or False
+        """
+        values = {}
+        blocks = plan_reads(points, max_gap=self._max_gap, areas=HOLDING_REGISTER_AREAS)
+        batch = None
+        if self._pipeline is not None and len(blocks) > 1:
+            batch = self._read_blocks_pipelined(0x03, blocks)
+            if batch is False:
+                return False
+        for index, block in enumerate(blocks):
+            if batch is not None:
+                registers = batch[index]
+            else:
+                result = self._execute('read_holding_points', self._client.read_holding_registers, \
+                                       block.address, count=block.length)
+                if result is False:
+                    return False
+                registers = result.registers
+            decoded = self._decode(block.address, block.length, decode_block, block, registers)
+            if decoded is False:
+                return False
+            values.update(decoded)
+        return values
+
+    def write_holding_registers(self, register_address, values) -> bool:
+        """Write holding registers of the EM2289 device
+
+        Write registers with function code 0x10
+        -----
+        Args:
+            register_address: start register address
+            values: list of raw 16-bit register values
+
+        Returns:
+            True when successful or False when failed
+        """
+        response = self._execute('write_holding_registers', self._client.write_registers, \
+                                 register_address, values=values)
+        if response is False:
+            return False
+        self._registers_written(register_address, len(values))
+        return True
+
+    def _registers_written(self, register_address, count):
+        """Hook called after holding registers were written successfully"""
+        return None
+
     def convert_uint16_to_uint8_array(self, uint16_array, count):
         """
         Convert an 16-bit array into an 8-bit array,
         and return only specific number of elements by count
         """
-        uint8_array = []
-        for value in (uint16_array):
-            high_byte = (value >> 8) & 0xFF
-            low_byte = value & 0xFF
-            uint8_array.extend([high_byte, low_byte])
-        return uint8_array[0:count]
+        return convert_uint16_to_uint8_array(uint16_array, count)
 
     def decode_register_readings(self, readings, datatype, count) -> list:
         """Decode the register readings 
@@ -142,23 +497,22 @@ class EM22xxModbus:
             data: list of decoded values
         """
         #print(f'decoder : {decoder}')
-        data = []
-        if datatype == 'U8':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT16)
-            data = self.convert_uint16_to_uint8_array(data, count)
-        elif datatype == 'U16':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT16)
-        elif datatype == 'U32':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT32)
-        elif datatype == 'U64':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.UINT64)
-        elif datatype == 'S16':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.INT16)
-        elif datatype == 'S32':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.INT32)
-        elif datatype == 'S64':
-            data = self._client.convert_from_registers(readings.registers, data_type=self._client.DATATYPE.INT64)
-        return data
+        return self.decode_registers(readings.registers, datatype, count)
+
+    def decode_registers(self, registers, datatype, count) -> list:
+        """Decode a list of raw registers
+
+        Decode registers depending on datatype given
+        -----
+        Args:
+            registers: list of raw 16-bit registers
+            datatype: U16, U32 , etc...
+            count: number of datatypes to be converted
+
+        Returns:
+            data: list of decoded values
+        """
+        return decode_registers(registers, datatype, count)
 
 
 class EnergyMIDEM22xx(EM22xxModbus):
@@ -174,6 +528,177 @@ class EnergyMIDEM22xx(EM22xxModbus):
 
        site: https://www.gossenmetrawatt.de/produkte/messen-steuern-regeln/energiemanagement/mid-zertifizierte-energiezaehler/energymid-em2281em2389
     """
+    def __init__(self, ip, port = 502, device_unit_id = 0, max_gap = CONSTS.DEFAULT_MAX_GAP, \
+                 scaling_ttl = 600, refresh_scaling_on_write = True, device_info_cache = None, \
+                 capability_aware = True, **kwargs):
+        """Constructor of EnergyMIDEM22xx object
+        -----
+         Args:
+            ip: ip address of device
+            port: port which is used (default 502)
+            device_unit_id: UnitID (default 0)
+            max_gap: max. number of unused registers bridged by the read planner
+            scaling_ttl: seconds exponents and energy factors are cached (None: forever)
+            refresh_scaling_on_write: invalidate the cache when CT/VT registers are written
+            device_info_cache: DeviceInfoCache object shared by many meters (None: per object only)
+            capability_aware: skip the groups the device does not measure, see supports()
+            kwargs: connection arguments of EM22xxModbus (timeout, retries, keepalive, ...)
+        """
+        self._scaling_cache = ScalingCache(scaling_ttl)
+        self._refresh_scaling_on_write = refresh_scaling_on_write
+        self._device_info_cache = device_info_cache
+        self._device_info = None
+        # a failed identity read is not repeated before the backoff delay
+        self._device_info_backoff = Backoff(5.0, 300.0)
+        self._device_info_retry_at = 0.0
+        self._capability_aware = capability_aware
+        super().__init__(ip, port=port, device_unit_id=device_unit_id, max_gap=max_gap, **kwargs)
+
+    def read_points(self, *names) -> dict:
+        """Read register points of the register map by name
+
+        All requested points are read with the fewest possible requests
+        -----
+        Exponents and energy factors are served from the scaling cache
+        and only read from the device when missing or expired.
+
+        Args:
+            names: names of the points, see register_map.INPUT_REGISTERS
+
+        Returns:
+            values: dict of decoded values by point name or False
+        """
+        values = {}
+        points = []
+        for name in names:
+            if name in SCALING_POINTS:
+                cached = self._scaling_cache.get(name)
+                if cached is not None:
+                    values[name] = cached
+                    continue
+            points.append(INPUT_REGISTERS[name])
+        if points:
+            readings = self.read_input_points(points)
+            if readings is False:
+                return False
+            for name in SCALING_POINTS.intersection(readings):
+                self._scaling_cache.set(name, readings[name])
+            values.update(readings)
+        return values
+
+    def read_measurements(self, *groups) -> dict:
+        """Read several measurement groups in one planned batch
+        -----
+        Args:
+            groups: names of the groups, see measurements.GROUPS (default: SNAPSHOT_GROUPS)
+
+        Returns:
+            measurements: dict of scaled values by group name or False,
+                          groups the device does not measure are left out
+        """
+        groups = self._supported(groups or SNAPSHOT_GROUPS)
+        if groups is False:
+            return False
+        if not groups:
+            return {}
+        values = self.read_points(*points_of(*groups))
+        if values is False:
+            return False
+        return scale_measurements(values, groups)
+
+    def read_snapshot(self) -> Snapshot:
+        """Read all measurement groups in one planned batch
+        -----
+        Returns:
+            snapshot: Snapshot object or False
+        """
+        timestamp = time.time()
+        measurements = self.read_measurements()
+        if measurements is False:
+            return False
+        return Snapshot.from_measurements(timestamp, measurements)
+
+    def read_raw_snapshot(self) -> RawSnapshot:
+        """Read all measurement groups in one planned batch without scaling
+        -----
+        Returns:
+            snapshot: RawSnapshot object or False
+        """
+        timestamp = time.time()
+        groups = self._supported(SNAPSHOT_GROUPS)
+        if groups is False:
+            return False
+        values = self.read_points(*points_of(*groups))
+        if values is False:
+            return False
+        return RawSnapshot.from_values(timestamp, values)
+
+    def invalidate_scaling(self):
+        """Drop the cached exponents and energy factors
+
+        The next getter call re-reads them from the device
+        -----
+        """
+        self._scaling_cache.invalidate()
+
+    def supports(self, group) -> bool:
+        """Check if the device measures a measurement group
+
+        Decided by the feature code M of the cached device identity
+        -----
+        Energy-only meters (M0, M2) have no voltages, currents, power and
+        further multifunction measurements. Every group is assumed to be
+        supported without capability awareness or a readable identity.
+
+        Args:
+            group: name of the group, see measurements.GROUPS
+
+        Returns:
+            True when supported or False
+        """
+        if not self._capability_aware:
+            return True
+        info = self.device_info()
+        return info is None or info.supports(group)
+
+    def _supported(self, groups) -> tuple:
+        """The groups the device measures, the identity is looked up once for all, False if not connected"""
+        if not self._capability_aware:
+            return tuple(groups)
+        failures = self.errors.failures
+        info = self.device_info()
+        if info is None and self.errors.failures > failures and isinstance(self.last_error, EM22xxConnectionError):
+            # not connected, keep the error instead of rejecting the batch as well
+            return False
+        return tuple(group for group in groups if info is None or info.supports(group))
+
+    def _unsupported(self, group):
+        """Keep the error of a group the device does not measure, returns False"""
+        print(f">>> {group}: not measured by the device {self.device}")
+        self._failed(EM22xxUnsupportedError(self.device, None, f'{group} not measured'), request=False)
+        return False
+
+    def read_group(self, group):
+        """Read and scale one measurement group
+        -----
+        Args:
+            group: name of the group, see measurements.GROUPS
+
+        Returns:
+            scaled values of the group or False
+        """
+        if not self.supports(group):
+            return self._unsupported(group)
+        values = self.read_points(*GROUPS[group])
+        if values is False:
+            return False
+        return SCALERS[group](values)
+
+    def _registers_written(self, register_address, count):
+        """Invalidate the scaling cache when a CT/VT register was written"""
+        if self._refresh_scaling_on_write and \
+           any(touches(point, register_address, count) for point in SCALING_CONFIG_REGISTERS):
+            self.invalidate_scaling()
 
     def get_voltages_primary(self) -> tuple:
         """Get voltages
@@ -190,21 +715,20 @@ class EnergyMIDEM22xx(EM22xxModbus):
             U1N, U2N, U3N, mean U(L1, L2, L3)
 
         Returns:
-            (u_12, u_23, u_31, u_mean_12_23_31, u_1n, u_2n, u_3n, u_mean_123)
+            (u_12, u_23, u_31, u_mean_12_23_31, u_1n, u_2n, u_3n, u_mean_123) or False
         -----
         Register address: 12, 0-7; S16
         Function code: 0x04; read input registers
         Unit: V
         """
-        # first query the exponent
-        exponent = self.read_input_register(12, 'S16')
-        factor = 10**exponent
-        #print("Faktor: ", factor)
-
-        # read the voltages (mantissa)
-        voltages = self.read_input_register(0, 'S16', 8)
+        # query the exponent and the voltages (mantissa) in one request
+        if not self.supports('voltages'):
+            return self._unsupported('voltages')
+        values = self.read_points(*GROUPS['voltages'])
+        if values is False:
+            return False
         # tuple has format: (u_12, u_23, u_31, u_mean_12_23_31, u_1n, u_2n, u_3n, u_mean_123)
-        u = tuple(round(i*factor, 1) for i in voltages)
+        u = scale_voltages(values)
         #print(f"tuple of u: {u} V")
         #print(f"U12:\t{u[0]} V")
         #print(f"U23:\t{u[1]} V")
@@ -230,21 +754,20 @@ class EnergyMIDEM22xx(EM22xxModbus):
             i1, i2, i3, i mean123, i_n
         
         Returns:
-            (i_1, i_2, i_3, i_mean_123, i_n)
+            (i_1, i_2, i_3, i_mean_123, i_n) or False
         -----
         Register address: 108, 100-104; S16
         Function code: 0x04; read input registers
         Unit: A
         """
-        # first query the exponent
-        exponent = self.read_input_register(108, 'S16')
-        factor = 10**exponent
-        #print("Faktor: ", factor)
-
-        # read the currents (mantissa)
-        currents = self.read_input_register(100, 'S16', 5)
+        # query the exponent and the currents (mantissa) in one request
+        if not self.supports('currents'):
+            return self._unsupported('currents')
+        values = self.read_points(*GROUPS['currents'])
+        if values is False:
+            return False
         # tuple has format: (i_1, i_2, i_3, i_mean_123, i_n)
-        i = tuple(round(i*factor, 2) for i in currents)
+        i = scale_currents(values)
         #print(f"tuple of i: {i} A")
         #print(f"I 1:\t\t{i_1} A")
         #print(f"I 2:\t\t{i_2} A")
@@ -264,21 +787,20 @@ class EnergyMIDEM22xx(EM22xxModbus):
         Read the primary power 
             p1, p2, p3, p_tot
         Returns:
-            (p_1, p_2, p_3, p_tot)
+            (p_1, p_2, p_3, p_tot) or False
         -----
         Register address: 212, 200-203; S16
         Function code: 0x04; read input registers
         Unit: W
         """
-        # first query the exponent
-        exponent = self.read_input_register(212, 'S16')
-        factor = 10**exponent
-        #print("Faktor: ", factor)
-
-        # read the power (mantissa)
-        powers = self.read_input_register(200, 'S16', 4)
+        # query the exponent and the power (mantissa) in one request
+        if not self.supports('power'):
+            return self._unsupported('power')
+        values = self.read_points(*GROUPS['power'])
+        if values is False:
+            return False
         # tuple has format: (p_1, p_2, p_3, p_tot)
-        p = tuple(round(i*factor, 2) for i in powers)
+        p = scale_power(values)
         #print(f"tuple of p: {p} W")
         #print(f"P 1:\t{p[0]} W")
         #print(f"P 2:\t{p[1]} W")
@@ -297,18 +819,18 @@ class EnergyMIDEM22xx(EM22xxModbus):
            mantissa * 10 ^ exponent
         
         Returns:
-            energy_import
+            energy_import or False
         -----
         Register address: 408, 300; U32
         Function code: 0x04; read input registers
         Unit: kWh
         """
-        # first query Primary Energy factor
-        energy_factor_primary = self.read_input_register(408, 'U32')
-        #print("Energie Faktor Primär: ", energy_factor_primary
-        # read the mantissa of import total
-        mantissa_import_total = self.read_input_register(300, 'U32')
-        energy_import = mantissa_import_total * energy_factor_primary / 1000
+        # query Primary Energy factor and the mantissa of import total
+        values = self.read_points(*GROUPS['energy_import'])
+        if values is False:
+            return False
+        #print("Energie Faktor Primär: ", values['energy_factor'])
+        energy_import = scale_energy_import(values)
         #print("Energy import:\t", energy_import)
         return energy_import
 
@@ -323,79 +845,230 @@ class EnergyMIDEM22xx(EM22xxModbus):
            mantissa * 10 ^ exponent
         
         Returns:
-            energy_export
+            energy_export or False
         -----
         Register address: 408, 302; U32
         Function code: 0x04; read input registers
         Unit: kWh
         """
-        # first query Primary Energy factor
-        energy_factor_primary = self.read_input_register(408, 'U32')
-        #print("Energie Faktor Primär: ", energy_factor_primary
-        # read the mantissa of export total
-        mantissa_export_total = self.read_input_register(302, 'U32')
-        energy_export = mantissa_export_total * energy_factor_primary / 1000
+        # query Primary Energy factor and the mantissa of export total
+        values = self.read_points(*GROUPS['energy_export'])
+        if values is False:
+            return False
+        #print("Energie Faktor Primär: ", values['energy_factor'])
+        energy_export = scale_energy_export(values)
         #print("Energy export:\t", energy_export)
         return energy_export
 
-    def read_device_features(self):
-        """Read the device fetures of the EM22xx device
+    def get_reactive_power_primary(self) -> tuple:
+        """Get primary reactive power
+        -----
+        Returns:
+            (q_1, q_2, q_3, q_tot) or False
+        -----
+        Register address: 212, 204-207; S16
+        Function code: 0x04; read input registers
+        Unit: var
+        """
+        return self.read_group('reactive_power')
+
+    def get_apparent_power_primary(self) -> tuple:
+        """Get primary apparent power
+
+        The meter has no register for S, it is derived as sqrt(P² + Q²)
+        -----
+        Returns:
+            (s_1, s_2, s_3, s_tot) or False
+        -----
+        Register address: 212, 200-207; S16
+        Function code: 0x04; read input registers
+        Unit: VA
+        """
+        return self.read_group('apparent_power')
+
+    def get_power_factors(self) -> tuple:
+        """Get power factors
+        -----
+        Returns:
+            (pf_1, pf_2, pf_3, pf_tot) or False
+        -----
+        Register address: 208-211; S16
+        Function code: 0x04; read input registers
+        """
+        return self.read_group('power_factor')
+
+    def get_frequency(self) -> float:
+        """Get frequency
+        -----
+        Returns:
+            frequency or False
+        -----
+        Register address: 11; U16
+        Function code: 0x04; read input registers
+        Unit: Hz
+        """
+        return self.read_group('frequency')
+
+    def get_thd_voltages(self) -> tuple:
+        """Get THD of the phase voltages
+        -----
+        Returns:
+            (thd_u_1n, thd_u_2n, thd_u_3n) as ratio or False
+        -----
+        Register address: 8-10; U16
+        Function code: 0x04; read input registers
+        """
+        return self.read_group('thd_voltages')
+
+    def get_thd_currents(self) -> tuple:
+        """Get THD of the phase currents
+        -----
+        Returns:
+            (thd_i_1, thd_i_2, thd_i_3) as ratio or False
+        -----
+        Register address: 105-107; U16
+        Function code: 0x04; read input registers
+        """
+        return self.read_group('thd_currents')
+
+    def device_info(self, refresh = False) -> DeviceInfo:
+        """Return the identity of the device
+
+        Read once, afterwards returned without I/O
+        -----
+        Registers 3000..3012 are read with one request and parsed into
+        a DeviceInfo, which is kept by the object and in the
+        DeviceInfoCache, if any. After a failed read None is returned
+        without I/O until a backoff delay passed or refresh is given.
+
+        Args:
+            refresh: read the identity from the device again
+
+        Returns:
+            info: DeviceInfo object or None
+        """
+        if not refresh:
+            if self._device_info is not None:
+                return self._device_info
+            if self._device_info_cache is not None:
+                self._device_info = self._device_info_cache.get(self.device)
+                if self._device_info is not None:
+                    return self._device_info
+            if time.monotonic() < self._device_info_retry_at:
+                return None
+        values = self.read_points('device_identity', 'firmware_version')
+        if values is False:
+            self._device_info_retry_at = time.monotonic() + self._device_info_backoff.next_delay()
+            return None
+        self._device_info_backoff.reset()
+        self._device_info_retry_at = 0.0
+        self._device_info = DeviceInfo.from_registers(values['device_identity'], values['firmware_version'])
+        if self._device_info_cache is not None:
+            self._device_info_cache.put(self.device, self._device_info)
+        return self._device_info
+
+    def read_device_features(self) -> DeviceInfo:
+        """Print the device fetures of the EM22xx device
         -----
         Register address: 3000; U8
         Function code: 0x04; read input registers
+
+        Returns:
+            info: DeviceInfo object or None
         """
         print("Device Features")
-        features = self.read_input_register(3000, 'U8', 11)
-        #print(features)
-        print(f'\tType: {FEATURE.TYPE[features[0]]}')
-        print(f'\tD   : {FEATURE.D[features[1]]}')
-        print(f'\tH   : {FEATURE.H[features[2]]}')
-        print(f'\tM   : {FEATURE.M[features[3]]}')
-        print(f'\tP   : {FEATURE.P[features[4]]}')
-        print(f'\tQ   : {FEATURE.Q[features[5]]}')
-        print(f'\tU   : {FEATURE.U[features[6]]}')
-        print(f'\tV   : {FEATURE.V[features[7]]}')
-        print(f'\tW   : {FEATURE.W[features[8]]}')
-        print(f'\tZ   : {FEATURE.Z[features[9]]}')
-        print(f'\tS   : {FEATURE.S[features[10]]}\n')
-        return None
+        info = self.device_info()
+        if info is None:
+            return None
+        print(f'\tType: {info.type_name}')
+        for option in info.options:
+            print(f'\t{option}   : {info.describe(option)}')
+        print()
+        return info
 
-    def read_firmware_version(self):
-        """Read the firmware version
+    def read_firmware_version(self) -> DeviceInfo:
+        """Print the firmware version
         -----
         Register address: 3012; U16
         Function code: 0x04; read input registers
+
+        Returns:
+            info: DeviceInfo object or None
         """
         print("Firmware Version")
-        version = self.read_input_register(3012, 'U16')
-        #print(version)
-        version_arr = [*str(version)]
-        version_str = f'v{version_arr[0]:}.{version_arr[1]:}{version_arr[2]:}'
-        print(f'\tversion :{version_str}')
-        return None
+        info = self.device_info()
+        if info is None:
+            return None
+        print(f'\tversion :{info.firmware}')
+        return info
 
-    def read_device_information(self):
-        """Read Device Information
+    def read_device_information(self) -> DeviceInfo:
+        """Print Device Information
 
-        Read device options and informations
+        Print device options and informations
         -----
         Register address: 3000;
         Function code: 0x04; read input registers
+
+        Returns:
+            info: DeviceInfo object or None
         """
         print("Device Information")
-        readings = self.read_input_register(3000, 'U8', 23)
-        print(readings)
-        features = readings[0:11]
-        print(features)
-        serial_number = readings[11:19]
-        print(serial_number)
-        calibration_day = readings[19]
-        print(calibration_day)
-        calibration_month = readings[20]
-        print(calibration_month)
-        calibration_year = (readings[22] << 8) | readings[21]
-        print(calibration_year)
-        return None
+        info = self.device_info()
+        if info is None:
+            return None
+        print(f'\ttype              : {info.type_name}')
+        print(f'\tfeatures          : {info.options}')
+        print(f'\tserial number     : {info.serial_number}')
+        print(f'\tcalibration date  : {info.calibration_date}')
+        print(f'\tfirmware version  : {info.firmware}')
+        return info
+
+    def apply_configuration(self, desired, verify = True) -> ConfigReport:
+        """Apply a holding register configuration
+
+        Write only what differs from the device
+        -----
+        The configured points are read with the fewest requests of the
+        planner, the changed registers are written in contiguous ranges
+        with function code 0x10 and the result is verified by reading
+        the points back once.
+
+        Args:
+            desired: dict of values by holding point name, e.g. {'webserver': 0, 'tariff': 1}
+            verify: read the points back after writing and compare
+
+        Returns:
+            report: ConfigReport object
+        """
+        target = desired_registers(desired)
+        points = [HOLDING_REGISTERS[name] for name in desired]
+        start = self.errors.requests
+        before = self.read_holding_points(points)
+        if before is False:
+            return ConfigReport(self.device, None, (), self.errors.requests - start, None, self.last_error)
+        writes = plan_writes(desired_registers(before), target)
+        written = set()
+        for register_address, values in writes:
+            if not self.write_holding_registers(register_address, values):
+                return ConfigReport(self.device, before, self._points_in(points, written), \
+                                    self.errors.requests - start, None, self.last_error)
+            written.update(range(register_address, register_address + len(values)))
+        changed = self._points_in(points, written)
+        verified = None
+        if writes and verify:
+            after = self.read_holding_points(points)
+            if after is False:
+                return ConfigReport(self.device, before, changed, self.errors.requests - start, None, self.last_error)
+            verified = desired_registers(after) == target
+            if not verified:
+                print(f">>> apply_configuration: read-back of {self.device} differs: {after}")
+        return ConfigReport(self.device, before, changed, self.errors.requests - start, verified, None)
+
+    @staticmethod
+    def _points_in(points, addresses) -> tuple:
+        """Names of the points with at least one register in addresses"""
+        return tuple(point.name for point in points if any(touches(point, address, 1) for address in addresses))
 
     def read_webserver_status(self) -> int:
         """Read the webserver status
@@ -406,6 +1079,8 @@ class EnergyMIDEM22xx(EM22xxModbus):
         Function code: 0x03; read holding registers
         """
         status = self.read_holding_register(11000, 'U16')
+        if status is False:
+            return False
         if status:
             print(">>> Webserver is enabled!")
         else:
@@ -422,8 +1097,7 @@ class EnergyMIDEM22xx(EM22xxModbus):
         Function code: 0x10; write_registers
         """
         register_value = self._client.convert_to_registers(0, data_type=self._client.DATATYPE.UINT16)
-        response = self._client.write_registers(11000, values=register_value, slave=self._device_unit_id)
-        if response.isError():
+        if not self.write_holding_registers(11000, register_value):
             print("Error during disabling webserver!")
             return False
         else:
@@ -440,8 +1114,7 @@ class EnergyMIDEM22xx(EM22xxModbus):
         Function code: 0x10; write_registers
         """
         register_value = self._client.convert_to_registers(1, data_type=self._client.DATATYPE.UINT16)
-        response = self._client.write_registers(11000, values=register_value, slave=self._device_unit_id)
-        if response.isError():
+        if not self.write_holding_registers(11000, register_value):
             print("Error during enabling webserver!")
             return False
         else:
@@ -0,0 +1,132 @@
+"""module providing the typed errors and per-device error statistics of EM22xx requests"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from pymodbus.exceptions import ConnectionException, ModbusIOException
+
+
+class EM22xxError(Exception):
+    """Base class of all EM22xx request errors
+    -----
+    The clients do not raise these errors on a failed read, they return
+    False and keep the error as last_error, so polling many devices needs
+    no try/except. Call raise_for_error() to turn it into an exception.
+
+    Args:
+        device: device label "ip:port/unit"
+        address: start register address of the failed request (None: unknown)
+        message: description of the error
+    """
+    # a retry may succeed, e.g. after a timeout or on a new connection
+    retryable = False
+    kind = 'error'
+
+    def __init__(self, device, address = None, message = ''):
+        super().__init__(f'{device}: {message}' + (f' (register {address})' if address is not None else ''))
+        self.device = device
+        self.address = address
+
+
+class EM22xxConnectionError(EM22xxError):
+    """No connection to the device or the connection was lost"""
+    retryable = True
+    kind = 'connection'
+
+
+class EM22xxCircuitOpenError(EM22xxConnectionError):
+    """The request was not sent, the circuit breaker of the device is open or reconnects back off"""
+    retryable = False
+    kind = 'circuit_open'
+
+
+class EM22xxTimeoutError(EM22xxError):
+    """The device did not answer within the timeout"""
+    retryable = True
+    kind = 'timeout'
+
+
+class EM22xxModbusError(EM22xxError):
+    """The device answered with a Modbus exception response
+
+    Args:
+        exception_code: Modbus exception code, see EXCEPTION_CODES
+    """
+    kind = 'modbus_exception'
+
+    # exception codes of the EM22xx, see the TCP interface description
+    EXCEPTION_CODES = {1: 'illegal function', 2: 'illegal data address', 3: 'illegal data value', \
+                       4: 'slave device failure', 6: 'slave device busy'}
+
+    def __init__(self, device, address, exception_code):
+        description = self.EXCEPTION_CODES.get(exception_code, 'unknown')
+        super().__init__(device, address, f'Modbus exception {exception_code:02d} ({description})')
+        self.exception_code = exception_code
+        # the device is busy, a later request may succeed
+        self.retryable = exception_code in (4, 6)
+
+
+class EM22xxUnsupportedError(EM22xxError):
+    """The request was not sent, the device does not measure the group (see feature M)"""
+    kind = 'unsupported'
+
+
+class EM22xxDecodeError(EM22xxError):
+    """The response could not be decoded, e.g. too few registers"""
+    kind = 'decode'
+
+
+def classify(exc, device, address = None) -> EM22xxError:
+    """Convert an exception of pymodbus or the socket layer into an EM22xxError"""
+    if isinstance(exc, EM22xxError):
+        return exc
+    if isinstance(exc, ModbusIOException):
+        return EM22xxTimeoutError(device, address, str(exc))
+    # socket timeouts are OSErrors as well
+    if isinstance(exc, TimeoutError):
+        return EM22xxTimeoutError(device, address, 'timeout')
+    if isinstance(exc, (ConnectionException, OSError)):
+        return EM22xxConnectionError(device, address, str(exc))
+    return EM22xxError(device, address, f'{type(exc).__name__}: {exc}')
+
+
+class ErrorStats:
+    """Error counters of one device, updated in constant time per request"""
+    __slots__ = ('requests', 'failures', 'consecutive_failures', 'by_kind', 'last_error', 'last_success')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.by_kind = {}
+        self.last_error = None
+        self.last_success = None
+
+    def record_success(self):
+        """Account a successful request"""
+        self.requests += 1
+        self.consecutive_failures = 0
+        self.last_success = time.time()
+
+    def record_error(self, error, request = True):
+        """Account a failed request with its EM22xxError
+        -----
+        Args:
+            error: EM22xxError of the failure
+            request: False for a failure without a request of its own, e.g.
+                     a decode error after a successful request
+        """
+        self.requests += request
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.by_kind[error.kind] = self.by_kind.get(error.kind, 0) + 1
+        self.last_error = error
+
+    @property
+    def error_rate(self) -> float:
+        """Share of failed requests, failures without a request count as well"""
+        return min(self.failures / self.requests, 1.0) if self.requests else 0.0
+
+    def __repr__(self):
+        return f'ErrorStats(requests={self.requests}, failures={self.failures}, ' \
+               f'consecutive_failures={self.consecutive_failures}, by_kind={self.by_kind})'
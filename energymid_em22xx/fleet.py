@@ -0,0 +1,236 @@
+"""module for polling a fleet of EM22xx devices with a thread pool"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from .energymid_em22xx import EnergyMIDEM22xx
+from .errors import EM22xxCircuitOpenError, classify
+from .configuration import ConfigReport, desired_registers
+from .transport import Transport, bus_of
+
+
+PollResult = namedtuple('PollResult', ['device', 'measurements', 'latency', 'error'])
+PollResult.__doc__ = """Result of polling one device
+    -----
+    device: (ip, port, device_unit_id) or (transport, device_unit_id)
+    measurements: dict of read_measurements() or None on error
+    latency: duration of the poll in seconds
+    error: None or the EM22xxError of the failed poll
+    """
+
+
+class DeviceStats:
+    """Latency and error counters of one device"""
+    __slots__ = ('polls', 'errors', 'last_latency', 'total_latency', 'max_latency')
+
+    def __init__(self):
+        self.polls = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        """Mean latency of all polls in seconds"""
+        return self.total_latency / self.polls if self.polls else 0.0
+
+    def update(self, latency, failed):
+        """Account one poll"""
+        self.polls += 1
+        self.errors += failed
+        self.last_latency = latency
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def __repr__(self):
+        return f'DeviceStats(polls={self.polls}, errors={self.errors}, ' \
+               f'mean_latency={self.mean_latency:.4f}, max_latency={self.max_latency:.4f})'
+
+
+class FleetPoller:
+    """Poll many EM22xx devices in parallel with a bounded thread pool
+    -----
+    One EnergyMIDEM22xx connection per device is created on first use
+    and reused for all following polls. Devices whose circuit breaker
+    is open are skipped without I/O, retryable errors (timeouts, lost
+    connections) are retried up to retries times.
+
+    The scheduling is bus-aware: devices on the same bus (a shared
+    Transport or the same ip:port of a gateway) are polled one after
+    another by one worker, different buses in parallel.
+
+    Usage:
+        with FleetPoller([("192.168.178.253", 502, 0)], max_workers=8) as poller:
+            for result in poller.poll():
+                print(result.device, result.measurements)
+
+        bus = RtuTransport("/dev/ttyUSB0")
+        with FleetPoller([(bus, 1), (bus, 2), ("192.168.178.253", 502, 0)]) as poller:
+            ...
+    """
+    def __init__(self, devices, max_workers = 8, retries = 0, **kwargs):
+        """Constructor of FleetPoller object
+        -----
+        Args:
+            devices: iterable of (ip, port, device_unit_id) or (transport, device_unit_id)
+            max_workers: max. number of buses polled at once
+            retries: retries of a poll failing with a retryable error
+            kwargs: further arguments of EnergyMIDEM22xx
+        """
+        self._devices = list(dict.fromkeys(tuple(device) for device in devices))
+        self._kwargs = kwargs
+        self._retries = retries
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='em22xx-poll')
+        self._meters = {}
+        self._lock = threading.Lock()
+        self.stats = {device: DeviceStats() for device in self._devices}
+        self._buses = {}
+        for device in self._devices:
+            self._buses.setdefault(bus_of(device), []).append(device)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the thread pool and close all connections
+        -----
+        """
+        self._executor.shutdown(wait=True)
+        for meter in self._meters.values():
+            meter.close()
+        self._meters.clear()
+
+    def set_devices(self, devices):
+        """Replace the polled devices, e.g. after a rebalance of the collector
+        -----
+        The connections of kept devices are reused, the ones of removed
+        devices are closed. Must not be called while poll() is running.
+
+        Args:
+            devices: iterable of (ip, port, device_unit_id) or (transport, device_unit_id)
+        """
+        self._devices = list(dict.fromkeys(tuple(device) for device in devices))
+        with self._lock:
+            for device in set(self._meters) - set(self._devices):
+                self._meters.pop(device).close()
+            self.stats = {device: self.stats.get(device) or DeviceStats() for device in self._devices}
+        self._buses = {}
+        for device in self._devices:
+            self._buses.setdefault(bus_of(device), []).append(device)
+
+    def _meter(self, device):
+        """Return the connection of a device, create it on first use"""
+        meter = self._meters.get(device)
+        if meter is None:
+            if isinstance(device[0], Transport):
+                meter = EnergyMIDEM22xx(device[0], device_unit_id=device[1], **self._kwargs)
+            else:
+                ip, port, device_unit_id = device
+                meter = EnergyMIDEM22xx(ip, port=port, device_unit_id=device_unit_id, **self._kwargs)
+            with self._lock:
+                self._meters[device] = meter
+        return meter
+
+    def _poll_device(self, device, groups):
+        """Poll one device, runs inside the thread pool"""
+        start = time.perf_counter()
+        measurements = None
+        error = None
+        meter = None
+        for _ in range(self._retries + 1):
+            try:
+                meter = self._meter(device)
+                measurements = meter.read_measurements(*groups)
+            except Exception as exc:
+                measurements = False
+                error = classify(exc, f'{bus_of(device)}/{device[-1]}')
+            else:
+                error = meter.last_error if measurements is False else None
+            if error is None or not error.retryable:
+                break
+        if measurements is False:
+            measurements = None
+        latency = time.perf_counter() - start
+        with self._lock:
+            self.stats[device].update(latency, error is not None)
+        return PollResult(device, measurements, latency, error)
+
+    def _poll_bus(self, devices, groups) -> list:
+        """Poll the devices of one bus one after another, runs inside the thread pool"""
+        return [self._poll_device(device, groups) for device in devices]
+
+    def _configure_bus(self, devices, desired, verify) -> list:
+        """Apply the configuration to the devices of one bus, runs inside the thread pool"""
+        reports = []
+        for device in devices:
+            try:
+                configuration = desired(device) if callable(desired) else desired
+                # raise on unknown points or values out of range before any request
+                desired_registers(configuration)
+            except Exception as exc:
+                # keep the reports of the other devices on the bus
+                error = classify(exc, f'{bus_of(device)}/{device[-1]}')
+                print(f">>> apply_configuration: invalid configuration of {device} ({exc})")
+                reports.append(ConfigReport(device, None, (), 0, None, error))
+                continue
+            reports.append(self._meter(device).apply_configuration(configuration, verify)._replace(device=device))
+        return reports
+
+    def apply_configuration(self, desired, verify = True):
+        """Apply a holding register configuration to all devices
+
+        Yield the reports of each bus as it completes
+        -----
+        Buses are configured in parallel, see EnergyMIDEM22xx.apply_configuration.
+
+        Args:
+            desired: dict of values by holding point name, or a callable
+                     returning this dict for a device tuple; an invalid result
+                     is reported in the ConfigReport of that device
+            verify: read the points back after writing and compare
+
+        Yields:
+            ConfigReport objects
+        """
+        if not callable(desired):
+            # raise on unknown points before any request
+            desired_registers(desired)
+        futures = [self._executor.submit(self._configure_bus, devices, desired, verify) \
+                   for devices in self._buses.values()]
+        for future in as_completed(futures):
+            yield from future.result()
+
+    def poll(self, *groups):
+        """Poll all devices once
+
+        Yield the results of each bus as it completes
+        -----
+        Args:
+            groups: names of the measurement groups (default: all)
+
+        Yields:
+            PollResult objects
+        """
+        futures = []
+        for devices in self._buses.values():
+            pending = []
+            for device in devices:
+                meter = self._meters.get(device)
+                if meter is not None and meter.breaker.rejecting:
+                    # skip in constant time instead of occupying the bus
+                    with self._lock:
+                        self.stats[device].update(0.0, True)
+                    yield PollResult(device, None, 0.0, EM22xxCircuitOpenError(meter.device, None, 'circuit open'))
+                    continue
+                pending.append(device)
+            if pending:
+                futures.append(self._executor.submit(self._poll_bus, pending, groups))
+        for future in as_completed(futures):
+            yield from future.result()
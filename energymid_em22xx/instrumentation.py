@@ -0,0 +1,247 @@
+"""module providing instrumentation hooks and a Prometheus histogram exporter"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# outcomes of a request
+OK = 'ok'
+EXCEPTION = 'exception'     # Modbus exception response of the device
+ERROR = 'error'             # library, connection or timeout error
+REJECTED = 'rejected'       # not sent, circuit open, backing off or no connection
+
+# function codes of the pymodbus client methods
+FUNCTION_CODES = {'read_holding_registers': 0x03, 'read_input_registers': 0x04, 'write_registers': 0x10}
+
+# default histogram buckets in seconds
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RequestEvent(namedtuple('RequestEvent', ['device', 'function_code', 'address', 'count', \
+                                               'duration', 'bytes', 'outcome'])):
+    """One Modbus request
+    -----
+    Args:
+        device: device label "ip:port/unit"
+        function_code: Modbus function code
+        address: start register address
+        count: number of registers
+        duration: seconds from sending the request until the response was received
+        bytes: Modbus TCP frame bytes of request and response
+        outcome: OK, EXCEPTION, ERROR or REJECTED
+    """
+    __slots__ = ()
+
+
+def frame_bytes(function_code, count, outcome) -> int:
+    """Modbus TCP frame bytes (MBAP header included) of a request and its response"""
+    if outcome == REJECTED:
+        return 0
+    request = 12 if function_code in (0x03, 0x04) else 13 + 2 * count
+    if outcome == EXCEPTION:
+        return request + 9
+    if outcome == ERROR:
+        return request
+    return request + (9 + 2 * count if function_code in (0x03, 0x04) else 12)
+
+
+def record_request(instrumentation, device, function_code, address, count, start, outcome):
+    """Pass a RequestEvent to the instrumentation, if any
+    -----
+    Args:
+        instrumentation: Instrumentation object or None
+        device: device label "ip:port/unit"
+        function_code: Modbus function code
+        address: start register address
+        count: number of registers
+        start: time.perf_counter() when the request was sent (None: not sent)
+        outcome: OK, EXCEPTION, ERROR or REJECTED
+    """
+    if instrumentation is None:
+        return
+    duration = time.perf_counter() - start if start is not None else 0.0
+    instrumentation.on_request(RequestEvent(device, function_code, address, count, duration, \
+                                            frame_bytes(function_code, count, outcome), outcome))
+
+
+class Instrumentation:
+    """Instrumentation hooks, the base class ignores all events
+
+    Subclass it and pass the object as instrumentation to the clients
+    and BufferedWriter. The hooks are called in the thread of the
+    request and should return quickly.
+    """
+    def on_request(self, event):
+        """Called after every Modbus request with a RequestEvent"""
+
+    def on_connect(self, device, success, duration):
+        """Called after every (re)connect attempt"""
+
+    def on_decode(self, device, count, duration):
+        """Called after count registers of a response were decoded"""
+
+    def on_flush(self, sink, rows, duration, success):
+        """Called after a sink like BufferedWriter flushed rows"""
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, constant memory"""
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Add one observation"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q) -> float:
+        """Estimate a quantile by the upper bound of its bucket (inf when above the last bucket)"""
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float('inf')
+
+
+def _labels(names, values, extra = '') -> str:
+    """Render Prometheus labels"""
+    labels = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class HistogramExporter(Instrumentation):
+    """Instrumentation collecting histograms and counters, rendered in Prometheus text format
+
+    Usage:
+        exporter = HistogramExporter()
+        em2289_obj = EnergyMIDEM22xx("192.168.178.253", instrumentation=exporter)
+        ...
+        print(exporter.render())
+    """
+    def __init__(self, buckets = DURATION_BUCKETS, namespace = 'em22xx'):
+        """Constructor of HistogramExporter object
+        -----
+        Args:
+            buckets: upper bounds of the duration buckets in seconds
+            namespace: prefix of the metric names
+        """
+        self._buckets = buckets
+        self._namespace = namespace
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.request_bytes = {}
+        self.connects = {}
+        self.decodes = {}
+        self.flushes = {}
+        self.flushed_rows = {}
+
+    def _observe(self, histograms, key, value):
+        """Add an observation to the histogram of key"""
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self._buckets)
+        histogram.observe(value)
+
+    def on_request(self, event):
+        with self._lock:
+            self._observe(self.requests, (event.device, event.function_code, event.outcome), event.duration)
+            key = (event.device,)
+            self.request_bytes[key] = self.request_bytes.get(key, 0) + event.bytes
+
+    def on_connect(self, device, success, duration):
+        with self._lock:
+            self._observe(self.connects, (device, OK if success else ERROR), duration)
+
+    def on_decode(self, device, count, duration):
+        with self._lock:
+            self._observe(self.decodes, (device,), duration)
+
+    def on_flush(self, sink, rows, duration, success):
+        with self._lock:
+            self._observe(self.flushes, (sink, OK if success else ERROR), duration)
+            if success:
+                self.flushed_rows[(sink,)] = self.flushed_rows.get((sink,), 0) + rows
+
+    def _render_histograms(self, lines, name, description, label_names, histograms):
+        """Render histograms of one metric"""
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} histogram')
+        for key, histogram in sorted(histograms.items()):
+            total = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                total += count
+                labels = _labels(label_names, key, f'le="{bound}"')
+                lines.append(f'{name}_bucket{labels} {total}')
+            labels = _labels(label_names, key, 'le="+Inf"')
+            lines.append(f'{name}_bucket{labels} {histogram.count}')
+            labels = _labels(label_names, key)
+            lines.append(f'{name}_sum{labels} {histogram.sum}')
+            lines.append(f'{name}_count{labels} {histogram.count}')
+
+    def _render_counters(self, lines, name, description, label_names, counters):
+        """Render counters of one metric"""
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for key, value in sorted(counters.items()):
+            lines.append(f'{name}{_labels(label_names, key)} {value}')
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text format"""
+        prefix = self._namespace
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, f'{prefix}_request_duration_seconds', 'Duration of Modbus requests.', \
+                                    ('device', 'function_code', 'outcome'), self.requests)
+            self._render_counters(lines, f'{prefix}_request_bytes_total', 'Modbus TCP frame bytes.', \
+                                  ('device',), self.request_bytes)
+            self._render_histograms(lines, f'{prefix}_connect_duration_seconds', 'Duration of connects.', \
+                                    ('device', 'outcome'), self.connects)
+            self._render_histograms(lines, f'{prefix}_decode_duration_seconds', 'Duration of decoding.', \
+                                    ('device',), self.decodes)
+            self._render_histograms(lines, f'{prefix}_sink_flush_duration_seconds', 'Duration of sink flushes.', \
+                                    ('sink', 'outcome'), self.flushes)
+            self._render_counters(lines, f'{prefix}_sink_rows_total', 'Rows written by sinks.', \
+                                  ('sink',), self.flushed_rows)
+        return '\n'.join(lines) + '\n'
+
+
+def start_http_server(exporter, port = 9122, host = ''):
+    """Serve the metrics of a HistogramExporter for Prometheus in a background thread
+    -----
+    Args:
+        exporter: HistogramExporter object
+        port: port to listen on
+        host: address to listen on (default: all)
+
+    Returns:
+        server: ThreadingHTTPServer object, stop it with shutdown()
+    """
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = exporter.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='em22xx-metrics', daemon=True).start()
+    return server
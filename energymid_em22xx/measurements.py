@@ -0,0 +1,121 @@
+"""module for scaling decoded EM22xx readings into physical values"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import math
+
+# register points needed for each measurement group
+GROUPS = {
+    'voltages':       ('voltage_exponent', 'voltages'),
+    'currents':       ('current_exponent', 'currents'),
+    'power':          ('power_exponent', 'power'),
+    'energy_import':  ('energy_factor', 'energy_import_total'),
+    'energy_export':  ('energy_factor', 'energy_export_total'),
+    'reactive_power': ('power_exponent', 'reactive_power'),
+    # the meter has no register for S, it is derived from P and Q
+    'apparent_power': ('power_exponent', 'power', 'reactive_power'),
+    'power_factor':   ('power_factor',),
+    'frequency':      ('frequency',),
+    'thd_voltages':   ('thd_voltages',),
+    'thd_currents':   ('thd_currents',),
+}
+
+# groups of a Snapshot, the default of read_measurements()
+SNAPSHOT_GROUPS = ('voltages', 'currents', 'power', 'energy_import', 'energy_export')
+
+# groups only measured by meters with multifunction measurements (feature M1 or M3)
+MULTIFUNCTION_GROUPS = frozenset(('voltages', 'currents', 'power', 'reactive_power', 'apparent_power', \
+                                  'power_factor', 'frequency', 'thd_voltages', 'thd_currents'))
+
+
+def scale_voltages(values) -> tuple:
+    """Voltages in V: (u_12, u_23, u_31, u_mean_12_23_31, u_1n, u_2n, u_3n, u_mean_123)"""
+    factor = 10**values['voltage_exponent']
+    return tuple(round(i*factor, 1) for i in values['voltages'])
+
+
+def scale_currents(values) -> tuple:
+    """Currents in A: (i_1, i_2, i_3, i_mean_123, i_n)"""
+    factor = 10**values['current_exponent']
+    return tuple(round(i*factor, 2) for i in values['currents'])
+
+
+def scale_power(values) -> tuple:
+    """Power in W: (p_1, p_2, p_3, p_tot)"""
+    factor = 10**values['power_exponent']
+    return tuple(round(i*factor, 2) for i in values['power'])
+
+
+def scale_energy_import(values) -> float:
+    """Energy import total in kWh"""
+    return values['energy_import_total'] * values['energy_factor'] / 1000
+
+
+def scale_energy_export(values) -> float:
+    """Energy export total in kWh"""
+    return values['energy_export_total'] * values['energy_factor'] / 1000
+
+
+def scale_reactive_power(values) -> tuple:
+    """Reactive power in var: (q_1, q_2, q_3, q_tot)"""
+    factor = 10**values['power_exponent']
+    return tuple(round(i*factor, 2) for i in values['reactive_power'])
+
+
+def scale_apparent_power(values) -> tuple:
+    """Apparent power in VA derived as sqrt(P² + Q²): (s_1, s_2, s_3, s_tot)"""
+    factor = 10**values['power_exponent']
+    return tuple(round(math.hypot(p, q)*factor, 2) for p, q in zip(values['power'], values['reactive_power']))
+
+
+def scale_power_factor(values) -> tuple:
+    """Power factors (Format 4): (pf_1, pf_2, pf_3, pf_tot)"""
+    return tuple(i / 1000 for i in values['power_factor'])
+
+
+def scale_frequency(values) -> float:
+    """Frequency in Hz (Format 3)"""
+    return round(values['frequency'] * 0.01, 2)
+
+
+def scale_thd_voltages(values) -> tuple:
+    """THD of the phase voltages as ratio (Format 5): (thd_u_1n, thd_u_2n, thd_u_3n)"""
+    return tuple(i / 1000 for i in values['thd_voltages'])
+
+
+def scale_thd_currents(values) -> tuple:
+    """THD of the phase currents as ratio (Format 5): (thd_i_1, thd_i_2, thd_i_3)"""
+    return tuple(i / 1000 for i in values['thd_currents'])
+
+
+SCALERS = {
+    'voltages':       scale_voltages,
+    'currents':       scale_currents,
+    'power':          scale_power,
+    'energy_import':  scale_energy_import,
+    'energy_export':  scale_energy_export,
+    'reactive_power': scale_reactive_power,
+    'apparent_power': scale_apparent_power,
+    'power_factor':   scale_power_factor,
+    'frequency':      scale_frequency,
+    'thd_voltages':   scale_thd_voltages,
+    'thd_currents':   scale_thd_currents,
+}
+
+
+def points_of(*groups) -> tuple:
+    """Names of the register points needed for the given measurement groups"""
+    return tuple(dict.fromkeys(name for group in groups for name in GROUPS[group]))
+
+
+def scale_measurements(values, groups = SNAPSHOT_GROUPS) -> dict:
+    """Scale the decoded values of several measurement groups
+    -----
+    Args:
+        values: dict of decoded values by point name
+        groups: names of the measurement groups
+
+    Returns:
+        measurements: dict of scaled values by group name
+    """
+    return {group: SCALERS[group](values) for group in groups}
@@ -0,0 +1,233 @@
+"""module providing a streaming pipeline from EM22xx meters to a sink"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+from collections import deque
+from .snapshot import Snapshot
+from .scheduler import Ticker
+
+
+def poll(meter, interval = 1.0, count = None, ticker = None, stop = None):
+    """Generator yielding snapshots of a meter at a fixed interval
+    -----
+    The interval is kept with monotonic deadlines by a Ticker, so the
+    duration of the reads does not add up. Failed reads are skipped.
+
+    Args:
+        meter: EnergyMIDEM22xx object
+        interval: seconds between two snapshots
+        count: number of ticks (None: endless)
+        ticker: Ticker object to use, e.g. to inspect its stats afterwards
+        stop: threading.Event ending the generator, also while the meter is unreachable
+
+    Yields:
+        Snapshot objects
+    """
+    ticker = ticker if ticker is not None else Ticker(interval)
+    tick = 0
+    while count is None or tick < count:
+        if stop is None:
+            ticker.wait()
+        elif stop.wait(max(0.0, ticker.deadline - time.monotonic())):
+            return
+        else:
+            ticker.tick(time.monotonic())
+        snapshot = meter.read_snapshot()
+        if snapshot is not False:
+            yield snapshot
+        tick += 1
+
+
+def mean_snapshot(pending, weight, snapshot) -> Snapshot:
+    """Merge a snapshot into a pending one by a running mean
+    -----
+    The timestamp of the pending snapshot is kept,
+    the energy counters are taken from the newest snapshot.
+    Channels not measured by the meter (None) stay None.
+
+    Args:
+        pending: Snapshot standing for weight samples
+        weight: number of samples merged into pending
+        snapshot: new Snapshot
+
+    Returns:
+        merged Snapshot
+    """
+    values = [None if old is None or new is None else (old * weight + new) / (weight + 1) \
+              for old, new in zip(pending[1:-2], snapshot[1:-2])]
+    return Snapshot(pending.timestamp, *values, snapshot.energy_import, snapshot.energy_export)
+
+
+class BoundedBuffer:
+    """Bounded queue between the pipeline source and the sink
+
+    What happens when the buffer is full is chosen by the policy:
+        BLOCK:       the source waits until the sink caught up
+        DROP_NEWEST: the new item is dropped
+        DROP_OLDEST: the oldest item is dropped
+        AGGREGATE:   the new item is merged into the newest pending item
+    """
+    BLOCK = 'block'
+    DROP_NEWEST = 'drop_newest'
+    DROP_OLDEST = 'drop_oldest'
+    AGGREGATE = 'aggregate'
+
+    def __init__(self, maxsize = 1000, policy = BLOCK, aggregate = mean_snapshot):
+        """Constructor of BoundedBuffer object
+        -----
+        Args:
+            maxsize: max. number of pending items
+            policy: BLOCK, DROP_NEWEST, DROP_OLDEST or AGGREGATE
+            aggregate: function(pending, weight, item) merging items for AGGREGATE
+        """
+        if policy not in (self.BLOCK, self.DROP_NEWEST, self.DROP_OLDEST, self.AGGREGATE):
+            raise ValueError(f'unknown policy {policy}')
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self._maxsize = maxsize
+        self._policy = policy
+        self._aggregate = aggregate
+        # items are stored as [item, weight]
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.dropped = 0
+        self.aggregated = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """Add an item according to the policy, items put after close() are dropped"""
+        with self._condition:
+            if self._closed:
+                self.dropped += 1
+                return
+            if len(self._items) >= self._maxsize:
+                if self._policy == self.BLOCK:
+                    self._condition.wait_for(lambda: len(self._items) < self._maxsize or self._closed)
+                    if self._closed:
+                        # woken by close(), nobody takes the item anymore
+                        self.dropped += 1
+                        return
+                elif self._policy == self.DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                elif self._policy == self.DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                else:
+                    entry = self._items[-1]
+                    entry[0] = self._aggregate(entry[0], entry[1], item)
+                    entry[1] += 1
+                    self.aggregated += 1
+                    return
+            self._items.append([item, 1])
+            self._condition.notify_all()
+
+    def get(self, timeout = None):
+        """Remove and return the oldest item
+        -----
+        Returns:
+            item or None when closed and empty or on timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                return None
+            item = self._items.popleft()[0]
+            self._condition.notify_all()
+            return item
+
+    def close(self):
+        """Wake up all waiting threads, pending items can still be taken"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class Pipeline:
+    """Long-running pipeline from a snapshot source to a sink
+
+    The source and the transform stages run in the calling thread,
+    the sink in a background thread. Both are decoupled by a
+    BoundedBuffer, so a slow sink applies back-pressure by the policy
+    instead of growing memory without bound.
+
+    The source can share the stop event, so stop() also ends a source
+    which yields nothing, e.g. poll() of an unreachable meter.
+
+    Usage:
+        writer = BufferedWriter(maria_obj, "leistung", Snapshot.COLUMNS)
+        stop = threading.Event()
+        pipeline = Pipeline(poll(em2289_obj, 1.0, stop=stop), lambda s: writer.write(s.as_row()),
+                            maxsize=3600, policy=BoundedBuffer.AGGREGATE, stop=stop)
+        pipeline.run()
+    """
+    def __init__(self, source, sink, stages = (), maxsize = 1000, policy = BoundedBuffer.BLOCK, \
+                 aggregate = mean_snapshot, stop = None):
+        """Constructor of Pipeline object
+        -----
+        Args:
+            source: iterable of items, e.g. poll()
+            sink: function called with each item
+            stages: functions item -> item, returning None drops the item
+            maxsize: max. number of items waiting for the sink
+            policy: policy of the BoundedBuffer when full
+            aggregate: merge function for the AGGREGATE policy
+            stop: threading.Event set by stop(), pass it to the source as well,
+                  e.g. poll(..., stop=stop) (default: own event)
+        """
+        self._source = source
+        self._sink = sink
+        self._stages = tuple(stages)
+        self.buffer = BoundedBuffer(maxsize, policy, aggregate)
+        self._stop = stop if stop is not None else threading.Event()
+        self._thread = None
+        self.produced = 0
+        self.consumed = 0
+        self.sink_errors = 0
+
+    def _consume(self):
+        """Background thread feeding the sink"""
+        while True:
+            item = self.buffer.get()
+            if item is None:
+                return
+            try:
+                self._sink(item)
+            except Exception as exc:
+                self.sink_errors += 1
+                print(f"ERROR: pipeline sink failed ({exc})")
+            else:
+                self.consumed += 1
+
+    def run(self):
+        """Run the pipeline until the source is exhausted or stop() is called
+        -----
+        """
+        self._thread = threading.Thread(target=self._consume, name='em22xx-sink', daemon=True)
+        self._thread.start()
+        try:
+            for item in self._source:
+                for stage in self._stages:
+                    item = stage(item)
+                    if item is None:
+                        break
+                if item is not None:
+                    self.produced += 1
+                    self.buffer.put(item)
+                if self._stop.is_set():
+                    break
+        finally:
+            self.buffer.close()
+            self._thread.join()
+
+    def stop(self):
+        """Stop the pipeline after the current item, pending items are still written
+        -----
+        """
+        self._stop.set()
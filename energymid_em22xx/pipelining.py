@@ -0,0 +1,119 @@
+"""module providing Modbus TCP transaction pipelining on one connection"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import struct
+
+# MBAP header: transaction id, protocol id (0), length of unit id + PDU, unit id
+MBAP = struct.Struct('>HHHB')
+# read request: MBAP header, function code, start register address, number of registers
+READ_REQUEST = struct.Struct('>HHHBBHH')
+
+
+class TransactionPipeline:
+    """Keep several Modbus TCP read transactions in flight on one socket
+
+    Instead of waiting for each response before the next request, up to
+    window requests are outstanding at once and the responses are matched
+    by their transaction id, so a batch costs about one round trip.
+    Responses of earlier, timed out transactions are skipped.
+
+    Usage:
+        pipeline = TransactionPipeline(window=4)
+        responses = pipeline.read(sock, 0, 0x04, [(0, 13), (100, 9), (200, 13)])
+    """
+    def __init__(self, window = 4, timeout = 3.0):
+        """Constructor of TransactionPipeline object
+        -----
+        Args:
+            window: max. number of outstanding transactions
+            timeout: max. seconds without any response
+        """
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.window = window
+        self.timeout = timeout
+        self._transaction_id = 0
+        self._buffer = bytearray()
+
+    def _next_transaction_id(self) -> int:
+        """Transaction ids wrap around at 16 bit, 0 is skipped"""
+        self._transaction_id = self._transaction_id % 0xFFFF + 1
+        return self._transaction_id
+
+    def reset(self):
+        """Drop received but unparsed data, e.g. after the connection was closed
+        -----
+        """
+        self._buffer.clear()
+
+    def _frames(self):
+        """Yield the complete frames of the receive buffer as (transaction_id, unit, pdu)"""
+        buffer = self._buffer
+        while len(buffer) >= MBAP.size:
+            transaction_id, _, length, unit = MBAP.unpack_from(buffer)
+            end = MBAP.size - 1 + length
+            if len(buffer) < end:
+                return
+            pdu = bytes(buffer[MBAP.size:end])
+            del buffer[:end]
+            yield transaction_id, unit, pdu
+
+    def read(self, sock, unit, function_code, requests) -> list:
+        """Issue read requests with up to window transactions in flight
+        -----
+        Args:
+            sock: connected TCP socket
+            unit: Modbus unit id
+            function_code: 0x03 or 0x04
+            requests: list of (register_address, count)
+
+        Returns:
+            responses: list in order of requests, each a list of raw 16-bit
+                       registers or the exception code (int) of the device
+
+        Raises:
+            TimeoutError: no response within timeout
+            OSError: the connection failed or was closed
+            ValueError: a response of another unit or function code, or a malformed one
+        """
+        responses = [None] * len(requests)
+        pending = {}
+        sent = 0
+        received = 0
+        sock.settimeout(self.timeout)
+        while received < len(requests):
+            frames = bytearray()
+            while sent < len(requests) and len(pending) < self.window:
+                transaction_id = self._next_transaction_id()
+                register_address, count = requests[sent]
+                frames += READ_REQUEST.pack(transaction_id, 0, 6, unit, function_code, register_address, count)
+                pending[transaction_id] = sent
+                sent += 1
+            if frames:
+                sock.sendall(frames)
+            data = sock.recv(4096)
+            if not data:
+                raise ConnectionResetError('connection closed by the device')
+            self._buffer += data
+            for transaction_id, response_unit, pdu in self._frames():
+                index = pending.pop(transaction_id, None)
+                if index is None:
+                    # late response of an earlier transaction
+                    continue
+                responses[index] = self._parse(unit, function_code, response_unit, pdu)
+                received += 1
+        return responses
+
+    @staticmethod
+    def _parse(unit, function_code, response_unit, pdu):
+        """Registers or exception code of a response PDU, raises ValueError if it does not match the request"""
+        if response_unit != unit:
+            raise ValueError(f'response of unit {response_unit} instead of {unit}')
+        if len(pdu) == 2 and pdu[0] == function_code | 0x80:
+            return pdu[1]
+        if len(pdu) < 2 or pdu[0] != function_code:
+            raise ValueError(f'response with function code {pdu[:1].hex() or None} instead of {function_code:02x}')
+        if len(pdu) != 2 + pdu[1] or pdu[1] % 2:
+            raise ValueError(f'response with {len(pdu) - 2} instead of {pdu[1]} data bytes')
+        return list(struct.unpack_from(f'>{pdu[1] // 2}H', pdu, 2))
@@ -0,0 +1,149 @@
+"""module providing the declarative register map and the read planner for EM22xx Modbus"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from .constants import ModbusConstants as CONSTS
+
+
+class RegisterPoint(namedtuple('RegisterPoint', ['name', 'address', 'datatype', 'count', 'scaling'])):
+    """Description of one register point of the EM22xx
+    -----
+    Args:
+        name: name of the point
+        address: start register address
+        datatype: U16, S16, U32, etc...
+        count: number of datatypes to be read
+        scaling: name of the point which holds the exponent or factor (None if unscaled)
+    """
+    __slots__ = ()
+
+    @property
+    def length(self) -> int:
+        """Number of 16-bit registers occupied by the point"""
+        return CONSTS.TYPE_TO_LENGTH[self.datatype] * self.count
+
+    @property
+    def end(self) -> int:
+        """First register address behind the point"""
+        return self.address + self.length
+
+
+class ReadBlock(namedtuple('ReadBlock', ['address', 'length', 'points'])):
+    """One planned read request covering one or more register points
+    -----
+    Args:
+        address: start register address of the request
+        length: number of registers to be read
+        points: tuple of RegisterPoint objects served by the request
+    """
+    __slots__ = ()
+
+    def offset(self, point) -> int:
+        """Offset of a point inside the registers of the block"""
+        return point.address - self.address
+
+
+# Input registers (function code 0x04) of the EM22xx
+# see Table 4 of the TCP interface description
+INPUT_REGISTERS = {
+    'voltages':            RegisterPoint('voltages', 0, 'S16', 8, 'voltage_exponent'),
+    'thd_voltages':        RegisterPoint('thd_voltages', 8, 'U16', 3, None),
+    'frequency':           RegisterPoint('frequency', 11, 'U16', 1, None),
+    'voltage_exponent':    RegisterPoint('voltage_exponent', 12, 'S16', 1, None),
+    'currents':            RegisterPoint('currents', 100, 'S16', 5, 'current_exponent'),
+    'thd_currents':        RegisterPoint('thd_currents', 105, 'U16', 3, None),
+    'current_exponent':    RegisterPoint('current_exponent', 108, 'S16', 1, None),
+    'power':               RegisterPoint('power', 200, 'S16', 4, 'power_exponent'),
+    'reactive_power':      RegisterPoint('reactive_power', 204, 'S16', 4, 'power_exponent'),
+    'power_factor':        RegisterPoint('power_factor', 208, 'S16', 4, None),
+    'power_exponent':      RegisterPoint('power_exponent', 212, 'S16', 1, None),
+    'energy_import_total': RegisterPoint('energy_import_total', 300, 'U32', 1, 'energy_factor'),
+    'energy_export_total': RegisterPoint('energy_export_total', 302, 'U32', 1, 'energy_factor'),
+    'energy_factor':       RegisterPoint('energy_factor', 408, 'U32', 1, None),
+    # features, serial number and calibration date (Format 17), parsed by DeviceInfo
+    'device_identity':     RegisterPoint('device_identity', 3000, 'U16', 12, None),
+    'firmware_version':    RegisterPoint('firmware_version', 3012, 'U16', 1, None),
+}
+
+# names of the points holding an exponent or factor of other points
+SCALING_POINTS = frozenset(point.scaling for point in INPUT_REGISTERS.values() if point.scaling)
+
+# Holding registers (function code 0x03 / 0x10) of the EM22xx
+HOLDING_REGISTERS = {
+    'ct_ratio':            RegisterPoint('ct_ratio', 10000, 'U16', 1, None),
+    'vt_ratio':            RegisterPoint('vt_ratio', 10100, 'U16', 1, None),
+    # load profile period in minutes: 1, 2, 3, 4, 5, 10, 15, 30 or 60
+    'load_profile_period': RegisterPoint('load_profile_period', 10400, 'U16', 1, None),
+    # tariff 1..8 or 0 for the tariff selected by hardware
+    'tariff':              RegisterPoint('tariff', 10500, 'U16', 1, None),
+    'webserver':           RegisterPoint('webserver', 11000, 'U16', 1, None),
+}
+
+# Documented holding register areas, each configurable point lies in its own area
+HOLDING_REGISTER_AREAS = tuple((point.address, point.end) for point in HOLDING_REGISTERS.values())
+
+# holding registers which change the exponents and energy factors when written
+SCALING_CONFIG_REGISTERS = (HOLDING_REGISTERS['ct_ratio'], HOLDING_REGISTERS['vt_ratio'])
+
+# Documented input register areas which can be read partially,
+# a read request may only bridge a gap inside one of these areas
+# see Table 3 of the TCP interface description
+INPUT_REGISTER_AREAS = ((0, 15), (100, 111), (200, 217), (300, 314), (400, 415), (500, 511)) \
+    + tuple((start, start + 14) for start in range(600, 1400, 100)) \
+    + tuple((start, start + 12) for start in range(1400, 3000, 100)) \
+    + ((3000, 3036),)
+
+
+def touches(point, register_address, count) -> bool:
+    """Check if a register range overlaps a register point"""
+    return register_address < point.end and point.address < register_address + count
+
+
+def _find_area(address, areas):
+    """Return the area containing the address or None"""
+    for area in areas:
+        if area[0] <= address < area[1]:
+            return area
+    return None
+
+
+def plan_reads(points, max_gap=CONSTS.DEFAULT_MAX_GAP, max_length=CONSTS.MAX_READ_REGISTERS, \
+               areas=INPUT_REGISTER_AREAS) -> list:
+    """Plan the read requests for a set of register points
+
+    Coalesce the points into the fewest possible read requests
+    -----
+    Points are merged into one request when the gap between them is at most
+    max_gap registers, the request stays within max_length registers and
+    the gap does not leave a documented register area.
+
+    Args:
+        points: iterable of RegisterPoint objects
+        max_gap: maximum number of unused registers to be bridged
+        max_length: maximum number of registers of one request
+        areas: register areas a gap may be bridged in (None: no restriction)
+
+    Returns:
+        blocks: list of ReadBlock objects sorted by address
+    """
+    blocks = []
+    start = end = None
+    members = []
+    for point in sorted(set(points), key=lambda p: (p.address, p.length)):
+        if point.length > max_length:
+            raise ValueError(f'register point {point.name} exceeds {max_length} registers')
+        if members:
+            merge = point.address - end <= max_gap and max(end, point.end) - start <= max_length
+            if merge and point.address > end and areas is not None:
+                area = _find_area(end - 1, areas)
+                merge = area is not None and point.end <= area[1]
+            if merge:
+                end = max(end, point.end)
+                members.append(point)
+                continue
+            blocks.append(ReadBlock(start, end - start, tuple(members)))
+        start, end, members = point.address, point.end, [point]
+    if members:
+        blocks.append(ReadBlock(start, end - start, tuple(members)))
+    return blocks
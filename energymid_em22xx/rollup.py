@@ -0,0 +1,175 @@
+"""module providing incremental min/max/mean rollups of EM22xx snapshots"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+import time
+from .snapshot import Snapshot
+
+# channels aggregated by min/max/mean, the energy totals are aggregated by delta
+CHANNELS = Snapshot.COLUMNS[:-2]
+
+
+class RollupWindow:
+    """Running aggregates of one window, constant memory per channel
+
+    Channels the meter does not measure (None) are skipped, their
+    aggregates stay None.
+    """
+    __slots__ = ('start', 'samples', 'counts', 'minimum', 'maximum', 'total', 'energy_import', 'energy_export')
+
+    def __init__(self, start, snapshot):
+        values = snapshot[1:-2]
+        self.start = start
+        self.samples = 1
+        self.counts = [0 if value is None else 1 for value in values]
+        self.minimum = list(values)
+        self.maximum = list(values)
+        self.total = list(values)
+        self.energy_import = snapshot.energy_import
+        self.energy_export = snapshot.energy_export
+
+    def add(self, snapshot):
+        """Merge one snapshot into the aggregates"""
+        minimum, maximum, total, counts = self.minimum, self.maximum, self.total, self.counts
+        for index, value in enumerate(snapshot[1:-2]):
+            if value is None:
+                continue
+            if not counts[index]:
+                minimum[index] = maximum[index] = total[index] = value
+            else:
+                if value < minimum[index]:
+                    minimum[index] = value
+                elif value > maximum[index]:
+                    maximum[index] = value
+                total[index] += value
+            counts[index] += 1
+        self.samples += 1
+        self.energy_import = snapshot.energy_import
+        self.energy_export = snapshot.energy_export
+
+
+class Rollup:
+    """Incremental rollup of a snapshot stream into fixed windows
+
+    Windows are aligned to multiples of interval in wall clock time.
+    A window is emitted to the sink as one row when a snapshot of a
+    later window arrives or tick() finds it expired. The energy deltas
+    are the growth of the energy totals of registers 300/302 since the
+    end of the previous window.
+
+    Usage:
+        rollup = Rollup(60, lambda row: maria_obj.insert_many("leistung_1min", Rollup.COLUMNS, [row]))
+        for snapshot in poll(em2289_obj, 1.0):
+            rollup.add(snapshot)
+    """
+    # columns of the emitted rows
+    COLUMNS = ('window_start', 'samples') \
+        + tuple(f'{channel}_{kind}' for channel in CHANNELS for kind in ('min', 'max', 'mean')) \
+        + ('energy_import_delta', 'energy_export_delta')
+
+    def __init__(self, interval, sink):
+        """Constructor of Rollup object
+        -----
+        Args:
+            interval: length of a window in seconds, e.g. 60 or 900
+            sink: function called with each row in the order of COLUMNS
+        """
+        self.interval = interval
+        self._sink = sink
+        self._window = None
+        # energy totals at the end of the previous window
+        self._energy_import = None
+        self._energy_export = None
+        self.emitted = 0
+        self.late = 0
+
+    def add(self, snapshot):
+        """Add one snapshot, closing the current window when it belongs to a later one
+        -----
+        Args:
+            snapshot: Snapshot object
+        """
+        start = snapshot.timestamp - snapshot.timestamp % self.interval
+        window = self._window
+        if window is not None:
+            if start == window.start:
+                window.add(snapshot)
+                return
+            if start < window.start:
+                # belongs to a window which was already emitted
+                self.late += 1
+                return
+            self._emit()
+        elif self._energy_import is None:
+            # the first window has no previous end, its deltas start at its first sample
+            self._energy_import = snapshot.energy_import
+            self._energy_export = snapshot.energy_export
+        self._window = RollupWindow(start, snapshot)
+
+    def tick(self, now = None):
+        """Emit the current window when its end passed
+        -----
+        Args:
+            now: seconds since the epoch (default: time.time())
+        """
+        now = time.time() if now is None else now
+        if self._window is not None and now >= self._window.start + self.interval:
+            self._emit()
+
+    def flush(self):
+        """Emit the current window even if it is not complete
+        -----
+        """
+        if self._window is not None:
+            self._emit()
+
+    def _emit(self):
+        """Convert the current window into a row and pass it to the sink"""
+        window = self._window
+        self._window = None
+        row = [datetime.datetime.fromtimestamp(window.start), window.samples]
+        for minimum, maximum, total, count in zip(window.minimum, window.maximum, window.total, window.counts):
+            row.extend((minimum, maximum, total / count if count else None))
+        row.append(window.energy_import - self._energy_import)
+        row.append(window.energy_export - self._energy_export)
+        self._energy_import = window.energy_import
+        self._energy_export = window.energy_export
+        self.emitted += 1
+        try:
+            self._sink(tuple(row))
+        except Exception as exc:
+            print(f"ERROR: rollup sink failed ({exc})")
+
+
+class RollupAggregator:
+    """Several rollups of one snapshot stream, e.g. per minute and per 15 minutes
+
+    Usage:
+        aggregator = RollupAggregator({
+            60:  BufferedWriter(maria_obj, "leistung_1min", Rollup.COLUMNS).write,
+            900: BufferedWriter(maria_obj, "leistung_15min", Rollup.COLUMNS).write})
+        Pipeline(poll(em2289_obj, 1.0), aggregator.add).run()
+    """
+    def __init__(self, sinks):
+        """Constructor of RollupAggregator object
+        -----
+        Args:
+            sinks: dict of sink functions by window length in seconds
+        """
+        self.rollups = tuple(Rollup(interval, sink) for interval, sink in sinks.items())
+
+    def add(self, snapshot):
+        """Add one snapshot to all rollups"""
+        for rollup in self.rollups:
+            rollup.add(snapshot)
+
+    def tick(self, now = None):
+        """Emit all windows whose end passed"""
+        for rollup in self.rollups:
+            rollup.tick(now)
+
+    def flush(self):
+        """Emit all current windows"""
+        for rollup in self.rollups:
+            rollup.flush()
@@ -0,0 +1,40 @@
+"""module providing a cache for the scaling metadata of the EM22xx"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+
+
+class ScalingCache:
+    """Cache for exponents and energy factors of the EM22xx
+
+    These values only change when the CT/VT ratio is reconfigured,
+    therefore they are kept for ttl seconds instead of being re-read.
+    """
+    def __init__(self, ttl = 600):
+        """Constructor of ScalingCache object
+        -----
+        Args:
+            ttl: time to live of a cached value in seconds (None: never expires)
+        """
+        self._ttl = ttl
+        self._values = {}
+
+    def get(self, name):
+        """Return the cached value or None when missing or expired"""
+        entry = self._values.get(name)
+        if entry is None:
+            return None
+        value, timestamp = entry
+        if self._ttl is not None and time.monotonic() - timestamp > self._ttl:
+            del self._values[name]
+            return None
+        return value
+
+    def set(self, name, value):
+        """Store a value in the cache"""
+        self._values[name] = (value, time.monotonic())
+
+    def invalidate(self):
+        """Drop all cached values"""
+        self._values.clear()
@@ -0,0 +1,170 @@
+"""module providing a drift-free fixed-rate scheduler for EM22xx polling"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+
+class TickStats:
+    """Lateness, skipped ticks and failed runs of one periodic job"""
+    __slots__ = ('ticks', 'skipped', 'errors', 'last_lateness', 'max_lateness', 'total_lateness')
+
+    def __init__(self):
+        self.ticks = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+        self.total_lateness = 0.0
+
+    @property
+    def mean_lateness(self) -> float:
+        """Mean lateness of all ticks in seconds"""
+        return self.total_lateness / self.ticks if self.ticks else 0.0
+
+    def __repr__(self):
+        return f'TickStats(ticks={self.ticks}, skipped={self.skipped}, errors={self.errors}, ' \
+               f'mean_lateness={self.mean_lateness:.6f}, max_lateness={self.max_lateness:.6f})'
+
+
+class Ticker:
+    """Fixed-rate ticks on monotonic deadlines
+
+    Deadline n is start + n * interval, so the time spent between
+    two ticks does not accumulate as drift. Deadlines which already
+    passed by a whole interval are skipped and counted.
+    """
+    def __init__(self, interval, align = False):
+        """Constructor of Ticker object
+        -----
+        Args:
+            interval: seconds between two ticks
+            align: align the ticks to multiples of interval in wall clock time,
+                   e.g. 900 s ticks at :00, :15, :30 and :45
+        """
+        self.interval = interval
+        now = time.monotonic()
+        self.deadline = now + (interval - time.time() % interval) % interval if align else now
+        self.stats = TickStats()
+
+    def due(self, now) -> bool:
+        """Check if the next tick is due"""
+        return now >= self.deadline
+
+    def tick(self, now) -> float:
+        """Account the tick started at now and advance the deadline
+        -----
+        Returns:
+            lateness: seconds the tick started behind its deadline
+        """
+        lateness = now - self.deadline
+        missed = int(lateness // self.interval)
+        if missed > 0:
+            # catching up would burst requests, the missed ticks are skipped
+            self.stats.skipped += missed
+            self.deadline += missed * self.interval
+            lateness -= missed * self.interval
+        stats = self.stats
+        stats.ticks += 1
+        stats.last_lateness = lateness
+        stats.total_lateness += lateness
+        stats.max_lateness = max(stats.max_lateness, lateness)
+        self.deadline += self.interval
+        return lateness
+
+    def wait(self) -> float:
+        """Sleep until the next deadline and account the tick
+        -----
+        Returns:
+            lateness: seconds the tick started behind its deadline
+        """
+        delay = self.deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return self.tick(time.monotonic())
+
+
+class FixedRateScheduler:
+    """Run several jobs at individual fixed rates in one thread
+
+    Usage:
+        scheduler = FixedRateScheduler()
+        scheduler.add_group(em2289_obj, ('power',), 1.0, handle_power)
+        scheduler.add_group(em2289_obj, ('energy_import', 'energy_export'), 60.0, handle_energy)
+        scheduler.run()
+    """
+    def __init__(self):
+        self._jobs = {}
+        self._stop = threading.Event()
+
+    def add(self, name, interval, function, align = False):
+        """Add a periodic job
+        -----
+        Args:
+            name: name of the job
+            interval: seconds between two runs
+            function: function called without arguments, returning False or
+                      raising counts as error in the stats of the job
+            align: align the runs to multiples of interval in wall clock time
+        """
+        self._jobs[name] = (Ticker(interval, align), function)
+
+    def add_group(self, meter, groups, interval, callback, align = False):
+        """Add a job reading measurement groups of a meter
+        -----
+        Args:
+            meter: EnergyMIDEM22xx object
+            groups: names of the measurement groups, see measurements.GROUPS
+            interval: seconds between two reads
+            callback: function called with the dict of read_measurements(),
+                      not called when the read failed (see meter.last_error)
+            align: align the reads to multiples of interval in wall clock time
+        """
+        name = f'{id(meter)}:{",".join(groups)}'
+
+        def _read():
+            measurements = meter.read_measurements(*groups)
+            if measurements is False:
+                return False
+            return callback(measurements)
+
+        self.add(name, interval, _read, align)
+
+    @property
+    def stats(self) -> dict:
+        """TickStats by job name"""
+        return {name: ticker.stats for name, (ticker, _) in self._jobs.items()}
+
+    def run(self, duration = None):
+        """Run the jobs until stop() is called or duration expired
+        -----
+        Args:
+            duration: seconds to run (None: endless)
+        """
+        end = time.monotonic() + duration if duration is not None else None
+        self._stop.clear()
+        while self._jobs and not self._stop.is_set():
+            deadline = min(ticker.deadline for ticker, _ in self._jobs.values())
+            if end is not None and deadline >= end:
+                return
+            delay = deadline - time.monotonic()
+            if delay > 0 and self._stop.wait(delay):
+                return
+            for name, (ticker, function) in self._jobs.items():
+                now = time.monotonic()
+                if ticker.due(now):
+                    ticker.tick(now)
+                    try:
+                        failed = function() is False
+                    except Exception as exc:
+                        # one failing job must not stop the others
+                        print(f"ERROR: job {name} failed ({exc})")
+                        failed = True
+                    ticker.stats.errors += failed
+
+    def stop(self):
+        """Stop run() after the running job
+        -----
+        """
+        self._stop.set()
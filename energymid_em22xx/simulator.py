@@ -0,0 +1,341 @@
+"""module providing a Modbus TCP simulator of the EM22xx register map"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import random
+import threading
+import time
+from pymodbus import FramerType
+from pymodbus.client.mixin import ModbusClientMixin
+from pymodbus.datastore import ModbusSequentialDataBlock, ModbusSlaveContext, ModbusServerContext
+from pymodbus.exceptions import ModbusIOException
+from pymodbus.pdu import ExceptionResponse
+from pymodbus.server import ModbusTcpServer
+from pymodbus.server.requesthandler import ServerRequestHandler
+from pymodbus.transaction import TransactionManager
+from .register_map import INPUT_REGISTERS, HOLDING_REGISTERS, INPUT_REGISTER_AREAS
+from .decoding import ENCODE_DATATYPES, encode_registers
+
+# size of the simulated register spaces
+INPUT_REGISTER_COUNT = 3100
+HOLDING_REGISTER_COUNT = 11100
+
+# mantissas of the default measurements
+DEFAULT_POINTS = {
+    'voltages':            (4000, 4001, 3999, 4000, 2300, 2302, 2298, 2300),
+    'thd_voltages':        (21, 128, 37),
+    'frequency':           5002,
+    'voltage_exponent':    -1,
+    'currents':            (1234, 1180, 1302, 1239, 25),
+    'thd_currents':        (45, 52, 48),
+    'current_exponent':    -2,
+    'power':               (2750, 2610, 2890, 8250),
+    'reactive_power':      (310, 280, 330, 920),
+    'power_factor':        (994, 995, 993, 994),
+    'power_exponent':      0,
+    'energy_import_total': 1160056,
+    'energy_export_total': 10125,
+    'energy_factor':       10,
+    'firmware_version':    121,
+}
+
+# values of the holding registers
+DEFAULT_HOLDING = {'ct_ratio': 1, 'vt_ratio': 1, 'load_profile_period': 15, 'tariff': 0, 'webserver': 1}
+
+# features of Format 17: type, D, H, M, P, Q, U, V, W, Z, S, see constants.EM22xxFeatures
+DEFAULT_FEATURES = (2, 0, 0, 3, 0, 1, 6, 0, 4, 0, 0)
+
+
+def features_registers(features = DEFAULT_FEATURES, serial = b'12345678', calibration = (15, 3, 2024)):
+    """Registers 3000 ff. of Format 17
+    -----
+    Args:
+        features: 11 feature bytes, see constants.EM22xxFeatures
+        serial: serial number of 8 bytes
+        calibration: (day, month, year) of the calibration
+
+    Returns:
+        registers: list of raw 16-bit registers starting at register 3000
+    """
+    day, month, year = calibration
+    data = bytes(features) + serial + bytes((day, month, year & 0xFF, year >> 8))
+    data += bytes(-len(data) % 2)
+    return [(data[i] << 8) | data[i + 1] for i in range(0, len(data), 2)]
+
+
+class SimulatedEM22xx(ModbusSlaveContext):
+    """Datastore of one simulated EM22xx with fault injection
+
+    Requests outside the documented register areas are answered with
+    exception 02 (illegal data address) like the meter does. Latency,
+    jitter, exception responses and dropped connections can be injected.
+
+    Usage:
+        device = SimulatedEM22xx(latency=0.005, exception_rate=0.01)
+        device.set_point('power', (1000, 1000, 1000, 3000))
+    """
+    def __init__(self, latency = 0.0, jitter = 0.0, exception_rate = 0.0, \
+                 exception_code = ExceptionResponse.SLAVE_FAILURE, drop_rate = 0.0, \
+                 animate = False, points = None, features = DEFAULT_FEATURES, seed = None):
+        """Constructor of SimulatedEM22xx object
+        -----
+        Args:
+            latency: seconds each request is delayed
+            jitter: max. random seconds added to the latency
+            exception_rate: probability of an exception response
+            exception_code: Modbus exception code of injected exceptions
+            drop_rate: probability of dropping all connections instead of answering
+            animate: let the energy totals grow by the total power over time
+            points: dict of mantissas by point name overriding DEFAULT_POINTS
+            features: 11 feature bytes, e.g. M0 for an energy-only meter
+            seed: seed of the random generator for reproducible faults
+        """
+        # the slave context adds 1 to every address, so the blocks start at 1
+        super().__init__(di=ModbusSequentialDataBlock(1, [0]), co=ModbusSequentialDataBlock(1, [0]), \
+                         ir=ModbusSequentialDataBlock(1, [0] * INPUT_REGISTER_COUNT), \
+                         hr=ModbusSequentialDataBlock(1, [0] * HOLDING_REGISTER_COUNT))
+        self.latency = latency
+        self.jitter = jitter
+        self.exception_rate = exception_rate
+        self.exception_code = exception_code
+        self.drop_rate = drop_rate
+        self.animate = animate
+        self.server = None
+        self.requests = 0
+        self.exceptions = 0
+        self.drops = 0
+        self._random = random.Random(seed)
+        self._animated_at = time.monotonic()
+        self._energy_rest = 0.0
+        for name, values in dict(DEFAULT_POINTS, **(points or {})).items():
+            self.set_point(name, values)
+        self.setValues(4, 3000, features_registers(features))
+        for name, value in DEFAULT_HOLDING.items():
+            self.setValues(3, HOLDING_REGISTERS[name].address, [value])
+
+    def set_point(self, name, values):
+        """Set the mantissas of an input register point, see register_map.INPUT_REGISTERS"""
+        point = INPUT_REGISTERS[name]
+        self.setValues(4, point.address, encode_registers(values, point.datatype))
+
+    def get_point(self, name):
+        """Get the decoded values of an input register point"""
+        point = INPUT_REGISTERS[name]
+        registers = self.getValues(4, point.address, point.length)
+        data_type = ENCODE_DATATYPES[point.datatype]
+        return ModbusClientMixin.convert_from_registers(registers, data_type)
+
+    def _valid(self, fc_as_hex, address, count) -> bool:
+        """Check if a request lies in one documented register area"""
+        if fc_as_hex == 4:
+            return any(start <= address and address + count <= end for start, end in INPUT_REGISTER_AREAS)
+        return any(point.address <= address and address + count <= point.end \
+                   for point in HOLDING_REGISTERS.values())
+
+    def _advance_energy(self):
+        """Let the energy import total grow by the total power since the last request"""
+        now = time.monotonic()
+        hours = (now - self._animated_at) / 3600
+        self._animated_at = now
+        power = self.get_point('power')[3] * 10**self.get_point('power_exponent')
+        # Wh into counter steps of energy_factor / 1000 kWh
+        self._energy_rest += max(power, 0) * hours / self.get_point('energy_factor')
+        steps = int(self._energy_rest)
+        if steps:
+            self._energy_rest -= steps
+            self.set_point('energy_import_total', (self.get_point('energy_import_total') + steps) & 0xFFFFFFFF)
+
+    async def _inject(self):
+        """Apply latency and faults, return an exception code or None"""
+        self.requests += 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.drop_rate and self._random.random() < self.drop_rate:
+            self.drops += 1
+            if self.server is not None:
+                for connection in list(self.server.active_connections.values()):
+                    connection.close()
+        if self.exception_rate and self._random.random() < self.exception_rate:
+            self.exceptions += 1
+            return self.exception_code
+        return None
+
+    async def async_getValues(self, fc_as_hex, address, count = 1):
+        code = await self._inject()
+        if code is not None:
+            return code
+        if not self._valid(fc_as_hex, address, count):
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        if self.animate and fc_as_hex == 4:
+            self._advance_energy()
+        return self.getValues(fc_as_hex, address, count)
+
+    async def async_setValues(self, fc_as_hex, address, values):
+        code = await self._inject()
+        if code is not None:
+            return code
+        if not self._valid(fc_as_hex, address, len(values)):
+            return ExceptionResponse.ILLEGAL_ADDRESS
+        self.setValues(fc_as_hex, address, values)
+        return None
+
+
+class _QueueingRequestHandler(ServerRequestHandler):
+    """Connection handler answering every request of a received TCP segment
+
+    pymodbus answers only one frame of a segment, the meter queues
+    pipelined requests and answers them in order.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._order = asyncio.Lock()
+        self._tasks = set()
+
+    def callback_disconnected(self, call_exc):
+        super().callback_disconnected(call_exc)
+        for task in self._tasks:
+            task.cancel()
+
+    def callback_data(self, data, addr = None) -> int:
+        used_len = 0
+        while used_len < len(data):
+            try:
+                used_len += TransactionManager.callback_data(self, data[used_len:], addr)
+            except ModbusIOException:
+                self.server_send(ExceptionResponse(40, exception_code=ExceptionResponse.ILLEGAL_FUNCTION), 0)
+                return len(data)
+            if not self.last_pdu:
+                break
+            task = self.loop.create_task(self._answer(self.last_pdu, self.last_addr))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return used_len
+
+    async def _answer(self, pdu, addr):
+        """Answer one request after the ones received before it"""
+        async with self._order:
+            try:
+                response = await pdu.update_datastore(self.server.context[pdu.dev_id])
+            except Exception:  # pylint: disable=broad-except
+                response = ExceptionResponse(pdu.function_code, ExceptionResponse.SLAVE_FAILURE)
+            response.transaction_id = pdu.transaction_id
+            response.dev_id = pdu.dev_id
+            self.server_send(response, addr)
+
+
+class _EM22xxServer(ModbusTcpServer):
+    """ModbusTcpServer with pipelined requests, see _QueueingRequestHandler"""
+    def callback_new_connection(self):
+        if self.trace_connect:
+            self.trace_connect(True)
+        return _QueueingRequestHandler(self, self.trace_packet, self.trace_pdu, self.trace_connect)
+
+
+class EM22xxSimulator:
+    """Many simulated EM22xx, each on its own TCP port, served by one background thread
+
+    Usage:
+        with EM22xxSimulator(count=100, port=0, latency=0.002) as simulator:
+            with FleetPoller(simulator.devices) as poller:
+                for result in poller.poll():
+                    print(result)
+    """
+    def __init__(self, count = 1, host = '127.0.0.1', port = 5020, framer = FramerType.SOCKET, **device_kwargs):
+        """Constructor of EM22xxSimulator object
+        -----
+        Args:
+            count: number of simulated meters
+            host: address to listen on
+            port: port of the first meter, the others follow (0: free ports)
+            framer: FramerType.SOCKET for Modbus TCP, FramerType.RTU for RTU over TCP
+            device_kwargs: arguments of SimulatedEM22xx, e.g. latency or exception_rate
+        """
+        self._host = host
+        self._port = port
+        self._framer = framer
+        self.units = [SimulatedEM22xx(**device_kwargs) for _ in range(count)]
+        self.devices = []
+        self._servers = []
+        self._loop = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    async def _serve(self):
+        """Start one server per meter"""
+        for index, unit in enumerate(self.units):
+            port = self._port + index if self._port else 0
+            server = _EM22xxServer(ModbusServerContext(slaves=unit, single=True), \
+                                   address=(self._host, port), framer=self._framer)
+            await server.serve_forever(background=True)
+            unit.server = server
+            self._servers.append(server)
+            self.devices.append((self._host, server.transport.sockets[0].getsockname()[1], 0))
+
+    def start(self) -> list:
+        """Start the servers in a background thread
+        -----
+        Returns:
+            devices: list of (ip, port, device_unit_id), e.g. for FleetPoller
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='em22xx-simulator', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+        return self.devices
+
+    def stop(self):
+        """Stop all servers and the background thread
+        -----
+        """
+        if self._loop is None:
+            return
+
+        async def _shutdown():
+            for server in self._servers:
+                await server.shutdown()
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._servers = []
+        self.devices = []
+
+
+def main():
+    """Run simulated meters until interrupted"""
+    parser = argparse.ArgumentParser(description='Modbus TCP simulator of EM22xx energy meters')
+    parser.add_argument('--count', type=int, default=1, help='number of simulated meters')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=5020, help='port of the first meter')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each request is delayed')
+    parser.add_argument('--jitter', type=float, default=0.0, help='max. random seconds added to the latency')
+    parser.add_argument('--exception-rate', type=float, default=0.0, help='probability of an exception response')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='probability of dropping the connections')
+    parser.add_argument('--rtu', action='store_true', help='RTU framing like a serial gateway')
+    args = parser.parse_args()
+    framer = FramerType.RTU if args.rtu else FramerType.SOCKET
+    with EM22xxSimulator(args.count, args.host, args.port, framer, latency=args.latency, jitter=args.jitter, \
+                         exception_rate=args.exception_rate, drop_rate=args.drop_rate, \
+                         animate=True) as simulator:
+        for device in simulator.devices:
+            print(f'EM22xx simulated at {device[0]}:{device[1]}')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
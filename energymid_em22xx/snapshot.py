@@ -0,0 +1,125 @@
+"""module providing the compact snapshot record of the EM22xx measurements"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import datetime
+from collections import namedtuple
+from .measurements import GROUPS, SNAPSHOT_GROUPS, scale_measurements
+
+# fields of a snapshot in the order of the measurement groups
+SNAPSHOT_FIELDS = ('timestamp', \
+                   'u_12', 'u_23', 'u_31', 'u_mean_12_23_31', 'u_1n', 'u_2n', 'u_3n', 'u_mean_123', \
+                   'i_1', 'i_2', 'i_3', 'i_mean_123', 'i_n', \
+                   'p_1', 'p_2', 'p_3', 'p_tot', \
+                   'energy_import', 'energy_export')
+
+# fields of a raw snapshot: the register values as read, before scaling
+RAW_SNAPSHOT_FIELDS = ('timestamp', 'voltage_exponent', 'current_exponent', 'power_exponent', \
+                       'energy_factor', 'voltages', 'currents', 'power', \
+                       'energy_import_total', 'energy_export_total')
+
+
+class Snapshot(namedtuple('Snapshot', SNAPSHOT_FIELDS)):
+    """One reading of all measurement groups of an EM22xx
+    -----
+    A tuple without per-instance dict, so millions of buffered samples
+    need only a fraction of the memory of dicts.
+
+    timestamp: seconds since the epoch (time.time()) when the reading started
+    u_*: voltages in V, i_*: currents in A, p_*: power in W
+    energy_import, energy_export: energy totals in kWh
+
+    Channels the meter does not measure (voltages, currents and power of
+    energy-only meters) are None. The consumers skip them, binary records
+    (spool, collector) store them as NaN.
+    """
+    __slots__ = ()
+
+    # value columns without the timestamp, e.g. for MariaDBMysql inserts
+    COLUMNS = SNAPSHOT_FIELDS[1:]
+
+    @classmethod
+    def from_measurements(cls, timestamp, measurements):
+        """Create a snapshot from the dict of read_measurements()
+        -----
+        Args:
+            timestamp: seconds since the epoch
+            measurements: dict with the measurement groups of SNAPSHOT_GROUPS,
+                          missing groups (e.g. of energy-only meters) become None
+
+        Returns:
+            snapshot: Snapshot object
+        """
+        return cls(timestamp, *measurements.get('voltages', (None,) * 8), \
+                   *measurements.get('currents', (None,) * 5), *measurements.get('power', (None,) * 4), \
+                   measurements.get('energy_import'), measurements.get('energy_export'))
+
+    @property
+    def voltages(self) -> tuple:
+        """(u_12, u_23, u_31, u_mean_12_23_31, u_1n, u_2n, u_3n, u_mean_123)"""
+        return self[1:9]
+
+    @property
+    def currents(self) -> tuple:
+        """(i_1, i_2, i_3, i_mean_123, i_n)"""
+        return self[9:14]
+
+    @property
+    def power(self) -> tuple:
+        """(p_1, p_2, p_3, p_tot)"""
+        return self[14:18]
+
+    def as_row(self, with_timestamp = False) -> tuple:
+        """Convert to a row of values for MariaDBMysql
+        -----
+        Args:
+            with_timestamp: prepend the timestamp as datetime object
+
+        Returns:
+            row: tuple of values in the order of COLUMNS
+        """
+        if with_timestamp:
+            return (datetime.datetime.fromtimestamp(self.timestamp),) + self[1:]
+        return self[1:]
+
+
+class RawSnapshot(namedtuple('RawSnapshot', RAW_SNAPSHOT_FIELDS)):
+    """One reading of all measurement groups as raw register values
+    -----
+    Keeps the S16 mantissas, the exponents and the U32 energy counters
+    as read, e.g. for the compact time-series file of tsfile.py.
+
+    timestamp: seconds since the epoch (time.time()) when the reading started
+    voltages, currents, power: tuples of mantissas (registers 0-7, 100-104, 200-203),
+                               None with their exponents for energy-only meters
+    energy_import_total, energy_export_total: counters of registers 300 and 302
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_values(cls, timestamp, values):
+        """Create a raw snapshot from the dict of read_points()
+        -----
+        Args:
+            timestamp: seconds since the epoch
+            values: dict with the points of the measurement groups,
+                    the points of unsupported groups may be missing (None)
+
+        Returns:
+            snapshot: RawSnapshot object
+        """
+        return cls(timestamp, values.get('voltage_exponent'), values.get('current_exponent'), \
+                   values.get('power_exponent'), values['energy_factor'], _mantissas(values, 'voltages'), \
+                   _mantissas(values, 'currents'), _mantissas(values, 'power'), \
+                   values['energy_import_total'], values['energy_export_total'])
+
+    def to_snapshot(self) -> Snapshot:
+        """Scale into a Snapshot the same way as the getters"""
+        values = {name: value for name, value in zip(RAW_SNAPSHOT_FIELDS[1:], self[1:]) if value is not None}
+        groups = tuple(group for group in SNAPSHOT_GROUPS if all(name in values for name in GROUPS[group]))
+        return Snapshot.from_measurements(self.timestamp, scale_measurements(values, groups))
+
+
+def _mantissas(values, name):
+    """Tuple of the mantissas of a point or None when not read"""
+    return tuple(values[name]) if name in values else None
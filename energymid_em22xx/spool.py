@@ -0,0 +1,220 @@
+"""module providing a memory-mapped write-ahead spool for EM22xx snapshots"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import struct
+import threading
+from .snapshot import Snapshot
+
+# header: magic, version, record size, records written, records drained
+HEADER = struct.Struct('<8sII QQ')
+HEADER_SIZE = 64
+MAGIC = b'EM22SPL1'
+VERSION = 1
+
+# record: device id, timestamp, 17 measurements as float32, energy import/export
+RECORD = struct.Struct('<I d 17f 2d')
+
+NAN = float('nan')
+
+
+def record_values(snapshot) -> tuple:
+    """Values of a snapshot for RECORD, channels not measured (None) become NaN"""
+    return tuple(NAN if value is None else value for value in snapshot)
+
+
+def record_snapshot(values) -> Snapshot:
+    """Snapshot of the values unpacked from RECORD without the device id, NaN becomes None"""
+    return Snapshot(*(None if value != value else value for value in values))
+
+
+class SnapshotSpool:
+    """Append-only, memory-mapped on-disk spool of snapshot records
+
+    Records have a fixed binary layout, appending is a struct.pack_into
+    into the mapped file. The file grows by chunk_records and is reset
+    to its first chunk once everything was drained.
+
+    Usage:
+        spool = SnapshotSpool("/var/spool/em22xx/snapshots.spool")
+        spool.append(device_id, em2289_obj.read_snapshot())
+    """
+    def __init__(self, path, chunk_records = 4096):
+        """Constructor of SnapshotSpool object
+        -----
+        Args:
+            path: path of the spool file, created if missing
+            chunk_records: number of records the file grows by
+        """
+        self._path = path
+        self._chunk_size = chunk_records * RECORD.size
+        self._lock = threading.Lock()
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self._file.truncate(HEADER_SIZE + self._chunk_size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        if exists:
+            magic, version, record_size, self._written, self._drained = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                raise ValueError(f'{path} is not a compatible snapshot spool')
+        else:
+            self._written = self._drained = 0
+            self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._written - self._drained
+
+    def _write_header(self):
+        """Store the counters in the header"""
+        HEADER.pack_into(self._mmap, 0, MAGIC, VERSION, RECORD.size, self._written, self._drained)
+
+    def _grow(self):
+        """Extend the file by one chunk and map it again"""
+        size = len(self._mmap) + self._chunk_size
+        self._mmap.close()
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+    def append(self, device_id, snapshot):
+        """Append one snapshot record
+        -----
+        Args:
+            device_id: numeric id of the device (0 .. 2^32-1)
+            snapshot: Snapshot object
+        """
+        with self._lock:
+            offset = HEADER_SIZE + self._written * RECORD.size
+            if offset + RECORD.size > len(self._mmap):
+                self._grow()
+            RECORD.pack_into(self._mmap, offset, device_id, *record_values(snapshot))
+            self._written += 1
+            self._write_header()
+
+    def read_batch(self, max_records = 1000) -> list:
+        """Read the oldest pending records without removing them
+        -----
+        Args:
+            max_records: max. number of records
+
+        Returns:
+            records: list of (device_id, Snapshot)
+        """
+        with self._lock:
+            count = min(max_records, self._written - self._drained)
+            offset = HEADER_SIZE + self._drained * RECORD.size
+            records = []
+            for values in RECORD.iter_unpack(self._mmap[offset:offset + count * RECORD.size]):
+                records.append((values[0], record_snapshot(values[1:])))
+            return records
+
+    def commit(self, count):
+        """Mark the oldest count records as drained
+        -----
+        Args:
+            count: number of records written to the sink
+        """
+        with self._lock:
+            self._drained = min(self._written, self._drained + count)
+            if self._drained == self._written:
+                # everything drained: start over at the first record
+                self._written = self._drained = 0
+                if len(self._mmap) > HEADER_SIZE + self._chunk_size:
+                    self._mmap.close()
+                    self._file.truncate(HEADER_SIZE + self._chunk_size)
+                    self._mmap = mmap.mmap(self._file.fileno(), 0)
+            self._write_header()
+
+    def flush(self):
+        """Write the mapped pages to disk
+        -----
+        """
+        with self._lock:
+            self._mmap.flush()
+
+    def close(self):
+        """Flush and close the spool file
+        -----
+        """
+        with self._lock:
+            if not self._mmap.closed:
+                self._mmap.flush()
+                self._mmap.close()
+                self._file.close()
+
+
+class SpoolDrainer:
+    """Background thread replaying the spool into a sink in bulk batches
+
+    The sink is called with a list of (device_id, Snapshot) and returns
+    True when the batch was written. Failed batches stay in the spool
+    and are retried after retry_interval seconds.
+
+    Usage:
+        def sink(records):
+            return maria_obj.insert_many("leistung", ("device", "timestamp") + Snapshot.COLUMNS,
+                                         [(device,) + snapshot.as_row(True) for device, snapshot in records])
+        drainer = SpoolDrainer(spool, sink)
+    """
+    def __init__(self, spool, sink, batch_size = 1000, interval = 1.0, retry_interval = 10.0):
+        """Constructor of SpoolDrainer object
+        -----
+        Args:
+            spool: SnapshotSpool object
+            sink: function called with a list of records, returns True on success
+            batch_size: max. records per sink call
+            interval: seconds between checks for new records
+            retry_interval: seconds to wait after a failed batch
+        """
+        self._spool = spool
+        self._sink = sink
+        self._batch_size = batch_size
+        self._interval = interval
+        self._retry_interval = retry_interval
+        self._stop = threading.Event()
+        self.drained = 0
+        self.failures = 0
+        self._thread = threading.Thread(target=self._run, name='em22xx-spool-drainer', daemon=True)
+        self._thread.start()
+
+    def drain(self) -> bool:
+        """Write all pending records to the sink
+        -----
+        Returns:
+            True when the spool is empty, False when the sink failed
+        """
+        while len(self._spool):
+            records = self._spool.read_batch(self._batch_size)
+            try:
+                success = self._sink(records)
+            except Exception as exc:
+                print(f"ERROR: spool sink failed ({exc})")
+                success = False
+            if not success:
+                self.failures += 1
+                return False
+            self._spool.commit(len(records))
+            self.drained += len(records)
+        return True
+
+    def _run(self):
+        """Background thread draining the spool"""
+        wait = self._interval
+        while not self._stop.wait(wait):
+            wait = self._interval if self.drain() else self._retry_interval
+
+    def close(self):
+        """Stop the background thread after a last drain attempt
+        -----
+        """
+        self._stop.set()
+        self._thread.join()
+        self.drain()
@@ -0,0 +1,195 @@
+"""module providing the Modbus transports (TCP, RTU serial, RTU over TCP) of the EM22xx clients"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+import threading
+from pymodbus import FramerType
+from pymodbus.client import ModbusTcpClient, ModbusSerialClient, AsyncModbusTcpClient, AsyncModbusSerialClient
+
+
+class Transport:
+    """Base class of the transports
+    -----
+    One Transport object stands for one bus. All meters created with
+    the same object share its client and its lock, so their requests
+    are serialized on the bus while different buses run in parallel.
+    """
+    # TCP keep-alive can be enabled on the socket of the client
+    keepalive = False
+    # Modbus TCP framing with transaction ids, see pipelining.TransactionPipeline
+    pipelining = False
+
+    def __init__(self, timeout = 3, retries = 3):
+        """Constructor of Transport object
+        -----
+        Args:
+            timeout: timeout of one request in seconds
+            retries: retries of one request by pymodbus
+        """
+        self.timeout = timeout
+        self.retries = retries
+        # serializes the requests of all meters on the bus
+        self.lock = threading.RLock()
+        self._async_lock = None
+        self._client = None
+        self._async_client = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.bus!r})'
+
+    @property
+    def bus(self) -> str:
+        """Label of the bus, e.g. "192.168.178.253:502" or "/dev/ttyUSB0" """
+        raise NotImplementedError
+
+    @property
+    def async_lock(self) -> asyncio.Lock:
+        """asyncio variant of lock, created on first use"""
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        return self._async_lock
+
+    def create_client(self):
+        """Create a new synchronous pymodbus client of the bus"""
+        raise NotImplementedError
+
+    def create_async_client(self):
+        """Create a new asyncio pymodbus client of the bus"""
+        raise NotImplementedError
+
+    def client(self):
+        """Return the synchronous client shared by all meters on the bus"""
+        with self.lock:
+            if self._client is None:
+                self._client = self.create_client()
+            return self._client
+
+    def async_client(self):
+        """Return the asyncio client shared by all meters on the bus"""
+        if self._async_client is None:
+            self._async_client = self.create_async_client()
+        return self._async_client
+
+    def close(self):
+        """Close the clients of the bus
+        -----
+        The meters do not close a transport passed to them, it is closed
+        here once all of them are done.
+        """
+        with self.lock:
+            if self._client is not None:
+                self._client.close()
+        if self._async_client is not None:
+            self._async_client.close()
+
+
+class TcpTransport(Transport):
+    """Modbus TCP, the EM22xx with TCP interface (feature W=4)
+
+    Usage:
+        em2289_obj = EnergyMIDEM22xx(TcpTransport("192.168.178.253"))
+    """
+    keepalive = True
+    pipelining = True
+
+    def __init__(self, ip, port = 502, timeout = 3, retries = 3):
+        """Constructor of TcpTransport object
+        -----
+        Args:
+            ip: ip address of device or gateway
+            port: port which is used (default 502)
+            timeout: timeout of one request in seconds
+            retries: retries of one request by pymodbus
+        """
+        super().__init__(timeout, retries)
+        self.ip = ip
+        self.port = port
+
+    @property
+    def bus(self) -> str:
+        return f'{self.ip}:{self.port}'
+
+    def create_client(self):
+        return ModbusTcpClient(self.ip, port=self.port, framer=FramerType.SOCKET, \
+                               timeout=self.timeout, retries=self.retries)
+
+    def create_async_client(self):
+        return AsyncModbusTcpClient(self.ip, port=self.port, framer=FramerType.SOCKET, \
+                                    timeout=self.timeout, retries=self.retries)
+
+
+class RtuOverTcpTransport(TcpTransport):
+    """Modbus RTU frames tunneled through TCP by a transparent serial gateway
+
+    The meters behind the gateway share one RS-485 line, create one
+    object per gateway and pass it to all of them.
+
+    Usage:
+        gateway = RtuOverTcpTransport("192.168.178.250", port=4001)
+        meters = [EnergyMIDEM22xx(gateway, device_unit_id=unit) for unit in (1, 2, 3)]
+    """
+    # RTU frames carry no transaction id
+    pipelining = False
+
+    def create_client(self):
+        return ModbusTcpClient(self.ip, port=self.port, framer=FramerType.RTU, \
+                               timeout=self.timeout, retries=self.retries)
+
+    def create_async_client(self):
+        return AsyncModbusTcpClient(self.ip, port=self.port, framer=FramerType.RTU, \
+                                    timeout=self.timeout, retries=self.retries)
+
+
+class RtuTransport(Transport):
+    """Modbus RTU on a local serial port, the EM22xx with RTU interface (feature W=7)
+
+    Needs the python lib 'pyserial'. The meters on the RS-485 line share
+    one object, their unit ids are the Modbus addresses set on the meters.
+
+    Usage:
+        bus = RtuTransport("/dev/ttyUSB0", baudrate=19200)
+        meters = [EnergyMIDEM22xx(bus, device_unit_id=unit) for unit in (1, 2, 3)]
+    """
+    def __init__(self, serial_port, baudrate = 19200, parity = 'E', stopbits = 1, bytesize = 8, \
+                 timeout = 1, retries = 3):
+        """Constructor of RtuTransport object
+        -----
+        Args:
+            serial_port: serial port, e.g. "/dev/ttyUSB0" or "COM3"
+            baudrate: baud rate set on the meters
+            parity: 'E', 'O' or 'N' as set on the meters
+            stopbits: stop bits as set on the meters
+            bytesize: data bits
+            timeout: timeout of one request in seconds
+            retries: retries of one request by pymodbus
+        """
+        super().__init__(timeout, retries)
+        self.serial_port = serial_port
+        self.baudrate = baudrate
+        self.parity = parity
+        self.stopbits = stopbits
+        self.bytesize = bytesize
+
+    @property
+    def bus(self) -> str:
+        return self.serial_port
+
+    def _serial_kwargs(self) -> dict:
+        """Arguments of the pymodbus serial clients"""
+        return {'framer': FramerType.RTU, 'baudrate': self.baudrate, 'parity': self.parity, \
+                'stopbits': self.stopbits, 'bytesize': self.bytesize, \
+                'timeout': self.timeout, 'retries': self.retries}
+
+    def create_client(self):
+        return ModbusSerialClient(self.serial_port, **self._serial_kwargs())
+
+    def create_async_client(self):
+        return AsyncModbusSerialClient(self.serial_port, **self._serial_kwargs())
+
+
+def bus_of(device) -> str:
+    """Bus label of a device tuple (ip, port, device_unit_id) or (transport, device_unit_id)"""
+    if isinstance(device[0], Transport):
+        return device[0].bus
+    return f'{device[0]}:{device[1]}'
@@ -0,0 +1,325 @@
+"""module providing a compact columnar time-series file for EM22xx raw snapshots"""
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import mmap
+import os
+import struct
+from .decoding import np, scale_array, UNDEFINED_S16
+from .snapshot import SNAPSHOT_FIELDS
+
+# file header: magic, version
+FILE_HEADER = struct.Struct('<8sH6x')
+MAGIC = b'EM22TS01'
+VERSION = 1
+
+# chunk header: magic, samples, first timestamp, voltage/current/power exponent,
+# energy factor, first energy import/export counter
+CHUNK_HEADER = struct.Struct('<4sId3bxIQQ8x')
+CHUNK_MAGIC = b'CHNK'
+
+# mantissa columns of a chunk in the order of the snapshot fields
+VOLTAGE_COLUMNS = slice(0, 8)
+CURRENT_COLUMNS = slice(8, 13)
+POWER_COLUMNS = slice(13, 17)
+MANTISSA_COLUMNS = 17
+
+# bytes per sample: timestamp delta (U32), mantissas (17 x S16), energy deltas (2 x U32)
+SAMPLE_SIZE = 4 + 2 * MANTISSA_COLUMNS + 8
+
+
+def padding(samples) -> int:
+    """Bytes appended to a chunk, so the next chunk starts 8-byte aligned"""
+    return -(SAMPLE_SIZE * samples) % 8
+
+
+def chunk_ends(buffer):
+    """Yield (offset, end) of the complete chunks of a file
+    -----
+    The end is computed from the sample count of the header, the scan
+    stops at the first chunk cut off by a crash while writing.
+
+    Args:
+        buffer: content of the file, e.g. the mapped file
+    """
+    offset = FILE_HEADER.size
+    while offset + CHUNK_HEADER.size <= len(buffer):
+        magic, samples = struct.unpack_from('<4sI', buffer, offset)
+        end = offset + CHUNK_HEADER.size + SAMPLE_SIZE * samples + padding(samples)
+        if magic != CHUNK_MAGIC or end > len(buffer):
+            return
+        yield offset, end
+        offset = end
+
+
+def zigzag_encode(deltas):
+    """Map signed 32-bit deltas to unsigned values, small magnitudes stay small"""
+    deltas = np.asarray(deltas, dtype=np.int64)
+    return ((deltas << 1) ^ (deltas >> 63)).astype('<u4')
+
+
+def zigzag_decode(values):
+    """Inverse of zigzag_encode"""
+    values = np.asarray(values, dtype=np.int64)
+    return (values >> 1) ^ -(values & 1)
+
+
+def encode_counters(counters):
+    """Zigzag encoded deltas of U32 counters, the first delta is 0
+    -----
+    The deltas are taken modulo 2^32, so a counter wrapping from
+    2^32-1 to 0 is a delta of +1:
+
+    >>> counters = [2**32 - 2, 2**32 - 1, 0, 1]
+    >>> decode_counters(counters[0], encode_counters(counters)).tolist() == counters
+    True
+
+    Args:
+        counters: array of U32 counters, the last axis is the time
+
+    Returns:
+        deltas: U32 array of the shape of counters
+    """
+    counters = np.asarray(counters, dtype=np.int64)
+    deltas = np.diff(counters, axis=-1, prepend=counters[..., :1])
+    # wrap into int32, the shortest way around the counter
+    return zigzag_encode((deltas + 2**31) % 2**32 - 2**31)
+
+
+def decode_counters(start, deltas):
+    """Inverse of encode_counters
+    -----
+    Args:
+        start: first counter value
+        deltas: zigzag encoded deltas
+
+    Returns:
+        counters: int64 array of U32 counters
+    """
+    return (start + np.cumsum(zigzag_decode(deltas), axis=-1)) & 0xFFFFFFFF
+
+
+class Chunk:
+    """Columns of one chunk, mapped from the file without copying
+
+    timestamp_deltas: U32 milliseconds since the previous sample
+    mantissas: S16 array of shape (17, samples)
+    energy_deltas: zigzag encoded U32 array of shape (2, samples)
+    """
+    def __init__(self, buffer, offset):
+        """Constructor of Chunk object
+        -----
+        Args:
+            buffer: mapped file
+            offset: offset of the chunk header
+        """
+        magic, samples, self.start, self.voltage_exponent, self.current_exponent, \
+            self.power_exponent, self.energy_factor, self.energy_import_start, \
+            self.energy_export_start = CHUNK_HEADER.unpack_from(buffer, offset)
+        if magic != CHUNK_MAGIC:
+            raise ValueError(f'no chunk at offset {offset}')
+        self.samples = samples
+        offset += CHUNK_HEADER.size
+        self.timestamp_deltas = np.frombuffer(buffer, '<u4', samples, offset)
+        offset += 4 * samples
+        self.energy_deltas = np.frombuffer(buffer, '<u4', 2 * samples, offset).reshape(2, samples)
+        offset += 8 * samples
+        self.mantissas = np.frombuffer(buffer, '<i2', MANTISSA_COLUMNS * samples, offset) \
+            .reshape(MANTISSA_COLUMNS, samples)
+        self.end = offset + 2 * MANTISSA_COLUMNS * samples + padding(samples)
+
+    @property
+    def timestamps(self):
+        """Timestamps in seconds since the epoch"""
+        return self.start + np.cumsum(self.timestamp_deltas, dtype=np.int64) / 1000
+
+    @property
+    def voltages(self):
+        """Voltages in V, one row per voltage of the snapshot"""
+        return scale_array(self.mantissas[VOLTAGE_COLUMNS], self.voltage_exponent, 1)
+
+    @property
+    def currents(self):
+        """Currents in A, one row per current of the snapshot"""
+        return scale_array(self.mantissas[CURRENT_COLUMNS], self.current_exponent, 2)
+
+    @property
+    def power(self):
+        """Power in W, one row per power of the snapshot"""
+        return scale_array(self.mantissas[POWER_COLUMNS], self.power_exponent, 2)
+
+    def _energy(self, row, start):
+        """Energy counter in kWh from the zigzag encoded deltas"""
+        return decode_counters(start, self.energy_deltas[row]) * self.energy_factor / 1000
+
+    @property
+    def energy_import(self):
+        """Energy import total in kWh"""
+        return self._energy(0, self.energy_import_start)
+
+    @property
+    def energy_export(self):
+        """Energy export total in kWh"""
+        return self._energy(1, self.energy_export_start)
+
+    def columns(self):
+        """Scaled values of all snapshot fields as a 2D array, one row per field"""
+        return np.vstack((self.timestamps, self.voltages, self.currents, self.power, \
+                          self.energy_import, self.energy_export))
+
+
+class TimeSeriesWriter:
+    """Writer of the compact columnar time-series file
+
+    Samples are collected into chunks of up to chunk_size samples.
+    A chunk stores the exponents and the energy factor once, the
+    timestamps as millisecond deltas and the energy counters as
+    zigzag encoded deltas, so a sample needs 46 bytes on disk instead of
+    a MariaDB row of 20 values plus index and row overhead.
+    A new chunk is started when an exponent or the energy factor changes.
+
+    Usage:
+        with TimeSeriesWriter("/var/lib/em22xx/meter1.emts") as ts_writer:
+            ts_writer.append(em2289_obj.read_raw_snapshot())
+    """
+    def __init__(self, path, chunk_size = 3600):
+        """Constructor of TimeSeriesWriter object
+        -----
+        Args:
+            path: path of the file, samples are appended to an existing file
+            chunk_size: max. number of samples per chunk
+        """
+        if np is None:
+            raise ImportError('TimeSeriesWriter requires numpy')
+        self._chunk_size = chunk_size
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, version = FILE_HEADER.unpack(self._file.read(FILE_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{path} is not a compatible time-series file')
+            # drop a chunk cut off by a crash, appended chunks could not be read behind it
+            with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                end = FILE_HEADER.size
+                for _, end in chunk_ends(buffer):
+                    pass
+            self._file.truncate(end)
+            self._file.seek(end)
+        else:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._samples = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, raw):
+        """Append one sample
+        -----
+        Args:
+            raw: RawSnapshot object
+        """
+        if self._samples:
+            first = self._samples[0]
+            if first[1:5] != raw[1:5] or len(self._samples) >= self._chunk_size \
+               or raw.timestamp < self._samples[-1].timestamp:
+                self.flush()
+        self._samples.append(raw)
+
+    def flush(self):
+        """Write the collected samples as one chunk
+        -----
+        """
+        if not self._samples:
+            return
+        samples = self._samples
+        self._samples = []
+        first = samples[0]
+        timestamps = np.array([raw.timestamp for raw in samples])
+        milliseconds = np.round((timestamps - first.timestamp) * 1000).astype(np.int64)
+        timestamp_deltas = np.diff(milliseconds, prepend=0).astype('<u4')
+        counters = np.array([(raw.energy_import_total, raw.energy_export_total) for raw in samples], \
+                            dtype=np.int64).T
+        energy_deltas = encode_counters(counters)
+        mantissas = np.array([_mantissas(raw) for raw in samples], dtype='<i2').T
+        self._file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, len(samples), first.timestamp, \
+                                           first.voltage_exponent or 0, first.current_exponent or 0, \
+                                           first.power_exponent or 0, first.energy_factor, \
+                                           first.energy_import_total, first.energy_export_total))
+        self._file.write(timestamp_deltas.tobytes())
+        self._file.write(energy_deltas.tobytes())
+        self._file.write(np.ascontiguousarray(mantissas).tobytes())
+        self._file.write(bytes(padding(len(samples))))
+        self._file.flush()
+
+    def close(self):
+        """Write the pending samples and close the file
+        -----
+        """
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def _mantissas(raw) -> tuple:
+    """The 17 mantissas of a sample, groups not measured by the meter are undefined (read as NaN)"""
+    return (raw.voltages or (UNDEFINED_S16,) * 8) + (raw.currents or (UNDEFINED_S16,) * 5) \
+        + (raw.power or (UNDEFINED_S16,) * 4)
+
+
+class TimeSeriesReader:
+    """Memory-mapped reader of the compact columnar time-series file
+
+    Usage:
+        with TimeSeriesReader("/var/lib/em22xx/meter1.emts") as ts_reader:
+            columns = ts_reader.read()
+            print(columns['p_tot'].mean())
+    """
+    def __init__(self, path):
+        """Constructor of TimeSeriesReader object
+        -----
+        Args:
+            path: path of the file
+        """
+        if np is None:
+            raise ImportError('TimeSeriesReader requires numpy')
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = FILE_HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a compatible time-series file')
+        # a chunk cut off by a crash while writing is skipped
+        self.chunks = [Chunk(self._mmap, offset) for offset, _ in chunk_ends(self._mmap)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return sum(chunk.samples for chunk in self.chunks)
+
+    def read(self) -> dict:
+        """Read all samples
+        -----
+        Returns:
+            columns: dict of numpy arrays by snapshot field name, see snapshot.SNAPSHOT_FIELDS
+        """
+        if not self.chunks:
+            return {field: np.empty(0) for field in SNAPSHOT_FIELDS}
+        values = np.hstack([chunk.columns() for chunk in self.chunks])
+        return dict(zip(SNAPSHOT_FIELDS, values))
+
+    def close(self):
+        """Close the mapped file
+        -----
+        """
+        self.chunks = []
+        try:
+            self._mmap.close()
+        except BufferError:
+            # arrays returned by read() still use the mapping, it is closed with them
+            pass
@@ -23,7 +23,7 @@ if __name__ == "__main__":
     tablecolumns_u = "`U12`, `U23`, `U31`, `mean_U12_23_31`, `U1N`, `U2N`, `U3N`, `mean_U123`"
     tablecolumns_i = "`I1`, `I2`, `I3`, `IN`"
     tablecolumns_p = "`P1`, `P2`, `P3`, `Ptot`"
-    tablecolumns = tablecolumns_u + tablecolumns_i + tablecolumns_p
+    tablecolumns = ", ".join((tablecolumns_u, tablecolumns_i, tablecolumns_p))
     print(tablecolumns)
 
     maria_obj = maria_db(MARIA_DB_CONFIG)
@@ -1,27 +1,54 @@
 """module for connecting and insert into mariaDB database"""
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import threading
 import mysql.connector
+import mysql.connector.pooling
 from mysql.connector import errorcode
 
+# errors after which a batch is retried on a fresh connection
+RECONNECTABLE_ERRORS = (errorcode.CR_SERVER_GONE_ERROR, errorcode.CR_SERVER_LOST, \
+                        errorcode.CR_CONN_HOST_ERROR, errorcode.CR_CONNECTION_ERROR)
+# errors of the statement or its data, a batch failing with them fails again on every retry
+PERMANENT_ERRORS = (mysql.connector.ProgrammingError, mysql.connector.DataError, \
+                    mysql.connector.IntegrityError, mysql.connector.NotSupportedError)
+
 class MariaDBMysql:
     """Class connecting MariaDB Database"""
 
-    def __init__(self, config):
+    def __init__(self, config, pool_size = None, pool_name = "em22xx", retries = 1):
         """Contructor of cMariaDB_mysql class 
         -----
 
         Args:
             config: configuration for mariaDB access
+            pool_size: number of pooled connections (None: one shared connection)
+            pool_name: name of the connection pool
+            retries: retries of a batch after a reconnectable error
         """
         self._config = config
-        # call connect to have the connection object inside
-        self.connector = self.connect()
+        self._retries = retries
+        self._pool = None
+        self._pool_size = pool_size
+        self._pool_name = pool_name
+        self._pool_slots = None
+        self._lock = threading.Lock()
+        # error of the last batch per thread, the pooled object is shared by several writers
+        self._local = threading.local()
+        if pool_size:
+            # the pool is created on first use, so an unreachable database does not raise here
+            # block instead of failing when all pooled connections are checked out
+            self._pool_slots = threading.BoundedSemaphore(pool_size)
+            self.connector = None
+        else:
+            # call connect to have the connection object inside
+            self.connector = self.connect()
 
     def __del__(self):
         #destoy the connector object
         #print("Call destructor")
-        self.connector.close()
+        if getattr(self, "connector", None):
+            self.connector.close()
 
     def connect(self):
         """Method to establish connection to database
@@ -50,6 +77,21 @@ class MariaDBMysql:
             #print("Connection: successfully established!")
             return connector_obj
 
+    @property
+    def last_error(self):
+        """mysql.connector.Error of the last failed batch of the calling thread
+        -----
+        None after a successful batch or when no connection was available.
+        """
+        return getattr(self._local, "last_error", None)
+
+    @staticmethod
+    def is_permanent(error) -> bool:
+        """Check if an error is caused by the statement or its data, e.g. a syntax or data error,
+        so the batch fails again on every retry
+        """
+        return isinstance(error, PERMANENT_ERRORS)
+
     def insert_by_stored_procedure(self, prodedure_name, arguments) -> bool:
         """Insert data into mariaDB by calling a strored procedure
         -----
@@ -61,20 +103,7 @@ class MariaDBMysql:
         Returns:
             True when successful or False when failed
         """
-        try:
-            cursor = self.connector.cursor()
-            cursor.callproc(prodedure_name, arguments)
-            self.connector.commit()
-        except mysql.connector.Error as err:
-            if err.errno == errorcode.ER_PARSE_ERROR:
-                print(f"ERROR: Syntax! ({err.errno})")
-                return False
-            else:
-                print(f"ERROR: {err.errno}")
-                return False
-        else:
-            cursor.close()
-            return True
+        return self._execute_batch(lambda cursor: cursor.callproc(prodedure_name, arguments))
 
     def insert_by_sql_insert_stmt(self, table, columns, values) -> bool:
         """Insert data into mariaDB by insert statement
@@ -82,26 +111,168 @@ class MariaDBMysql:
 
         Args:
             table: string 
-            columns: tuple 
+            columns: tuple of column names or comma separated string
             values: tuple
 
         Returns:
             True when successful or False when failed
         """
-        try:
-            cursor = self.connector.cursor()
-            # INSERT INTO `waermepumpe`.`energie` (E_import_tot, E_export_tot) VALUES(20.9, 31.4)
-            query_str = f"INSERT INTO `{self._config['database']}`.`{table}` ({columns}) VALUES({str(values)})"
-            #print(query_str)
-            cursor.execute(query_str)
-            self.connector.commit()
-        except mysql.connector.Error as err:
-            if err.errno == errorcode.ER_PARSE_ERROR:
-                print(f"ERROR: Syntax! ({err.errno})")
+        # INSERT INTO `waermepumpe`.`energie` (`E_import_tot`, `E_export_tot`) VALUES (%s, %s)
+        if isinstance(columns, str):
+            columns = columns.split(",")
+        values = tuple(values) if isinstance(values, (list, tuple)) else (values,)
+        return self.insert_many(table, columns, [values])
+
+    def insert_many(self, table, columns, rows) -> bool:
+        """Insert several rows into mariaDB with one parameterized statement
+        -----
+        All rows are sent with executemany and committed once.
+
+        Args:
+            table: string
+            columns: tuple of column names
+            rows: list of tuples of values
+
+        Returns:
+            True when successful or False when failed
+        """
+        columns_str = ", ".join(quote_identifier(column) for column in columns)
+        placeholders = ", ".join(["%s"] * len(columns))
+        query_str = f"INSERT INTO {quote_identifier(self._config['database'])}.{quote_identifier(table)} " \
+                    f"({columns_str}) VALUES ({placeholders})"
+        return self._execute_batch(lambda cursor: cursor.executemany(query_str, rows))
+
+    def call_procedure_many(self, prodedure_name, rows) -> bool:
+        """Call a stored procedure for several rows and commit once
+        -----
+        Args:
+            procedure_name: name of the stored procedure function
+            rows: list of function parameters for the stored procedure
+
+        Returns:
+            True when successful or False when failed
+        """
+        def _call(cursor):
+            for arguments in rows:
+                cursor.callproc(prodedure_name, arguments)
+        return self._execute_batch(_call)
+
+    def _checkout(self):
+        """Return a healthy connection, reconnect if necessary
+        -----
+        Returns:
+            MySQLConnection object or False
+        """
+        if self._pool_size:
+            if not self._create_pool():
                 return False
-            else:
+            self._pool_slots.acquire()
+            try:
+                connection = self._pool.get_connection()
+            except mysql.connector.Error as err:
+                self._pool_slots.release()
                 print(f"ERROR: {err.errno}")
                 return False
-        else:
-            cursor.close()
+            try:
+                # health check on checkout
+                connection.ping(reconnect=True, attempts=1)
+            except mysql.connector.Error as err:
+                # give the connection back, the pool reconnects it on the next checkout
+                self._release(connection)
+                print(f"ERROR: {err.errno}")
+                return False
+            return connection
+        # the shared connection is used by one writer at a time
+        self._lock.acquire()
+        try:
+            if self.connector and not self.connector.is_connected():
+                self.connector.reconnect(attempts=1)
+        except mysql.connector.Error:
+            self.connector = False
+        if not self.connector:
+            self.connector = self.connect()
+        if not self.connector:
+            self._lock.release()
+        return self.connector
+
+    def _create_pool(self) -> bool:
+        """Create the connection pool on first use
+        -----
+        Returns:
+            True when the pool exists or False when the database is not reachable
+        """
+        with self._lock:
+            if self._pool is not None:
+                return True
+            try:
+                self._pool = mysql.connector.pooling.MySQLConnectionPool(pool_name=self._pool_name, \
+                                                                          pool_size=self._pool_size, **self._config)
+            except mysql.connector.Error as err:
+                print(f"ERROR: connection pool ({err.errno})")
+                return False
             return True
+
+    def _release(self, connection):
+        """Give a connection back after use"""
+        if self._pool_size:
+            try:
+                # closing a pooled connection returns it to the pool, even when its session is broken
+                connection.close()
+            except mysql.connector.Error:
+                pass
+            finally:
+                self._pool_slots.release()
+        else:
+            self._lock.release()
+
+    def _execute_batch(self, statement) -> bool:
+        """Run a statement on a cursor and commit, roll back on failure
+        -----
+        A batch failing with a reconnectable error is retried on a fresh connection.
+
+        Args:
+            statement: function called with the cursor
+
+        Returns:
+            True when successful or False when failed
+        """
+        self._local.last_error = None
+        for attempt in range(self._retries + 1):
+            connection = self._checkout()
+            if not connection:
+                return False
+            try:
+                cursor = connection.cursor()
+                statement(cursor)
+                connection.commit()
+            except mysql.connector.Error as err:
+                self._local.last_error = err
+                try:
+                    connection.rollback()
+                except mysql.connector.Error:
+                    pass
+                if err.errno in RECONNECTABLE_ERRORS and attempt < self._retries:
+                    continue
+                if err.errno == errorcode.ER_PARSE_ERROR:
+                    print(f"ERROR: Syntax! ({err.errno})")
+                else:
+                    print(f"ERROR: {err.errno}")
+                return False
+            else:
+                cursor.close()
+                self._local.last_error = None
+                return True
+            finally:
+                self._release(connection)
+        return False
+
+
+def quote_identifier(name) -> str:
+    """Quote a table or column name with backticks if not yet quoted"""
+    name = name.strip()
+    if name.startswith("`") and name.endswith("`"):
+        return name
+    return "`" + name.replace("`", "``") + "`"
+
+
+from .buffered_writer import BufferedWriter
@@ -0,0 +1,182 @@
+"""module for buffered batch inserts into mariaDB"""
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+
+class BufferedWriter:
+    """Buffer rows and insert them in batches into mariaDB
+
+    Rows are flushed with one parameterized executemany and one commit
+    when max_rows are buffered or the oldest row is max_age seconds old.
+    After a failed flush the rows stay buffered and no flush is
+    triggered for max_age seconds. While the database fails, at most
+    max_pending rows are kept, the oldest rows are dropped beyond.
+    A batch rejected for its statement or data (e.g. a syntax or data
+    error) would fail on every retry, it is logged and dropped.
+    The database is written outside of the buffer lock, so write()
+    does not wait for a running flush.
+
+    Usage:
+        writer = BufferedWriter(maria_obj, "leistung", Snapshot.COLUMNS)
+        writer.write(snapshot.as_row())
+        ...
+        writer.close()
+    """
+    def __init__(self, database, table, columns, max_rows = 500, max_age = 5.0, \
+                 procedure = None, max_pending = None, autoflush = True, instrumentation = None):
+        """Constructor of BufferedWriter class
+        -----
+
+        Args:
+            database: MariaDBMysql object
+            table: table to insert into (ignored when procedure is given)
+            columns: tuple of column names
+            max_rows: number of buffered rows triggering a flush
+            max_age: age of the oldest buffered row in seconds triggering a flush
+            procedure: name of a stored procedure used instead of INSERT
+            max_pending: max. rows kept while the database fails, oldest are dropped
+                         (default: 10 * max_rows)
+            autoflush: flush by age from a background thread
+            instrumentation: object with on_flush(sink, rows, duration, success),
+                             e.g. energymid_em22xx.instrumentation.HistogramExporter
+        """
+        self._database = database
+        self._table = table
+        self._columns = tuple(columns)
+        self._max_rows = max_rows
+        self._max_age = max_age
+        self._procedure = procedure
+        self._max_pending = max_pending if max_pending is not None else 10 * max_rows
+        self._instrumentation = instrumentation
+        self._rows = []
+        self._oldest = None
+        # no triggered flush before this time after a failure (0.0: no failure)
+        self._retry_at = 0.0
+        self._lock = threading.RLock()
+        # one flush at a time, keeps the batches in order
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.flushed_rows = 0
+        self.dropped_rows = 0
+        self.rejected_rows = 0
+        self._thread = None
+        if autoflush:
+            self._thread = threading.Thread(target=self._autoflush, name='mariadb-flush', daemon=True)
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, row) -> bool:
+        """Buffer one row, flush if the batch is full or too old
+        -----
+        Returns:
+            False when a triggered flush failed or the database is failing, otherwise True
+        """
+        with self._lock:
+            if not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.append(tuple(row))
+            if len(self._rows) > self._max_pending:
+                self._drop(len(self._rows) - self._max_pending)
+            due = self._is_due()
+            if not due:
+                return self._retry_at == 0.0
+        return self._flush(wait=False)
+
+    def write_many(self, rows) -> bool:
+        """Buffer several rows, see write()"""
+        result = True
+        for row in rows:
+            result = self.write(row) and result
+        return result
+
+    def _is_due(self) -> bool:
+        """Check if the batch is full or the oldest buffered row reached max_age, not before a retry is due"""
+        if not self._rows:
+            return False
+        now = time.monotonic()
+        if now < self._retry_at:
+            return False
+        return len(self._rows) >= self._max_rows or now - self._oldest >= self._max_age
+
+    def _drop(self, count):
+        """Drop the oldest count buffered rows"""
+        print(f"WARNING: dropped {count} rows, database not writable!")
+        self.dropped_rows += count
+        del self._rows[:count]
+
+    def flush(self) -> bool:
+        """Insert all buffered rows as one batch
+        -----
+        On failure the rows stay buffered for the next flush, a batch
+        rejected for its statement or data is dropped.
+
+        Returns:
+            True when successful or False when failed
+        """
+        return self._flush(wait=True)
+
+    def _flush(self, wait) -> bool:
+        """Insert all buffered rows, without wait return True if another flush is running"""
+        if not self._flush_lock.acquire(blocking=wait):
+            return True
+        try:
+            with self._lock:
+                if not self._rows:
+                    return True
+                rows = self._rows
+                oldest = self._oldest
+                self._rows = []
+                self._oldest = None
+            start = time.perf_counter()
+            if self._procedure is not None:
+                success = self._database.call_procedure_many(self._procedure, rows)
+            else:
+                success = self._database.insert_many(self._table, self._columns, rows)
+            if self._instrumentation is not None:
+                self._instrumentation.on_flush(self._procedure or self._table, len(rows), \
+                                               time.perf_counter() - start, success)
+            error = self._database.last_error
+            with self._lock:
+                if success:
+                    self.flushed_rows += len(rows)
+                    self._retry_at = 0.0
+                elif error is not None and self._database.is_permanent(error):
+                    print(f"ERROR: dropped batch of {len(rows)} rows, rejected by the database ({error})")
+                    self.rejected_rows += len(rows)
+                    self._retry_at = 0.0
+                else:
+                    # keep the rows in front of the ones written meanwhile
+                    self._rows = rows + self._rows
+                    self._oldest = oldest
+                    if len(self._rows) > self._max_pending:
+                        self._drop(len(self._rows) - self._max_pending)
+                    # retry after max_age instead of on every write
+                    self._retry_at = time.monotonic() + self._max_age
+            return success
+        finally:
+            self._flush_lock.release()
+
+    def _autoflush(self):
+        """Background thread flushing rows which reached max_age"""
+        while not self._stop.wait(self._max_age / 2):
+            with self._lock:
+                due = self._is_due()
+            if due:
+                self._flush(wait=False)
+
+    def close(self):
+        """Stop the background thread and flush the remaining rows
+        -----
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()